@@ -0,0 +1,214 @@
+# admission.py
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Any, AsyncIterator, Deque, Dict, Tuple
+
+from fastapi import HTTPException
+
+import metrics
+import sharding
+
+# =========================================================
+# Config
+# =========================================================
+# Control de admisión de los endpoints que acaban en la consulta cara del Core API
+# (JOIN de entrenos en MySQL). Con 0, sin límites
+ADMISSION_ENABLED = os.getenv("ANALYTICS_ADMISSION", "1") == "1"
+# Rangos de más de N días cuentan como largos y ocupan LONG_RANGE_WEIGHT unidades del límite
+# (o una por consulta al Core API si son más)
+ADMISSION_LONG_RANGE_DAYS = int(os.getenv("ANALYTICS_ADMISSION_LONG_RANGE_DAYS", "92"))
+ADMISSION_LONG_RANGE_WEIGHT = int(os.getenv("ANALYTICS_ADMISSION_LONG_RANGE_WEIGHT", "4"))
+# Código de las peticiones rechazadas (503 por defecto; 429 si se prefiere que el cliente se frene)
+ADMISSION_REJECT_STATUS = int(os.getenv("ANALYTICS_ADMISSION_REJECT_STATUS", "503"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ANALYTICS_ADMISSION_RETRY_AFTER", "2"))
+
+QUEUE_FULL = "queue_full"
+TIMEOUT = "timeout"
+
+
+class WeightedLimiter:
+    """
+    Semáforo con pesos y cola FIFO acotada: cada petición ocupa `weight` unidades de `limit`.
+    Si no hay hueco espera en cola (como mucho `queue_max` peticiones y `timeout` segundos);
+    si la cola está llena o la espera caduca se rechaza en el acto con Retry-After.
+    La cola es estricta (nadie adelanta al primero), así un rango largo no se queda sin turno.
+    """
+
+    def __init__(self, name: str, limit: int, queue_max: int, timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_max = queue_max
+        self.timeout = timeout
+        self.in_use = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+        self.admitted = 0
+        self.rejected = {QUEUE_FULL: 0, TIMEOUT: 0}
+
+    @property
+    def enabled(self) -> bool:
+        return ADMISSION_ENABLED and self.limit > 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _publish(self) -> None:
+        metrics.admission_state(self.name, self.in_use, len(self._waiters))
+
+    def _grant(self, weight: int) -> None:
+        self.in_use += weight
+        self.admitted += 1
+
+    def _reject(self, reason: str) -> HTTPException:
+        self.rejected[reason] += 1
+        metrics.admission_rejected(self.name, reason)
+        detail = (
+            "Servicio saturado: demasiadas peticiones en espera"
+            if reason == QUEUE_FULL
+            else "Servicio saturado: tiempo de espera agotado"
+        )
+        return HTTPException(
+            status_code=ADMISSION_REJECT_STATUS,
+            detail=detail,
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)},
+        )
+
+    def _wake(self) -> None:
+        """Da paso a las peticiones en cabeza de la cola mientras quepan."""
+        while self._waiters:
+            weight, fut = self._waiters[0]
+            if fut.done():
+                self._waiters.popleft()
+                continue
+            if self.in_use + weight > self.limit:
+                break
+            self._waiters.popleft()
+            self._grant(weight)
+            fut.set_result(None)
+
+    def _abandon(self, entry: Tuple[int, asyncio.Future]) -> None:
+        """Una petición deja la cola (caducada o cancelada); si ya tenía turno, lo devuelve."""
+        weight, fut = entry
+        if fut.done() and not fut.cancelled():
+            self.in_use -= weight
+        else:
+            fut.cancel()
+            try:
+                self._waiters.remove(entry)
+            except ValueError:
+                pass
+        self._wake()
+        self._publish()
+
+    async def acquire(self, weight: int) -> int:
+        """Espera turno y devuelve el peso ocupado (a devolver con release)."""
+        weight = max(1, min(weight, self.limit))
+        if not self._waiters and self.in_use + weight <= self.limit:
+            self._grant(weight)
+            self._publish()
+            metrics.admission_wait(self.name, 0.0)
+            return weight
+
+        if len(self._waiters) >= self.queue_max:
+            raise self._reject(QUEUE_FULL)
+
+        entry = (weight, asyncio.get_running_loop().create_future())
+        self._waiters.append(entry)
+        self._publish()
+        t0 = time.perf_counter()
+        try:
+            done, _ = await asyncio.wait((entry[1],), timeout=self.timeout)
+        except asyncio.CancelledError:
+            self._abandon(entry)
+            raise
+        if not done:
+            self._abandon(entry)
+            raise self._reject(TIMEOUT)
+
+        self._publish()
+        metrics.admission_wait(self.name, time.perf_counter() - t0)
+        return weight
+
+    def release(self, weight: int) -> None:
+        self.in_use -= weight
+        self._wake()
+        self._publish()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.name,
+            "enabled": self.enabled,
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "queued": len(self._waiters),
+            "queue_max": self.queue_max,
+            "timeout_seconds": self.timeout,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected[QUEUE_FULL],
+            "rejected_timeout": self.rejected[TIMEOUT],
+        }
+
+
+def _limiter(name: str, limit: int, queue_max: int, timeout: float) -> WeightedLimiter:
+    """Límite de un endpoint, configurable con ANALYTICS_ADMISSION_<NAME>_{LIMIT,QUEUE,TIMEOUT}."""
+    prefix = f"ANALYTICS_ADMISSION_{name.upper()}"
+    return WeightedLimiter(
+        name,
+        int(os.getenv(f"{prefix}_LIMIT", str(limit))),
+        int(os.getenv(f"{prefix}_QUEUE", str(queue_max))),
+        float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+    )
+
+
+# Límites por endpoint (en unidades de peso: un rango corto = 1)
+LIMITERS: Dict[str, WeightedLimiter] = {
+    limiter.name: limiter
+    for limiter in (
+        _limiter("summary", 8, 32, 5.0),
+        _limiter("batch", 4, 16, 10.0),
+        _limiter("rebuild", 4, 16, 10.0),
+        _limiter("distribution", 4, 16, 10.0),
+        _limiter("index", 4, 16, 10.0),
+    )
+}
+
+
+def range_weight(from_date: str, to_date: str) -> int:
+    """
+    Peso de un rango: 1 si es corto; si supera ADMISSION_LONG_RANGE_DAYS, el mayor entre
+    ADMISSION_LONG_RANGE_WEIGHT y sus trozos (consultas al Core API, ver sharding.plan).
+    El limitador lo acota a su límite: el rango más largo ocupa el endpoint entero.
+    """
+    days = (date.fromisoformat(to_date) - date.fromisoformat(from_date)).days + 1
+    if days <= ADMISSION_LONG_RANGE_DAYS:
+        return 1
+    return max(ADMISSION_LONG_RANGE_WEIGHT, sharding.shard_count(from_date, to_date))
+
+
+@asynccontextmanager
+async def admit(endpoint: str, weight: int = 1) -> AsyncIterator[None]:
+    """`async with admission.admit("summary", peso): ...` — ejecuta el bloque con turno del endpoint."""
+    limiter = LIMITERS[endpoint]
+    if not limiter.enabled:
+        yield
+        return
+
+    taken = await limiter.acquire(weight)
+    try:
+        yield
+    finally:
+        limiter.release(taken)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "long_range_days": ADMISSION_LONG_RANGE_DAYS,
+        "long_range_weight": ADMISSION_LONG_RANGE_WEIGHT,
+        "endpoints": [limiter.stats() for limiter in LIMITERS.values()],
+    }
@@ -0,0 +1,350 @@
+# aggregation.py
+import bisect
+import hashlib
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import aggregation_columnar as columnar
+from sketches import CardinalitySketch, QuantileSketch
+
+# Percentiles de las distribuciones de peso y reps
+PERCENTILES = (50, 75, 90, 95, 99)
+# Intensidad de una serie = peso / peso máximo del ejercicio en el rango
+INTENSITY_EDGES = (0.5, 0.6, 0.7, 0.8, 0.9)
+INTENSITY_LABELS = ("<50%", "50-60%", "60-70%", "70-80%", "80-90%", "90-100%")
+# Zonas de repeticiones (fuerza / hipertrofia / resistencia)
+REPS_ZONES = ((1, 5, "1-5"), (6, 12, "6-12"), (13, None, "13+"))
+
+# Sketches de un ejercicio en un día: (peso, reps)
+ExerciseSketches = Tuple[QuantileSketch, QuantileSketch]
+
+
+class DayPartial:
+    """
+    Agregado parcial de un único día (mergeable).
+    Un resumen de rango es siempre la mezcla, en orden de fecha, de los parciales de sus días;
+    así da igual si los días salen de una sola consulta, de varias o del almacén en MongoDB.
+    """
+
+    __slots__ = ("sets", "reps", "volume", "workouts", "exercises", "by_exercise", "ex_stats", "dist", "distinct")
+
+    def __init__(self) -> None:
+        self.sets = 0
+        self.reps = 0
+        self.volume = 0.0
+        self.workouts = set()
+        self.exercises = set()
+        self.by_exercise: Dict[str, float] = {}
+        # Por ejercicio: [series, reps, peso máximo, mejor serie (reps * peso)]
+        self.ex_stats: Dict[str, List[float]] = {}
+        # Por ejercicio: sketches de percentiles de peso y reps de sus series
+        self.dist: Dict[str, ExerciseSketches] = {}
+        # Nombres de ejercicio distintos con series (HyperLogLog)
+        self.distinct = CardinalitySketch()
+
+    def merge(self, other: "DayPartial") -> None:
+        """Suma en este parcial otro parcial del mismo día."""
+        self.sets += other.sets
+        self.reps += other.reps
+        self.volume += other.volume
+        self.workouts |= other.workouts
+        self.exercises |= other.exercises
+        for name, vol in other.by_exercise.items():
+            self.by_exercise[name] = self.by_exercise.get(name, 0.0) + vol
+        for name, stats in other.ex_stats.items():
+            merge_ex_stats(self.ex_stats, name, stats)
+        for name, (weights, reps) in other.dist.items():
+            sketches = exercise_sketches(self, name)
+            sketches[0].merge(weights)
+            sketches[1].merge(reps)
+        self.distinct.merge(other.distinct)
+
+
+def exercise_sketches(p: DayPartial, name: str) -> ExerciseSketches:
+    """Sketches (peso, reps) del ejercicio en el parcial, creándolos si no existen."""
+    sketches = p.dist.get(name)
+    if sketches is None:
+        sketches = p.dist[name] = (QuantileSketch(), QuantileSketch())
+        p.distinct.add(name)
+    return sketches
+
+
+def merge_ex_stats(ex_stats: Dict[str, List[float]], name: str, stats: Sequence[float]) -> None:
+    current = ex_stats.get(name)
+    if current is None:
+        ex_stats[name] = list(stats)
+        return
+    current[0] += stats[0]
+    current[1] += stats[1]
+    if stats[2] > current[2]:
+        current[2] = stats[2]
+    if stats[3] > current[3]:
+        current[3] = stats[3]
+
+
+class SummaryAccumulator:
+    """
+    Agregador incremental de filas del Core API.
+    Consume filas de una en una (o por lotes) y mantiene solo los parciales por día,
+    de modo que la memoria no depende del número de filas del rango.
+    """
+
+    __slots__ = ("days",)
+
+    def __init__(self) -> None:
+        self.days: Dict[str, DayPartial] = {}
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self.add_rows((row,))
+
+    def add_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        # Lotes grandes: motor columnar (mismo resultado, operaciones vectorizadas)
+        if (
+            columnar.enabled()
+            and isinstance(rows, (list, tuple))
+            and len(rows) >= columnar.COLUMNAR_MIN_ROWS
+        ):
+            cols = columnar.RowColumns.from_rows(rows)
+            if cols is not None:
+                columnar.accumulate_columns(cols, self.days)
+                return
+
+        self.add_python(rows)
+
+    def add_python(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Motor por filas (referencia): un bucle Python con la lógica original."""
+        days = self.days
+        day_key = None
+        p = None
+        # Series por (día, ejercicio, peso, reps): se vuelcan a los sketches al final, una vez por valor
+        profile: Dict[Tuple[str, str, float, int], int] = {}
+
+        for r in rows:
+            day = str(r.get("workout_date", ""))[:10]
+            if day != day_key:
+                p = days.get(day)
+                if p is None:
+                    p = days[day] = DayPartial()
+                day_key = day
+
+            workout_id = r.get("workout_id")
+            exercise_id = r.get("exercise_id")
+
+            if workout_id is not None:
+                p.workouts.add(workout_id)
+            if exercise_id is not None:
+                p.exercises.add(exercise_id)
+
+            if r.get("set_id") is None:
+                continue
+
+            reps = r.get("reps") or 0
+            try:
+                weight = float(r.get("weight_kg") or 0)
+            except Exception:
+                weight = 0.0
+
+            volume = reps * weight
+
+            p.sets += 1
+            p.reps += reps
+            p.volume += volume
+
+            ex_name = r.get("exercise_name") or (
+                f"exercise_{exercise_id}" if exercise_id is not None else "unknown_exercise"
+            )
+            p.by_exercise[ex_name] = p.by_exercise.get(ex_name, 0.0) + volume
+
+            stats = p.ex_stats.get(ex_name)
+            if stats is None:
+                p.ex_stats[ex_name] = [1, reps, weight, volume]
+            else:
+                stats[0] += 1
+                stats[1] += reps
+                if weight > stats[2]:
+                    stats[2] = weight
+                if volume > stats[3]:
+                    stats[3] = volume
+
+            key = (day, ex_name, weight, reps)
+            profile[key] = profile.get(key, 0) + 1
+
+        for (day, ex_name, weight, reps), n in profile.items():
+            sketches = exercise_sketches(days[day], ex_name)
+            sketches[0].add(weight, n)
+            sketches[1].add(reps, n)
+
+    def result(self, from_date: str, to_date: str) -> Dict[str, Any]:
+        """Devuelve el resumen con la forma de AnalyticsSummaryResponse."""
+        return summarize_partials(from_date, to_date, self.days)
+
+
+def summarize_partials(
+    from_date: str, to_date: str, partials: Mapping[str, DayPartial]
+) -> Dict[str, Any]:
+    """Mezcla parciales diarios (en orden de fecha) y construye el resumen del rango."""
+    workouts = set()
+    exercises = set()
+
+    sets_count = 0
+    total_reps = 0
+    total_volume = 0.0
+
+    by_day = []
+    volume_by_exercise = defaultdict(float)
+
+    for day in sorted(partials):
+        p = partials[day]
+
+        workouts |= p.workouts
+        exercises |= p.exercises
+
+        sets_count += p.sets
+        total_reps += p.reps
+        total_volume += p.volume
+
+        # Filas sin fecha cuentan en los totales pero no en by_day
+        if day and p.sets:
+            by_day.append({"date": day, "volume": round(p.volume, 2)})
+
+        for ex_name, volume in p.by_exercise.items():
+            volume_by_exercise[ex_name] += volume
+
+    return {
+        "from": from_date,
+        "to": to_date,
+        "summary": {
+            "workouts": len(workouts),
+            "exercises": len(exercises),
+            "sets": sets_count,
+            "total_reps": total_reps,
+            "total_volume": round(total_volume, 2),
+        },
+        "by_day": by_day,
+        "by_exercise": [
+            {"exercise": e, "volume": round(v, 2)}
+            for e, v in sorted(volume_by_exercise.items(), key=lambda x: -x[1])
+        ],
+    }
+
+
+def fingerprint_partials(
+    from_date: str, to_date: str, partials: Mapping[str, DayPartial]
+) -> str:
+    """
+    Huella (sha256) de los datos de un rango: cambia si cambia cualquier fila que afecte al
+    resumen. Se calcula sobre los parciales diarios, así no hace falta construir ni serializar
+    la respuesta para saber si es la misma. Los días vacíos no cuentan: da igual que un día
+    sin entrenos tenga parcial (pedido al Core API) o no (p.ej. días futuros, que no se piden).
+    """
+    h = hashlib.sha256(f"{from_date}|{to_date}".encode("utf-8"))
+    for day in sorted(partials):
+        p = partials[day]
+        if not (p.sets or p.workouts or p.exercises):
+            continue
+        h.update(repr((
+            day,
+            sorted(p.workouts, key=repr),
+            sorted(p.exercises, key=repr),
+            p.sets,
+            p.reps,
+            p.volume,
+            sorted(p.by_exercise.items()),
+        )).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _percentiles(sketch: QuantileSketch, as_int: bool = False) -> Dict[str, Optional[float]]:
+    values = sketch.quantiles(p / 100 for p in PERCENTILES)
+    return {
+        f"p{p}": None if v is None else (int(round(v)) if as_int else round(v, 2))
+        for p, v in zip(PERCENTILES, values)
+    }
+
+
+def _intensity(weights: QuantileSketch, max_weight: float) -> List[int]:
+    """Series por tramo de intensidad (sin las de peso 0, que no tienen intensidad)."""
+    counts = [0] * len(INTENSITY_LABELS)
+    if max_weight <= 0:
+        return counts
+    for value, n in weights.items():
+        if value > 0:
+            counts[bisect.bisect_right(INTENSITY_EDGES, min(value / max_weight, 1.0))] += n
+    return counts
+
+
+def _reps_zones(reps: QuantileSketch) -> List[int]:
+    counts = [0] * len(REPS_ZONES)
+    for value, n in reps.items():
+        r = int(round(value))
+        for i, (lo, hi, _) in enumerate(REPS_ZONES):
+            if r >= lo and (hi is None or r <= hi):
+                counts[i] += n
+                break
+    return counts
+
+
+def _distribution(weights: QuantileSketch, reps: QuantileSketch, intensity: List[int]) -> Dict[str, Any]:
+    return {
+        "sets": weights.count,
+        "weight_kg": _percentiles(weights),
+        "reps": _percentiles(reps, as_int=True),
+        "intensity": [{"bucket": label, "sets": n} for label, n in zip(INTENSITY_LABELS, intensity)],
+        "reps_zones": [{"zone": label, "sets": n} for (_, _, label), n in zip(REPS_ZONES, _reps_zones(reps))],
+    }
+
+
+def summarize_distribution(
+    from_date: str,
+    to_date: str,
+    partials: Mapping[str, DayPartial],
+    exercise: Optional[str] = None,
+    limit: int = 20,
+) -> Dict[str, Any]:
+    """
+    Distribuciones del rango (percentiles de peso y reps, intensidad, zonas de reps y
+    ejercicios distintos) mezclando los sketches de los días, sin volver a las filas.
+    La intensidad de cada serie es relativa al peso máximo de su ejercicio en el rango.
+    """
+    distinct = CardinalitySketch()
+    # Por ejercicio: [sketch de peso, sketch de reps, peso máximo]
+    per_exercise: Dict[str, List[Any]] = {}
+
+    for day in sorted(partials):
+        p = partials[day]
+        distinct.merge(p.distinct)
+        for name, (weights, reps) in p.dist.items():
+            if exercise is not None and name != exercise:
+                continue
+            entry = per_exercise.get(name)
+            if entry is None:
+                entry = per_exercise[name] = [QuantileSketch(), QuantileSketch(), 0.0]
+            entry[0].merge(weights)
+            entry[1].merge(reps)
+            stats = p.ex_stats.get(name)
+            if stats is not None and stats[2] > entry[2]:
+                entry[2] = stats[2]
+
+    all_weights = QuantileSketch()
+    all_reps = QuantileSketch()
+    all_intensity = [0] * len(INTENSITY_LABELS)
+    by_exercise = []
+    for name, (weights, reps, max_weight) in per_exercise.items():
+        all_weights.merge(weights)
+        all_reps.merge(reps)
+        intensity = _intensity(weights, max_weight)
+        all_intensity = [a + b for a, b in zip(all_intensity, intensity)]
+        by_exercise.append({
+            "exercise": name,
+            "max_weight": round(max_weight, 2),
+            **_distribution(weights, reps, intensity),
+        })
+    by_exercise.sort(key=lambda e: (-e["sets"], e["exercise"]))
+
+    return {
+        "from": from_date,
+        "to": to_date,
+        "distinct_exercises": distinct.estimate(),
+        **_distribution(all_weights, all_reps, all_intensity),
+        "by_exercise": by_exercise[:limit],
+    }
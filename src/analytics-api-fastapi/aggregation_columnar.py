@@ -0,0 +1,345 @@
+# aggregation_columnar.py
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se usa siempre el motor por filas
+    np = None
+
+import aggregation
+
+# =========================================================
+# Config
+# =========================================================
+# Lotes con al menos N filas se agregan con el motor columnar (si numpy está disponible)
+COLUMNAR_ENABLED = os.getenv("ANALYTICS_COLUMNAR", "1") == "1"
+COLUMNAR_MIN_ROWS = int(os.getenv("ANALYTICS_COLUMNAR_MIN_ROWS", "20000"))
+
+
+def enabled() -> bool:
+    return COLUMNAR_ENABLED and np is not None
+
+
+class RowColumns:
+    """
+    Filas del Core API convertidas una sola vez a columnas tipadas:
+    - day_codes / name_codes: índices sobre las tablas de días y nombres de ejercicio
+    - workout_ids / exercise_ids + máscaras de presencia (None)
+    - has_set, reps (int) y weights (float, ya saneados como en el motor por filas)
+    """
+
+    __slots__ = (
+        "day_table",
+        "day_codes",
+        "workout_ids",
+        "has_workout",
+        "exercise_ids",
+        "has_exercise",
+        "has_set",
+        "reps",
+        "weights",
+        "name_table",
+        "name_codes",
+    )
+
+    def __init__(self, **columns: Any) -> None:
+        for name in self.__slots__:
+            setattr(self, name, columns[name])
+
+    def __len__(self) -> int:
+        return len(self.day_codes)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict[str, Any]]) -> Optional["RowColumns"]:
+        """
+        Convierte filas (dicts) a columnas. Devuelve None si algún tipo no encaja
+        (p.ej. ids no enteros), en cuyo caso el llamador usa el motor por filas.
+        """
+        # Una pasada por columna: comprensiones simples, mucho más baratas que el bucle general
+        dates = [r.get("workout_date", "") for r in rows]
+        workout_raw = [r.get("workout_id") for r in rows]
+        exercise_raw = [r.get("exercise_id") for r in rows]
+        names_raw = [r.get("exercise_name") for r in rows]
+
+        workout_ids, has_workout = _optional_ints(workout_raw)
+        exercise_ids, has_exercise = _optional_ints(exercise_raw)
+        if workout_ids is None or exercise_ids is None:
+            return None
+
+        reps = np.array([r.get("reps") or 0 for r in rows])
+        if len(rows) and reps.dtype.kind not in "iub":
+            return None
+
+        day_table, day_codes = _encode(dates, lambda d: str(d)[:10])
+        name_table, name_codes = _encode(
+            [n or (f"exercise_{e}" if e is not None else "unknown_exercise")
+             for n, e in zip(names_raw, exercise_raw)],
+            None,
+        )
+
+        return cls(
+            day_table=day_table,
+            day_codes=day_codes,
+            workout_ids=workout_ids,
+            has_workout=has_workout,
+            exercise_ids=exercise_ids,
+            has_exercise=has_exercise,
+            has_set=np.array([r.get("set_id") is not None for r in rows], dtype=bool),
+            reps=reps.astype(np.int64),
+            weights=parse_weights([r.get("weight_kg") for r in rows]),
+            name_table=name_table,
+            name_codes=name_codes,
+        )
+
+
+    @classmethod
+    def from_wire(cls, payload: Dict[str, Any]) -> Optional["RowColumns"]:
+        """
+        Columnas a partir del formato columnar del Core API (ver wire_format.py):
+        las tablas de fechas y nombres ya vienen codificadas, solo se normalizan.
+        Devuelve None si algún tipo no encaja, igual que from_rows.
+        """
+        cols = payload["columns"]
+        dates = payload.get("dates") or []
+        names = payload.get("names") or []
+
+        workout_ids, has_workout = _optional_ints(cols["workout_id"])
+        exercise_ids, has_exercise = _optional_ints(cols["exercise_id"])
+        if workout_ids is None or exercise_ids is None:
+            return None
+
+        reps = np.array([r or 0 for r in cols["reps"]])
+        if len(reps) and reps.dtype.kind not in "iub":
+            return None
+
+        # Varias fechas crudas pueden caer en el mismo día: se recodifican sobre la tabla de días
+        day_table, day_remap = _encode(dates, lambda d: str(d)[:10])
+        day_codes = day_remap[np.array(cols["date"], dtype=np.int64)] if len(dates) else np.zeros(0, dtype=np.int64)
+
+        # Nombres nulos (-1) o vacíos: mismo respaldo que el motor por filas, por id de ejercicio
+        name_table = list(names)
+        name_codes = np.array(cols["name"], dtype=np.int64)
+        empty = [i for i, n in enumerate(names) if not n]
+        missing = np.flatnonzero((name_codes < 0) | np.isin(name_codes, empty)).tolist()
+        if missing:
+            name_index = {n: i for i, n in enumerate(name_table) if n}
+            exercise_raw = cols["exercise_id"]
+            for i in missing:
+                e = exercise_raw[i]
+                name = f"exercise_{e}" if e is not None else "unknown_exercise"
+                code = name_index.get(name)
+                if code is None:
+                    code = name_index[name] = len(name_table)
+                    name_table.append(name)
+                name_codes[i] = code
+
+        return cls(
+            day_table=day_table,
+            day_codes=day_codes,
+            workout_ids=workout_ids,
+            has_workout=has_workout,
+            exercise_ids=exercise_ids,
+            has_exercise=has_exercise,
+            has_set=np.array([s is not None for s in cols["set_id"]], dtype=bool),
+            reps=reps.astype(np.int64),
+            weights=parse_weights(cols["weight_kg"]),
+            name_table=name_table,
+            name_codes=name_codes,
+        )
+
+
+def _encode(values: List[Any], key=None):
+    """
+    Codificación de diccionario en orden de primera aparición.
+    `key` normaliza el valor crudo (se evalúa una vez por valor distinto).
+    """
+    table: List[Any] = []
+    index: Dict[Any, int] = {}
+    raw_codes: Dict[Any, int] = {}
+
+    def code(v):
+        k = key(v) if key is not None else v
+        c = index.get(k)
+        if c is None:
+            c = index[k] = len(table)
+            table.append(k)
+        raw_codes[v] = c
+        return c
+
+    codes = [raw_codes[v] if v in raw_codes else code(v) for v in values]
+    return table, np.array(codes, dtype=np.int64)
+
+
+def _optional_ints(values: List[Any]):
+    """Columna de enteros con máscara de presencia; (None, None) si no son enteros."""
+    present = np.array([v is not None for v in values], dtype=bool)
+    arr = np.array([v if v is not None else 0 for v in values])
+    if len(values) == 0:
+        return arr.astype(np.int64), present
+    if arr.dtype.kind not in "iu":
+        return None, None
+    return arr.astype(np.int64), present
+
+
+def parse_weights(values: List[Any]) -> "np.ndarray":
+    """Equivalente vectorizado de float(w or 0), con 0.0 para valores no numéricos."""
+    values = [w or 0 for w in values]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        out = np.empty(len(values), dtype=np.float64)
+        for i, w in enumerate(values):
+            try:
+                out[i] = float(w)
+            except Exception:
+                out[i] = 0.0
+        return out
+
+
+def _unique_pairs(codes: "np.ndarray", ids: "np.ndarray", mask: "np.ndarray") -> List[List[int]]:
+    """Pares (día, id) distintos; las filas llegan casi ordenadas, así que se compactan antes."""
+    if not mask.any():
+        return []
+    d = codes[mask]
+    v = ids[mask]
+    # Quita repeticiones consecutivas (muy frecuentes) antes de ordenar
+    keep = np.ones(len(d), dtype=bool)
+    keep[1:] = (d[1:] != d[:-1]) | (v[1:] != v[:-1])
+    d = d[keep]
+    v = v[keep]
+
+    values, v_codes = np.unique(v, return_inverse=True)
+    n = len(values)
+    pairs = np.unique(d * n + v_codes.ravel())
+    return np.stack([pairs // n, values[pairs % n]], axis=1).tolist()
+
+
+def accumulate_columns(cols: RowColumns, days: Dict[str, "aggregation.DayPartial"]) -> None:
+    """
+    Agrega un lote columnar sobre los parciales diarios `days` (los crea o los continúa).
+
+    Las sumas se hacen con bincount, que acumula en el orden de las filas; los valores
+    previos de cada día se anteponen como 'semillas' para reproducir exactamente la
+    misma secuencia de sumas en coma flotante que el motor por filas.
+    """
+    day_table = cols.day_table
+    n_days = len(day_table)
+
+    partials = []
+    for day in day_table:
+        p = days.get(day)
+        if p is None:
+            p = days[day] = aggregation.DayPartial()
+        partials.append(p)
+
+    for d, w in _unique_pairs(cols.day_codes, cols.workout_ids, cols.has_workout):
+        partials[d].workouts.add(w)
+    for d, e in _unique_pairs(cols.day_codes, cols.exercise_ids, cols.has_exercise):
+        partials[d].exercises.add(e)
+
+    m = cols.has_set
+    if not m.any():
+        return
+
+    dc = cols.day_codes[m]
+    ec = cols.name_codes[m]
+    reps = cols.reps[m]
+    volume = reps.astype(np.float64) * cols.weights[m]
+
+    # Totales por día (series y reps son enteros: sumas exactas en cualquier orden)
+    sets_by_day = np.bincount(dc, minlength=n_days).tolist()
+    reps_by_day = np.bincount(dc, weights=reps, minlength=n_days).astype(np.int64).tolist()
+
+    seed_days = np.arange(n_days, dtype=np.int64)
+    seed_vol = np.array([p.volume for p in partials], dtype=np.float64)
+    vol_by_day = np.bincount(
+        np.concatenate([seed_days, dc]),
+        weights=np.concatenate([seed_vol, volume]),
+        minlength=n_days,
+    ).tolist()
+
+    for d, p in enumerate(partials):
+        if sets_by_day[d]:
+            p.sets += sets_by_day[d]
+            p.reps += reps_by_day[d]
+            p.volume = vol_by_day[d]
+
+    # Volumen por (día, ejercicio), respetando el orden de primera aparición
+    name_table = list(cols.name_table)
+    name_index = {name: i for i, name in enumerate(name_table)}
+    seed_pairs: List[int] = []
+    seed_vals: List[float] = []
+    touched = np.unique(dc).tolist()
+    for d in touched:
+        for name, vol in partials[d].by_exercise.items():
+            e = name_index.get(name)
+            if e is None:
+                e = name_index[name] = len(name_table)
+                name_table.append(name)
+            seed_pairs.append((d, e))
+            seed_vals.append(vol)
+
+    n_names = len(name_table)
+    pair_codes = np.concatenate(
+        [
+            np.array([d * n_names + e for d, e in seed_pairs], dtype=np.int64),
+            dc * n_names + ec,
+        ]
+    )
+    pair_vals = np.concatenate([np.array(seed_vals, dtype=np.float64), volume])
+
+    uniq, first_idx, inverse = np.unique(pair_codes, return_index=True, return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=pair_vals).tolist()
+    uniq = uniq.tolist()
+
+    for k in np.argsort(first_idx, kind="stable").tolist():
+        d, e = divmod(uniq[k], n_names)
+        partials[d].by_exercise[name_table[e]] = sums[k]
+
+    # Estadísticas por (día, ejercicio) de este lote: series, reps y máximos
+    row_pairs, row_inverse = np.unique(dc * n_names + ec, return_inverse=True)
+    row_inverse = row_inverse.ravel()
+    n_pairs = len(row_pairs)
+    pair_sets = np.bincount(row_inverse, minlength=n_pairs).tolist()
+    pair_reps = np.bincount(row_inverse, weights=reps, minlength=n_pairs).astype(np.int64).tolist()
+    pair_max_weight = np.full(n_pairs, -np.inf)
+    np.maximum.at(pair_max_weight, row_inverse, cols.weights[m])
+    pair_best = np.full(n_pairs, -np.inf)
+    np.maximum.at(pair_best, row_inverse, volume)
+
+    for k, code in enumerate(row_pairs.tolist()):
+        d, e = divmod(code, n_names)
+        aggregation.merge_ex_stats(
+            partials[d].ex_stats,
+            name_table[e],
+            (pair_sets[k], pair_reps[k], float(pair_max_weight[k]), float(pair_best[k])),
+        )
+
+    _accumulate_sketches(partials, name_table, row_pairs, row_inverse, (cols.weights[m], reps))
+
+
+def _accumulate_sketches(
+    partials: List["aggregation.DayPartial"],
+    name_table: List[str],
+    row_pairs: "np.ndarray",
+    row_inverse: "np.ndarray",
+    columns: Sequence["np.ndarray"],
+) -> None:
+    """
+    Sketches (peso, reps) por (día, ejercicio): se cuentan las series por valor distinto
+    y cada sketch recibe una actualización por valor, igual que en el motor por filas.
+    """
+    n_names = len(name_table)
+    sketches = [
+        aggregation.exercise_sketches(partials[d], name_table[e])
+        for d, e in (divmod(code, n_names) for code in row_pairs.tolist())
+    ]
+    for i, values in enumerate(columns):
+        uniq, inverse = np.unique(values, return_inverse=True)
+        n_uniq = len(uniq)
+        codes, counts = np.unique(row_inverse * n_uniq + inverse.ravel(), return_counts=True)
+        uniq = uniq.tolist()
+        for code, n in zip(codes.tolist(), counts.tolist()):
+            pair, v = divmod(code, n_uniq)
+            sketches[pair][i].add(uniq[v], n)
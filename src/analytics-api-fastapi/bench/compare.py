@@ -0,0 +1,66 @@
+# bench/compare.py
+"""
+Compara dos ficheros de resultados (misma suite) y marca regresiones.
+
+Uso (desde src/analytics-api-fastapi):
+    python -m bench.compare bench/results/base.json bench/results/nuevo.json --threshold 10
+
+Sale con código 1 si alguna métrica empeora más del umbral (en %).
+"""
+import argparse
+import sys
+from typing import Any, Dict, Tuple
+
+from bench.results import load_results
+
+# Métrica -> True si "más alto es mejor"
+METRICS = {
+    "microbench": {"rows_per_sec": True, "peak_mem_bytes": False},
+    "loadtest": {"throughput_rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False},
+}
+
+
+def _key(suite: str, result: Dict[str, Any]) -> Tuple:
+    if suite == "microbench":
+        return (result["name"], result["rows"])
+    return (result["endpoint"], result.get("concurrency"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compara dos ejecuciones de benchmark")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regresión máxima tolerada (%%)")
+    args = parser.parse_args()
+
+    base = load_results(args.baseline)
+    cand = load_results(args.candidate)
+    suite = base["suite"]
+    if cand["suite"] != suite:
+        raise SystemExit(f"Suites distintas: {suite} vs {cand['suite']}")
+
+    base_by_key = {_key(suite, r): r for r in base["results"]}
+    regressions = 0
+
+    for r in cand["results"]:
+        key = _key(suite, r)
+        b = base_by_key.get(key)
+        if b is None:
+            continue
+        for metric, higher_is_better in METRICS[suite].items():
+            old, new = b.get(metric), r.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100.0
+            worse = -change if higher_is_better else change
+            flag = "REGRESIÓN" if worse > args.threshold else ""
+            regressions += bool(flag)
+            label = " ".join(str(k) for k in key if k is not None)
+            print(f"{label:<40} {metric:<15} {old:>14,.2f} -> {new:>14,.2f} ({change:+7.1f}%) {flag}")
+
+    print(f"{regressions} regresiones por encima del {args.threshold:g}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# bench/loadtest.py
+"""
+Driver de carga asíncrono: latencias p50/p95/p99 y throughput por endpoint.
+
+Por defecto arranca el Analytics API en este mismo proceso (ASGI, sin red) con el
+Core API stub y MongoDB en memoria. Con --base-url se carga un servidor real
+(p.ej. uvicorn main:app apuntando a `python -m bench.stubs`).
+
+Uso (desde src/analytics-api-fastapi):
+    python -m bench.loadtest --concurrency 32 --requests 500
+    python -m bench.loadtest --base-url http://localhost:8000 --endpoints summary reports_list
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from bench.results import percentile, write_results
+
+WINDOWS = [7, 30, 90, 365]
+
+RequestFn = Callable[[httpx.AsyncClient, random.Random], Awaitable[httpx.Response]]
+
+
+def _report_payload(rnd: random.Random) -> Dict[str, Any]:
+    to_d = date.today() - timedelta(days=rnd.randint(0, 60))
+    from_d = to_d - timedelta(days=rnd.choice(WINDOWS))
+    by_day = [{"date": (from_d + timedelta(days=i)).isoformat(), "volume": 1000.0 + i} for i in range(0, 30, 2)]
+    by_exercise = [{"exercise": f"Ejercicio {i}", "volume": 5000.0 - 100 * i} for i in range(12)]
+    return {
+        "result": {
+            "from": from_d.isoformat(),
+            "to": to_d.isoformat(),
+            "summary": {"workouts": 12, "exercises": 12, "sets": 180, "total_reps": 1500, "total_volume": 45000.0},
+            "by_day": by_day,
+            "by_exercise": by_exercise,
+        },
+        "meta": {"source": "bench", "trigger": "loadtest"},
+    }
+
+
+def build_endpoints(report_ids: List[str]) -> Dict[str, RequestFn]:
+    def summary(client, rnd):
+        to_d = date.today()
+        from_d = to_d - timedelta(days=rnd.choice(WINDOWS))
+        return client.get("/analytics/summary", params={"from": from_d.isoformat(), "to": to_d.isoformat()})
+
+    def summary_batch(client, rnd):
+        return client.post("/analytics/summary/batch", json={"windows": [{"days": d} for d in WINDOWS]})
+
+    def rebuild_latest(client, rnd):
+        return client.post("/analytics/rebuild/latest", params={"days": rnd.choice(WINDOWS)})
+
+    def reports_list(client, rnd):
+        return client.get("/analytics/reports", params={"limit": 50, "skip": rnd.choice([0, 0, 50, 100])})
+
+    def reports_get(client, rnd):
+        return client.get(f"/analytics/reports/{rnd.choice(report_ids)}")
+
+    def reports_create(client, rnd):
+        return client.post("/analytics/reports", json=_report_payload(rnd))
+
+    endpoints: Dict[str, RequestFn] = {
+        "summary": summary,
+        "summary_batch": summary_batch,
+        "rebuild_latest": rebuild_latest,
+        "reports_list": reports_list,
+        "reports_create": reports_create,
+    }
+    if report_ids:
+        endpoints["reports_get"] = reports_get
+    return endpoints
+
+
+async def _seed_reports(client: httpx.AsyncClient, n: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    ids = []
+    for _ in range(n):
+        resp = await client.post("/analytics/reports", json=_report_payload(rnd))
+        resp.raise_for_status()
+        ids.append(resp.json()["id"])
+    return ids
+
+
+async def _drive(
+    client: httpx.AsyncClient,
+    fn: RequestFn,
+    total: int,
+    concurrency: int,
+    seed: int,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    remaining = total
+
+    async def worker(worker_id: int) -> None:
+        nonlocal remaining, errors
+        rnd = random.Random(seed * 1000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            try:
+                resp = await fn(client, rnd)
+                status = str(resp.status_code)
+                if resp.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                status = "transport_error"
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    if args.base_url:
+        client = httpx.AsyncClient(
+            base_url=args.base_url,
+            timeout=60,
+            limits=httpx.Limits(max_connections=args.concurrency),
+        )
+    else:
+        # Servicio en proceso: Core API stub + MongoDB en memoria
+        import daily_store
+        import main as app_main
+        from bench import stubs
+        from bench.synthetic import generate_rows
+        from summary_cache import summary_cache
+
+        stubs.install(generate_rows(days=args.days, seed=args.seed))
+        if args.no_cache:
+            summary_cache.ttl_seconds = 0
+        if args.no_daily_store:
+            daily_store.DAILY_STORE_ENABLED = False
+        client = httpx.AsyncClient(
+            base_url="http://analytics",
+            transport=httpx.ASGITransport(app=app_main.app),
+            timeout=60,
+        )
+
+    results = []
+    async with client:
+        report_ids = await _seed_reports(client, args.seed_reports, args.seed) if args.seed_reports else []
+        endpoints = build_endpoints(report_ids)
+
+        for name in args.endpoints:
+            fn = endpoints.get(name)
+            if fn is None:
+                print(f"{name}: endpoint desconocido u omitido")
+                continue
+            stats = await _drive(client, fn, args.requests, args.concurrency, args.seed)
+            results.append({"endpoint": name, "concurrency": args.concurrency, **stats})
+            print(
+                f"{name:<16} {stats['throughput_rps'] or 0:>9.1f} req/s  "
+                f"p50={stats['p50_ms']:>8.2f} ms  p95={stats['p95_ms']:>8.2f} ms  "
+                f"p99={stats['p99_ms']:>8.2f} ms  errores={stats['errors']}"
+            )
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Prueba de carga del Analytics API")
+    parser.add_argument("--base-url", default=None, help="Servidor real; si se omite, se usa la app en proceso")
+    parser.add_argument(
+        "--endpoints",
+        nargs="+",
+        default=["summary", "rebuild_latest", "reports_list", "reports_get", "reports_create"],
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=300, help="Peticiones por endpoint")
+    parser.add_argument("--days", type=int, default=730, help="Días de datos sintéticos (modo en proceso)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--seed-reports", type=int, default=200, help="Informes a crear antes de medir")
+    parser.add_argument("--no-cache", action="store_true", help="Desactiva la caché de resúmenes")
+    parser.add_argument("--no-daily-store", action="store_true", help="Desactiva el almacén diario")
+    parser.add_argument("--out", default=None, help="Fichero JSON de salida (por defecto bench/results/)")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    params = {k: v for k, v in vars(args).items() if k != "out"}
+    print(f"Resultados: {write_results('loadtest', results, params, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# bench/microbench.py
+"""
+Microbenchmarks de agregación y de obtención de filas.
+
+Mide, para varios tamaños, el throughput (filas/s, mejor de N repeticiones) y el pico
+de memoria (tracemalloc, en una ejecución aparte) de:
+- compute_summary.*   motores de agregación sobre filas ya en memoria
+- parse.*             decodificación del payload del Core API (json.loads vs streaming vs columnar)
+- fetch.*             _fetch_partials (lista, streaming o columnar) contra el Core API stub (sin red)
+                      El transporte ASGI en proceso entrega el cuerpo de una vez: para ver
+                      el efecto del streaming en memoria, medir contra un servidor real.
+
+Uso (desde src/analytics-api-fastapi):
+    python -m bench.microbench --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import aggregation
+import aggregation_columnar as columnar
+import core_client
+import daily_store
+import main as app_main
+import wire_format
+from aggregation import SummaryAccumulator, summarize_partials
+from json_stream import JsonArrayStreamParser
+
+from bench import stubs
+from bench.results import write_results
+from bench.synthetic import generate_n_rows
+
+CHUNK_CHARS = 64 * 1024
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": best, "peak_mem_bytes": peak}
+
+
+def _python_engine(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    acc = SummaryAccumulator()
+    acc.add_python(rows)
+    return acc.result("from", "to")
+
+
+def _columnar_engine(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    cols = columnar.RowColumns.from_rows(rows)
+    days: Dict[str, aggregation.DayPartial] = {}
+    columnar.accumulate_columns(cols, days)
+    return summarize_partials("from", "to", days)
+
+
+def _parse_full(payload: str) -> Dict[str, Any]:
+    return app_main._compute_summary("from", "to", json.loads(payload).get("rows", []))
+
+
+def _parse_columnar(payload: str) -> Dict[str, Any]:
+    acc = SummaryAccumulator()
+    wire_format.add_payload(acc, json.loads(payload))
+    return acc.result("from", "to")
+
+
+def _parse_streaming(payload: str) -> Dict[str, Any]:
+    parser = JsonArrayStreamParser("rows")
+    acc = SummaryAccumulator()
+    for i in range(0, len(payload), CHUNK_CHARS):
+        acc.add_rows(parser.feed(payload[i:i + CHUNK_CHARS]))
+    acc.add_rows(parser.close())
+    return acc.result("from", "to")
+
+
+def _run_async(coro_fn: Callable[[], Any]) -> Callable[[], Any]:
+    return lambda: asyncio.run(coro_fn())
+
+
+def run(sizes: List[int], repeat: int, seed: int) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    # Sin almacén diario ni caché: se mide siempre el cálculo completo
+    daily_store.DAILY_STORE_ENABLED = False
+
+    for n in sizes:
+        rows = generate_n_rows(n, seed=seed)
+        payload = json.dumps({"from": "from", "to": "to", "count": len(rows), "rows": rows})
+        columnar_payload = json.dumps(wire_format.encode_columnar("from", "to", rows))
+        from_date = str(rows[0]["workout_date"])[:10] if rows else "2026-01-01"
+        to_date = str(rows[-1]["workout_date"])[:10] if rows else "2026-01-01"
+
+        async def fetch_list():
+            stubs.install(rows, mongo=False)
+            wire_format.CORE_FORMAT = "rows"
+            app_main.ANALYTICS_STREAMING = False
+            try:
+                partials = await app_main._fetch_partials(from_date, to_date)
+            finally:
+                await core_client.close_client()
+            return summarize_partials(from_date, to_date, partials)
+
+        async def fetch_streaming():
+            stubs.install(rows, mongo=False)
+            wire_format.CORE_FORMAT = "rows"
+            app_main.ANALYTICS_STREAMING = True
+            try:
+                partials = await app_main._fetch_partials(from_date, to_date)
+            finally:
+                await core_client.close_client()
+            return summarize_partials(from_date, to_date, partials)
+
+        async def fetch_columnar():
+            stubs.install(rows, mongo=False)
+            wire_format.CORE_FORMAT = wire_format.COLUMNAR
+            try:
+                partials = await app_main._fetch_partials(from_date, to_date)
+            finally:
+                await core_client.close_client()
+            return summarize_partials(from_date, to_date, partials)
+
+        cases = {
+            "compute_summary.python": lambda: _python_engine(rows),
+            "compute_summary.auto": lambda: app_main._compute_summary("from", "to", rows),
+            "parse.json_loads": lambda: _parse_full(payload),
+            "parse.streaming": lambda: _parse_streaming(payload),
+            "parse.columnar": lambda: _parse_columnar(columnar_payload),
+            "fetch.list": _run_async(fetch_list),
+            "fetch.streaming": _run_async(fetch_streaming),
+            "fetch.columnar": _run_async(fetch_columnar),
+        }
+        if columnar.np is not None:
+            cases["compute_summary.columnar"] = lambda: _columnar_engine(rows)
+
+        for name, fn in cases.items():
+            m = _measure(fn, repeat)
+            result = {
+                "name": name,
+                "rows": n,
+                "payload_bytes": len((columnar_payload if name.endswith(".columnar") and not name.startswith("compute") else payload).encode("utf-8")),
+                "seconds": round(m["seconds"], 6),
+                "rows_per_sec": round(n / m["seconds"], 1) if m["seconds"] > 0 else None,
+                "peak_mem_bytes": m["peak_mem_bytes"],
+            }
+            results.append(result)
+            print(
+                f"{name:<28} rows={n:<8} {result['rows_per_sec'] or 0:>14,.0f} filas/s  "
+                f"pico={m['peak_mem_bytes'] / 1e6:8.2f} MB"
+            )
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmarks del Analytics API")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="Fichero JSON de salida (por defecto bench/results/)")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.seed)
+    path = write_results(
+        "microbench",
+        results,
+        {"sizes": args.sizes, "repeat": args.repeat, "seed": args.seed},
+        args.out,
+    )
+    print(f"Resultados: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# bench/stubs.py
+"""
+Sustitutos locales para medir el servicio sin Docker:
+- un Core API mínimo que sirve GET /analytics/workouts a partir de filas sintéticas
+- MongoDB en memoria (mongomock-motor, ver bench/requirements.txt)
+
+Uso como servidor independiente (p.ej. para cargar un uvicorn real del Analytics API):
+    python -m bench.stubs --days 730 --port 3000
+"""
+import argparse
+import bisect
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+import core_client
+import db_mongo
+import wire_format
+
+from bench.synthetic import generate_rows
+
+
+def make_core_api(rows: List[Dict[str, Any]]) -> FastAPI:
+    """App FastAPI con el contrato de /analytics/workouts del Core API (filas o columnar, sin gzip)."""
+    app = FastAPI(title="Core API stub")
+    days = [str(r["workout_date"])[:10] for r in rows]
+
+    @app.get("/analytics/workouts")
+    async def workouts(
+        from_date: str = Query(..., alias="from"),
+        to_date: str = Query(..., alias="to"),
+        format: str = Query("rows"),
+    ) -> JSONResponse:
+        lo = bisect.bisect_left(days, from_date)
+        hi = bisect.bisect_right(days, to_date)
+        selected = rows[lo:hi]
+        headers = {"X-Row-Count": str(len(selected))}
+        if format == wire_format.COLUMNAR:
+            return JSONResponse(wire_format.encode_columnar(from_date, to_date, selected), headers=headers)
+        return JSONResponse(
+            {"from": from_date, "to": to_date, "count": len(selected), "rows": selected}, headers=headers
+        )
+
+    return app
+
+
+def _patch_mongomock_bulk() -> None:
+    """
+    pymongo >= 4.9 pasa `sort` a las operaciones de bulk_write y mongomock aún no lo acepta.
+    """
+    import mongomock.collection as mc
+
+    for name in ("add_replace", "add_update"):
+        original = getattr(mc.BulkOperationBuilder, name)
+        if getattr(original, "_bench_patched", False):
+            continue
+
+        def wrapper(self, *args, _original=original, **kwargs):
+            kwargs.pop("sort", None)
+            return _original(self, *args, **kwargs)
+
+        wrapper._bench_patched = True
+        setattr(mc.BulkOperationBuilder, name, wrapper)
+
+
+def make_mongo_client():
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError as e:
+        raise SystemExit("Falta mongomock-motor: pip install -r bench/requirements.txt") from e
+    _patch_mongomock_bulk()
+    return AsyncMongoMockClient()
+
+
+def install(rows: List[Dict[str, Any]], mongo: bool = True) -> None:
+    """
+    Redirige el Analytics API (en este proceso) a los sustitutos:
+    el cliente compartido del Core API pasa a hablar con el stub por ASGI y
+    db_mongo usa la base en memoria.
+    """
+    core_client._client = httpx.AsyncClient(
+        base_url="http://core-api-stub",
+        transport=httpx.ASGITransport(app=make_core_api(rows)),
+    )
+    if mongo:
+        db_mongo._client = make_mongo_client()
+        db_mongo._fast_client = db_mongo._client
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Core API stub con datos sintéticos")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    rows = generate_rows(days=args.days, seed=args.seed)
+    print(f"Core API stub: {len(rows)} filas en {args.days} días")
+    uvicorn.run(make_core_api(rows), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
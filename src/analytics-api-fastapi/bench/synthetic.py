@@ -0,0 +1,108 @@
+# bench/synthetic.py
+"""
+Generador de filas sintéticas con la forma de GET /analytics/workouts del Core API.
+
+Reproduce las distribuciones habituales: días de descanso, 1-2 entrenos por día,
+varios ejercicios por entreno (con ejercicios más populares que otros), 2-5 series,
+progresión de cargas y valores nulos (items sin series por el LEFT JOIN,
+reps/peso a NULL). El peso llega como string DECIMAL(6,2), igual que con mysql2.
+"""
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+# (id, nombre, peso base kg, popularidad)
+EXERCISES = [
+    (1, "Press banca", 60.0, 10),
+    (2, "Sentadilla", 80.0, 10),
+    (3, "Peso muerto", 100.0, 7),
+    (4, "Press militar", 40.0, 6),
+    (5, "Remo con barra", 55.0, 6),
+    (6, "Dominadas", 0.0, 5),
+    (7, "Fondos", 0.0, 4),
+    (8, "Curl bíceps", 14.0, 6),
+    (9, "Extensión tríceps", 20.0, 5),
+    (10, "Prensa", 150.0, 4),
+    (11, "Zancadas", 24.0, 3),
+    (12, "Elevaciones laterales", 8.0, 4),
+    (13, "Hip thrust", 90.0, 3),
+    (14, "Jalón al pecho", 50.0, 4),
+    (15, "Face pull", 18.0, 2),
+    (16, "Plancha", 0.0, 2),
+]
+
+
+def generate_rows(
+    days: int = 365,
+    end: Optional[date] = None,
+    seed: int = 42,
+    train_prob: float = 0.55,
+    double_session_prob: float = 0.05,
+    empty_item_prob: float = 0.04,
+    null_reps_prob: float = 0.02,
+    null_weight_prob: float = 0.05,
+) -> List[Dict[str, Any]]:
+    """Filas de `days` días terminando en `end` (hoy por defecto), ordenadas como el Core API."""
+    rnd = random.Random(seed)
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+
+    weights = [e[3] for e in EXERCISES]
+    rows: List[Dict[str, Any]] = []
+    workout_id = item_id = set_id = 0
+
+    for offset in range(days):
+        if rnd.random() >= train_prob:
+            continue
+
+        day = start + timedelta(days=offset)
+        # Progresión lenta de cargas a lo largo del periodo
+        progression = 1.0 + 0.25 * offset / max(days, 1)
+        sessions = 2 if rnd.random() < double_session_prob else 1
+
+        for _ in range(sessions):
+            workout_id += 1
+            n_items = rnd.randint(3, 7)
+            chosen = []
+            while len(chosen) < n_items:
+                ex = rnd.choices(EXERCISES, weights=weights)[0]
+                if ex not in chosen:
+                    chosen.append(ex)
+
+            for ex_id, ex_name, base_kg, _ in chosen:
+                item_id += 1
+                base = {
+                    "workout_id": workout_id,
+                    "workout_date": f"{day.isoformat()}T00:00:00.000Z",
+                    "workout_item_id": item_id,
+                    "exercise_id": ex_id,
+                    "exercise_name": ex_name,
+                }
+
+                if rnd.random() < empty_item_prob:
+                    rows.append({**base, "set_id": None, "set_index": None, "reps": None, "weight_kg": None})
+                    continue
+
+                for set_index in range(1, rnd.choice([2, 3, 3, 4, 4, 5]) + 1):
+                    set_id += 1
+                    reps = None if rnd.random() < null_reps_prob else rnd.choice([5, 6, 8, 8, 10, 10, 12, 15])
+                    if base_kg == 0.0 or rnd.random() < null_weight_prob:
+                        weight = None
+                    else:
+                        kg = base_kg * progression * rnd.uniform(0.85, 1.1)
+                        weight = f"{round(kg * 4) / 4:.2f}"
+                    rows.append(
+                        {**base, "set_id": set_id, "set_index": set_index, "reps": reps, "weight_kg": weight}
+                    )
+
+    return rows
+
+
+def generate_n_rows(n: int, seed: int = 42, end: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Al menos `n` filas (recortadas a exactamente `n`), ampliando el rango de días lo necesario."""
+    days = max(30, n // 8)
+    while True:
+        rows = generate_rows(days=days, seed=seed, end=end)
+        if len(rows) >= n:
+            return rows[-n:] if n else []
+        days *= 2
@@ -0,0 +1,119 @@
+# core_client.py
+import asyncio
+import os
+import random
+from typing import Any, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+
+import metrics
+
+# =========================================================
+# Config (cliente HTTP compartido hacia el Core API)
+# =========================================================
+CORE_API_BASE = os.getenv("CORE_API_BASE", "http://core-api:3000")
+
+CORE_API_TIMEOUT = float(os.getenv("CORE_API_TIMEOUT", "10"))
+CORE_API_CONNECT_TIMEOUT = float(os.getenv("CORE_API_CONNECT_TIMEOUT", "3"))
+CORE_API_POOL_TIMEOUT = float(os.getenv("CORE_API_POOL_TIMEOUT", "5"))
+
+CORE_API_MAX_CONNECTIONS = int(os.getenv("CORE_API_MAX_CONNECTIONS", "100"))
+CORE_API_MAX_KEEPALIVE = int(os.getenv("CORE_API_MAX_KEEPALIVE", "20"))
+CORE_API_KEEPALIVE_EXPIRY = float(os.getenv("CORE_API_KEEPALIVE_EXPIRY", "30"))
+
+# Reintentos (solo GET, que es idempotente) con backoff exponencial + jitter
+CORE_API_RETRIES = int(os.getenv("CORE_API_RETRIES", "2"))
+CORE_API_BACKOFF_BASE = float(os.getenv("CORE_API_BACKOFF_BASE", "0.2"))
+CORE_API_BACKOFF_MAX = float(os.getenv("CORE_API_BACKOFF_MAX", "2"))
+
+RETRY_STATUS = {502, 503, 504}
+
+_client: httpx.AsyncClient | None = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=CORE_API_BASE,
+        timeout=httpx.Timeout(
+            CORE_API_TIMEOUT,
+            connect=CORE_API_CONNECT_TIMEOUT,
+            pool=CORE_API_POOL_TIMEOUT,
+        ),
+        limits=httpx.Limits(
+            max_connections=CORE_API_MAX_CONNECTIONS,
+            max_keepalive_connections=CORE_API_MAX_KEEPALIVE,
+            keepalive_expiry=CORE_API_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+async def start_client() -> None:
+    """Crea el cliente compartido (se llama desde el lifespan de la app)."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def close_client() -> None:
+    """Cierra el cliente y libera las conexiones keep-alive del pool."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Backoff exponencial con 'full jitter': uniforme en [0, min(max, base * 2^n)]."""
+    cap = min(CORE_API_BACKOFF_MAX, CORE_API_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+async def core_send(
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    stream: bool = False,
+) -> httpx.Response:
+    """
+    GET al Core API usando el pool compartido.
+    Reintenta errores de transporte y 502/503/504; el resto de respuestas se devuelven tal cual.
+    Con stream=True el cuerpo no se lee: el llamador debe consumirlo y cerrar la respuesta.
+    """
+    client = get_client()
+
+    for attempt in range(CORE_API_RETRIES + 1):
+        last = attempt == CORE_API_RETRIES
+        try:
+            request = client.build_request("GET", path, params=params)
+            with metrics.stage("core_api"):
+                resp = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            metrics.upstream_error(e)
+            if last:
+                raise HTTPException(status_code=502, detail=f"Core API no accesible: {e}")
+        except httpx.HTTPError as e:
+            metrics.upstream_error(e)
+            raise HTTPException(status_code=502, detail=f"Core API no accesible: {e}")
+        else:
+            metrics.upstream_response(resp.status_code)
+            if resp.status_code not in RETRY_STATUS or last:
+                return resp
+            await resp.aclose()
+
+        metrics.upstream_retry()
+        await asyncio.sleep(_backoff_delay(attempt))
+
+    # No alcanzable: el último intento siempre devuelve o lanza
+    raise HTTPException(status_code=502, detail="Core API no accesible")
+
+
+async def core_get(path: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+    """GET al Core API con el cuerpo ya leído."""
+    return await core_send(path, params=params)
@@ -0,0 +1,252 @@
+# daily_store.py
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+import metrics
+from aggregation import DayPartial
+from db_mongo import get_fast_db
+from sketches import CardinalitySketch, QuantileSketch
+
+COLLECTION = "analytics_daily_partials"
+# Tramos de días sin entrenos: un documento por tramo, no uno por día
+EMPTY_COLLECTION = "analytics_daily_empty"
+# Versión del formato de documento: los guardados con otra versión se recalculan
+DOC_VERSION = 3
+
+# =========================================================
+# Config
+# =========================================================
+# Almacén de parciales por día: un resumen de rango = mezcla de los días guardados
+DAILY_STORE_ENABLED = os.getenv("ANALYTICS_DAILY_STORE", "1") == "1"
+# Los últimos N días (incluido hoy) siempre se recalculan y nunca se guardan
+DAILY_STORE_FRESH_DAYS = int(os.getenv("ANALYTICS_DAILY_FRESH_DAYS", "1"))
+# Antigüedad máxima de un parcial guardado antes de volver a pedirlo al Core API
+DAILY_STORE_TTL_SECONDS = int(os.getenv("ANALYTICS_DAILY_TTL_SECONDS", "3600"))
+# Huecos de días válidos <= N entre tramos pendientes se piden en la misma consulta
+DAILY_STORE_MERGE_GAP = int(os.getenv("ANALYTICS_DAILY_MERGE_GAP", "3"))
+# Tras un fallo de MongoDB el almacén se salta durante N s: los resúmenes van directos al
+# Core API sin volver a esperar a MongoDB en cada petición
+DAILY_STORE_BREAKER_SECONDS = float(os.getenv("ANALYTICS_DAILY_BREAKER_SECONDS", "30"))
+
+FetchPartials = Callable[[str, str], Awaitable[Dict[str, DayPartial]]]
+
+logger = logging.getLogger("analytics")
+
+_down_until = 0.0
+
+
+def available() -> bool:
+    """El almacén está activo y MongoDB no ha fallado hace menos de DAILY_STORE_BREAKER_SECONDS."""
+    return DAILY_STORE_ENABLED and time.monotonic() >= _down_until
+
+
+def _mark_down() -> None:
+    global _down_until
+    _down_until = time.monotonic() + DAILY_STORE_BREAKER_SECONDS
+
+
+def _ymd(d: date) -> str:
+    return d.strftime("%Y-%m-%d")
+
+
+def days_between(from_date: str, to_date: str) -> List[str]:
+    start = datetime.strptime(from_date, "%Y-%m-%d").date()
+    end = datetime.strptime(to_date, "%Y-%m-%d").date()
+    return [_ymd(start + timedelta(days=i)) for i in range((end - start).days + 1)]
+
+
+async def ensure_indexes() -> None:
+    coll = get_fast_db()[EMPTY_COLLECTION]
+    await coll.create_index([("from", 1), ("to", 1)], name="from_to")
+    # Pasado el TTL un tramo ya no se usa (se vuelve a pedir y se guarda otro): se borra solo
+    await coll.create_index("computed_at", name="computed_at_ttl", expireAfterSeconds=max(DAILY_STORE_TTL_SECONDS, 1))
+
+
+def _is_empty(p: DayPartial) -> bool:
+    return not (p.sets or p.workouts or p.exercises)
+
+
+def _fresh_cutoff() -> str:
+    """Primer día que se considera 'vivo' (no se guarda)."""
+    return _ymd(date.today() - timedelta(days=max(DAILY_STORE_FRESH_DAYS, 0) - 1))
+
+
+def _partial_to_doc(day: str, p: DayPartial, now: datetime) -> dict:
+    return {
+        "_id": day,
+        "sets": p.sets,
+        "reps": p.reps,
+        "volume": p.volume,
+        "workouts": sorted(p.workouts),
+        "exercises": sorted(p.exercises),
+        # Lista de pares para conservar el orden y admitir nombres con '.' o '$'
+        "by_exercise": [[name, vol] for name, vol in p.by_exercise.items()],
+        "ex_stats": [[name, *stats] for name, stats in p.ex_stats.items()],
+        # Sketches de percentiles (peso, reps) por ejercicio y HyperLogLog de ejercicios
+        "dist": [[name, w.to_doc(), r.to_doc()] for name, (w, r) in p.dist.items()],
+        "distinct": p.distinct.to_doc(),
+        "computed_at": now,
+        "v": DOC_VERSION,
+    }
+
+
+def _doc_to_partial(doc: dict) -> DayPartial:
+    p = DayPartial()
+    p.sets = doc.get("sets", 0)
+    p.reps = doc.get("reps", 0)
+    p.volume = doc.get("volume", 0.0)
+    p.workouts = set(doc.get("workouts") or [])
+    p.exercises = set(doc.get("exercises") or [])
+    p.by_exercise = {name: vol for name, vol in doc.get("by_exercise") or []}
+    p.ex_stats = {s[0]: list(s[1:]) for s in doc.get("ex_stats") or []}
+    p.dist = {
+        name: (QuantileSketch.from_doc(w), QuantileSketch.from_doc(r))
+        for name, w, r in doc.get("dist") or []
+    }
+    p.distinct = CardinalitySketch.from_doc(doc.get("distinct") or {})
+    return p
+
+
+def _runs(days: List[str], gap: int = 0) -> List[Tuple[str, str]]:
+    """Agrupa días (ordenados) en tramos contiguos [from, to], uniendo huecos <= gap."""
+    runs: List[Tuple[str, str]] = []
+    prev = None
+    for day in days:
+        d = datetime.strptime(day, "%Y-%m-%d").date()
+        if prev is not None and (d - prev).days <= gap + 1:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+        prev = d
+    return runs
+
+
+async def load_partials(from_date: str, to_date: str) -> Dict[str, DayPartial]:
+    """
+    Carga los parciales guardados y vigentes del rango: los días con datos y los de los
+    tramos vacíos. Si un día está en ambos, vale lo más reciente.
+    """
+    db = get_fast_db()
+    threshold = datetime.now(timezone.utc) - timedelta(seconds=DAILY_STORE_TTL_SECONDS)
+    cursor = db[COLLECTION].find(
+        {"_id": {"$gte": from_date, "$lte": to_date}, "computed_at": {"$gte": threshold}, "v": DOC_VERSION}
+    )
+    with metrics.mongo("daily_partials.find"):
+        docs = {doc["_id"]: doc async for doc in cursor}
+    cursor = db[EMPTY_COLLECTION].find(
+        {"from": {"$lte": to_date}, "to": {"$gte": from_date}, "computed_at": {"$gte": threshold}, "v": DOC_VERSION}
+    )
+    with metrics.mongo("daily_empty.find"):
+        runs = await cursor.to_list(length=None)
+
+    partials = {day: _doc_to_partial(doc) for day, doc in docs.items()}
+    for run in runs:
+        for day in days_between(max(run["from"], from_date), min(run["to"], to_date)):
+            doc = docs.get(day)
+            if doc is None or doc["computed_at"] < run["computed_at"]:
+                partials[day] = DayPartial()
+    return partials
+
+
+async def save_partials(partials: Dict[str, DayPartial]) -> int:
+    """
+    Guarda (upsert) parciales de días cerrados; ignora los días 'vivos'. Los días vacíos
+    consecutivos se guardan como un único tramo.
+    """
+    cutoff = _fresh_cutoff()
+    now = datetime.now(timezone.utc)
+    days = [day for day in partials if day and day < cutoff]
+    ops = [ReplaceOne({"_id": day}, _partial_to_doc(day, partials[day], now), upsert=True)
+           for day in days if not _is_empty(partials[day])]
+    empty = [
+        {"from": run_from, "to": run_to, "computed_at": now, "v": DOC_VERSION}
+        for run_from, run_to in _runs(sorted(day for day in days if _is_empty(partials[day])))
+    ]
+    if ops:
+        with metrics.mongo("daily_partials.bulk_write"):
+            await get_fast_db()[COLLECTION].bulk_write(ops, ordered=False)
+    if empty:
+        with metrics.mongo("daily_empty.insert_many"):
+            await get_fast_db()[EMPTY_COLLECTION].insert_many(empty, ordered=False)
+    return len(days)
+
+
+async def invalidate(days: Iterable[str]) -> int:
+    """Borra los días guardados y los tramos vacíos que se solapan con ellos (se vuelven a pedir enteros)."""
+    days = list(days)
+    if not days:
+        return 0
+    with metrics.mongo("daily_partials.delete_many"):
+        res = await get_fast_db()[COLLECTION].delete_many({"_id": {"$in": days}})
+    with metrics.mongo("daily_empty.delete_many"):
+        empty = await get_fast_db()[EMPTY_COLLECTION].delete_many(
+            {"from": {"$lte": max(days)}, "to": {"$gte": min(days)}}
+        )
+    return res.deleted_count + empty.deleted_count
+
+
+async def _fetch_runs(
+    runs: List[Tuple[str, str]], fetch: FetchPartials
+) -> Dict[str, DayPartial]:
+    """Pide cada tramo al Core API; los días sin filas quedan como parciales vacíos."""
+    fetched: Dict[str, DayPartial] = {}
+    for run_from, run_to in runs:
+        part = await fetch(run_from, run_to)
+        for day in days_between(run_from, run_to):
+            fetched[day] = part.pop(day, None) or DayPartial()
+        # Claves fuera del tramo (fechas anómalas): cuentan en el resultado, no se guardan
+        for day, p in part.items():
+            fetched.setdefault(day, p)
+    return fetched
+
+
+async def get_range_partials(
+    from_date: str, to_date: str, fetch: FetchPartials
+) -> Dict[str, DayPartial]:
+    """
+    Parciales de todos los días de [from_date, to_date]:
+    los vigentes salen de MongoDB y solo los que faltan (o están caducados/invalidados)
+    se piden al Core API, agrupados en tramos contiguos. Los días posteriores a hoy no se
+    piden ni se guardan (sin parcial: cuentan como días vacíos).
+    Si MongoDB falla se abre el circuito (ver available()) y se propaga el error.
+    """
+    cutoff = _fresh_cutoff()
+    today = _ymd(date.today())
+    last = min(to_date, today)
+    try:
+        partials = await load_partials(from_date, last)
+    except PyMongoError:
+        _mark_down()
+        raise
+    # Un día 'vivo' nunca se sirve desde el almacén
+    partials = {d: p for d, p in partials.items() if d < cutoff}
+
+    missing = [d for d in days_between(from_date, last) if d not in partials]
+    if missing:
+        fetched = await _fetch_runs(_runs(missing, DAILY_STORE_MERGE_GAP), fetch)
+        try:
+            await save_partials({d: p for d, p in fetched.items() if from_date <= d <= to_date})
+        except PyMongoError as e:
+            # Los días ya están pedidos: se sirven igual, sin guardarlos
+            _mark_down()
+            logger.warning("No se pudieron guardar los parciales diarios: %s", e)
+        for day, p in fetched.items():
+            if day not in partials:
+                partials[day] = p
+
+    return partials
+
+
+async def rebuild(days: Iterable[str], fetch: FetchPartials) -> int:
+    """Recalcula y guarda los días indicados, ignorando lo que hubiera guardado."""
+    wanted = sorted(set(days))
+    if not wanted:
+        return 0
+    fetched = await _fetch_runs(_runs(wanted), fetch)
+    return await save_partials({d: fetched[d] for d in wanted if d in fetched})
@@ -3,16 +3,37 @@ from motor.motor_asyncio import AsyncIOMotorClient
 
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongo:27017")
 MONGO_DB = os.getenv("MONGO_DB", "myworkout")
+# Falla rápido si MongoDB no responde (por defecto pymongo espera 30 s)
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+# Operaciones opcionales (almacén diario): si MongoDB no responde se renuncia mucho antes
+# y la petición sigue sin él
+MONGO_FAST_TIMEOUT_MS = int(os.getenv("MONGO_FAST_TIMEOUT_MS", "500"))
 
 _client: AsyncIOMotorClient | None = None
+_fast_client: AsyncIOMotorClient | None = None
 
 
 def get_client() -> AsyncIOMotorClient:
     global _client
     if _client is None:
-        _client = AsyncIOMotorClient(MONGO_URL)
+        _client = AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS)
     return _client
 
 
+def get_fast_client() -> AsyncIOMotorClient:
+    global _fast_client
+    if _fast_client is None:
+        _fast_client = AsyncIOMotorClient(
+            MONGO_URL,
+            serverSelectionTimeoutMS=MONGO_FAST_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_FAST_TIMEOUT_MS,
+        )
+    return _fast_client
+
+
 def get_db():
     return get_client()[MONGO_DB]
+
+
+def get_fast_db():
+    return get_fast_client()[MONGO_DB]
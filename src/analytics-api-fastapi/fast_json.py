@@ -0,0 +1,47 @@
+# fast_json.py
+import json
+from typing import Any, Optional
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+import metrics
+
+# orjson es opcional: sin él se usa json con la misma salida que JSONResponse de FastAPI
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """JSON compacto en UTF-8 (mismos bytes que JSONResponse para los tipos que usamos)."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """
+    Respuesta para datos ya bien formados (p.ej. resúmenes calculados por aggregation.py).
+    Devolver una Response hace que FastAPI no vuelva a validar contra el response_model,
+    que se mantiene en el endpoint solo para documentar el esquema en OpenAPI.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        with metrics.stage("serialize"):
+            return dumps(content)
+
+
+def model_response(model: BaseModel, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """Serializa un modelo ya validado (con alias, p.ej. 'from') sin una segunda validación."""
+    with metrics.stage("serialize"):
+        content = model.model_dump_json(by_alias=True)
+    return Response(
+        content=content,
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
@@ -0,0 +1,47 @@
+# http_cache.py
+import os
+from typing import Dict, Optional
+
+from fastapi.responses import Response
+
+# =========================================================
+# Config
+# =========================================================
+# Cache-Control por endpoint. Por defecto el navegador puede guardar la respuesta,
+# pero debe revalidarla (If-None-Match) antes de reutilizarla
+SUMMARY_CACHE_CONTROL = os.getenv("ANALYTICS_SUMMARY_CACHE_CONTROL", "private, no-cache")
+REPORT_CACHE_CONTROL = os.getenv("REPORTS_DETAIL_CACHE_CONTROL", "private, no-cache")
+
+
+def strong_etag(token: str) -> str:
+    return f'"{token}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Comparación de If-None-Match con el ETag actual (comparación débil, como
+    indica la RFC 9110 para GET: se ignora el prefijo W/).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def validator_headers(etag: str, cache_control: str) -> Dict[str, str]:
+    headers = {"ETag": etag}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    return headers
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """304 sin cuerpo: el cliente reutiliza la copia que ya tiene."""
+    return Response(status_code=304, headers=validator_headers(etag, cache_control))
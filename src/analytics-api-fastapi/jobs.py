@@ -0,0 +1,366 @@
+# jobs.py
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+import metrics
+from db_mongo import get_db
+
+# Trabajos en segundo plano (p.ej. rebuild/latest de rangos largos): estado, progreso y
+# resultado se guardan en MongoDB junto a report_generations
+JOBS_COLLECTION = "analytics_jobs"
+
+# =========================================================
+# Config
+# =========================================================
+# Workers asyncio que ejecutan trabajos a la vez
+JOB_WORKERS = int(os.getenv("ANALYTICS_JOB_WORKERS", "2"))
+# Trabajos en cola como máximo (más allá se responde 503)
+JOB_QUEUE_MAX = int(os.getenv("ANALYTICS_JOB_QUEUE_MAX", "100"))
+# Horas que se conservan los trabajos terminados (índice TTL)
+JOB_RETENTION_HOURS = float(os.getenv("ANALYTICS_JOB_RETENTION_HOURS", "24"))
+# Espera máxima de un long-poll
+JOB_MAX_WAIT_SECONDS = float(os.getenv("ANALYTICS_JOB_MAX_WAIT_SECONDS", "30"))
+# Cada N s la instancia renueva el latido de sus trabajos activos y revisa los de las demás
+JOB_HEARTBEAT_SECONDS = float(os.getenv("ANALYTICS_JOB_HEARTBEAT_SECONDS", "10"))
+# Trabajos activos sin latido desde hace N s: su instancia murió, se dan por interrumpidos
+JOB_STALE_SECONDS = float(os.getenv("ANALYTICS_JOB_STALE_SECONDS", "60"))
+# Intervalo de consulta a MongoDB al esperar trabajos de otra instancia
+JOB_POLL_SECONDS = 0.5
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+logger = logging.getLogger("analytics")
+
+Progress = Callable[[str, int], Awaitable[None]]
+Handler = Callable[[Dict[str, Any], Progress], Awaitable[Dict[str, Any]]]
+# (trabajo, resultado) -> id del informe guardado
+ReportSaver = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[str]]
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("id", "kind", "key", "params", "save_report", "done")
+
+    def __init__(self, job_id: str, kind: str, key: str, params: Dict[str, Any], save_report: bool) -> None:
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.params = params
+        self.save_report = save_report
+        self.done = asyncio.Event()
+
+
+_handlers: Dict[str, Handler] = {}
+_report_saver: Optional[ReportSaver] = None
+_queue: Optional[asyncio.Queue] = None
+_workers: list = []
+_heartbeat_task: Optional[asyncio.Task] = None
+# Instancia dueña de los trabajos que encola este proceso
+OWNER = str(ObjectId())
+# Trabajos pendientes o en curso de este proceso: por clave (deduplicación) y por id (espera)
+_active_by_key: Dict[str, _Job] = {}
+_active_by_id: Dict[str, _Job] = {}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    return dt.isoformat() if dt is not None else None
+
+
+def register(kind: str, handler: Handler) -> None:
+    """Asocia un tipo de trabajo con la corrutina que lo ejecuta."""
+    _handlers[kind] = handler
+
+
+def set_report_saver(saver: ReportSaver) -> None:
+    global _report_saver
+    _report_saver = saver
+
+
+async def ensure_indexes() -> None:
+    coll = get_db()[JOBS_COLLECTION]
+    await coll.create_index([("key", ASCENDING), ("status", ASCENDING)], name="key_status")
+    await coll.create_index([("created_at", DESCENDING)], name="created_at_desc")
+    # Los trabajos terminados caducan solos (expires_at solo se fija al terminar)
+    await coll.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+    await coll.create_index([("status", ASCENDING), ("heartbeat_at", ASCENDING)], name="status_heartbeat")
+
+
+async def _beat() -> None:
+    """Renueva el latido de los trabajos activos de este proceso."""
+    ids = [ObjectId(i) for i in _active_by_id]
+    if not ids:
+        return
+    with metrics.mongo("analytics_jobs.update_many"):
+        await get_db()[JOBS_COLLECTION].update_many(
+            {"_id": {"$in": ids}, "owner": OWNER, "status": {"$in": list(ACTIVE)}},
+            {"$set": {"heartbeat_at": _now()}},
+        )
+
+
+async def sweep() -> int:
+    """
+    Marca como fallidos los trabajos activos cuyo latido lleva más de JOB_STALE_SECONDS sin
+    renovarse (su instancia se cayó o se reinició). Los documentos sin latido (anteriores a
+    este campo) se juzgan por updated_at.
+    """
+    stale = _now() - timedelta(seconds=JOB_STALE_SECONDS)
+    with metrics.mongo("analytics_jobs.update_many"):
+        res = await get_db()[JOBS_COLLECTION].update_many(
+            {
+                "status": {"$in": list(ACTIVE)},
+                "$or": [
+                    {"heartbeat_at": {"$lt": stale}},
+                    {"heartbeat_at": {"$exists": False}, "updated_at": {"$lt": stale}},
+                ],
+            },
+            {"$set": _finished(FAILED, error="Trabajo interrumpido (instancia sin latido)")},
+        )
+    if res.modified_count:
+        logger.warning("%d trabajos interrumpidos marcados como fallidos", res.modified_count)
+    return res.modified_count
+
+
+async def _heartbeat_loop() -> None:
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            await _beat()
+            await sweep()
+        except PyMongoError as e:
+            logger.warning("Latido de trabajos fallido: %s", e)
+
+
+async def start_workers() -> None:
+    """
+    Arranca los workers y el latido (desde el lifespan) y cierra los trabajos huérfanos de
+    instancias caídas; la revisión se repite con cada latido.
+    """
+    global _queue, _heartbeat_task
+    if JOB_WORKERS <= 0 or _queue is not None:
+        return
+    _queue = asyncio.Queue(maxsize=max(JOB_QUEUE_MAX, 1))
+    for _ in range(JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker(_queue)))
+
+    await sweep()
+    if JOB_HEARTBEAT_SECONDS > 0:
+        _heartbeat_task = asyncio.create_task(_heartbeat_loop())
+
+
+async def stop_workers() -> None:
+    """Detiene los workers y el latido; los trabajos que quedaban en este proceso se marcan como fallidos."""
+    global _queue, _heartbeat_task
+    # Antes de cancelar: al cancelarse, _run ya quita su trabajo de _active_by_id
+    pending = list(_active_by_id)
+    tasks = list(_workers)
+    if _heartbeat_task is not None:
+        tasks.append(_heartbeat_task)
+        _heartbeat_task = None
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+
+    _active_by_id.clear()
+    _active_by_key.clear()
+    if pending:
+        await get_db()[JOBS_COLLECTION].update_many(
+            {"_id": {"$in": [ObjectId(i) for i in pending]}, "status": {"$in": list(ACTIVE)}},
+            {"$set": _finished(FAILED, error="Trabajo interrumpido (parada del servicio)")},
+        )
+
+
+def enabled() -> bool:
+    return _queue is not None
+
+
+def _finished(status: str, **fields: Any) -> Dict[str, Any]:
+    now = _now()
+    return {
+        "status": status,
+        "finished_at": now,
+        "updated_at": now,
+        "expires_at": now + timedelta(hours=JOB_RETENTION_HOURS),
+        **fields,
+    }
+
+
+async def submit(kind: str, key: str, params: Dict[str, Any], save_report: bool = False) -> Tuple[str, bool]:
+    """
+    Encola un trabajo y devuelve (id, deduplicado). Si ya hay uno idéntico (misma clave)
+    pendiente o en curso en este proceso, se reutiliza en lugar de crear otro.
+    """
+    if _queue is None:
+        raise JobQueueFull("Cola de trabajos desactivada")
+
+    existing = _active_by_key.get(key)
+    if existing is not None:
+        if save_report and not existing.save_report:
+            existing.save_report = True
+            await get_db()[JOBS_COLLECTION].update_one({"_id": ObjectId(existing.id)}, {"$set": {"save_report": True}})
+        return existing.id, True
+
+    if _queue.full():
+        raise JobQueueFull("Cola de trabajos llena")
+
+    # El id se genera aquí y el trabajo se registra antes de insertar: una petición idéntica
+    # que llegue mientras se inserta ya lo encuentra y no crea un duplicado
+    job = _Job(str(ObjectId()), kind, key, params, save_report)
+    _active_by_key[key] = job
+    _active_by_id[job.id] = job
+
+    now = _now()
+    doc = {
+        "_id": ObjectId(job.id),
+        "kind": kind,
+        "key": key,
+        "params": params,
+        "status": QUEUED,
+        "progress": {"stage": QUEUED, "percent": 0},
+        "save_report": save_report,
+        "owner": OWNER,
+        "created_at": now,
+        "updated_at": now,
+        "heartbeat_at": now,
+    }
+    try:
+        with metrics.mongo("analytics_jobs.insert_one"):
+            await get_db()[JOBS_COLLECTION].insert_one(doc)
+    except BaseException:
+        _active_by_key.pop(key, None)
+        _active_by_id.pop(job.id, None)
+        raise
+
+    try:
+        _queue.put_nowait(job)
+    except asyncio.QueueFull:
+        # Otras peticiones llenaron la cola mientras se insertaba este trabajo
+        _active_by_key.pop(key, None)
+        _active_by_id.pop(job.id, None)
+        await get_db()[JOBS_COLLECTION].update_one(
+            {"_id": ObjectId(job.id)}, {"$set": _finished(FAILED, error="Cola de trabajos llena")}
+        )
+        raise JobQueueFull("Cola de trabajos llena")
+    return job.id, False
+
+
+async def _worker(queue: asyncio.Queue) -> None:
+    while True:
+        job = await queue.get()
+        try:
+            await _run(job)
+        except Exception:  # pragma: no cover - _run ya registra el fallo
+            logger.exception("Error inesperado en el worker de trabajos")
+        finally:
+            queue.task_done()
+
+
+async def _run(job: _Job) -> None:
+    coll = get_db()[JOBS_COLLECTION]
+    oid = ObjectId(job.id)
+
+    async def progress(stage: str, percent: int) -> None:
+        await coll.update_one(
+            {"_id": oid},
+            {"$set": {"progress": {"stage": stage, "percent": percent}, "updated_at": _now()}},
+        )
+
+    try:
+        now = _now()
+        await coll.update_one(
+            {"_id": oid},
+            {"$set": {"status": RUNNING, "started_at": now, "updated_at": now,
+                      "progress": {"stage": RUNNING, "percent": 0}}},
+        )
+        handler = _handlers.get(job.kind)
+        if handler is None:
+            raise ValueError(f"Tipo de trabajo desconocido: {job.kind}")
+
+        result = await handler(job.params, progress)
+
+        fields: Dict[str, Any] = {"result": result, "progress": {"stage": DONE, "percent": 100}}
+        if job.save_report and _report_saver is not None:
+            await progress("saving_report", 95)
+            fields["report_id"] = await _report_saver({"id": job.id, "kind": job.kind, "params": job.params}, result)
+        with metrics.mongo("analytics_jobs.update_one"):
+            await coll.update_one({"_id": oid}, {"$set": _finished(DONE, **fields)})
+    except Exception as e:
+        error = e.detail if isinstance(e, HTTPException) else str(e) or type(e).__name__
+        logger.warning("Trabajo %s (%s) fallido: %s", job.id, job.kind, error)
+        await coll.update_one({"_id": oid}, {"$set": _finished(FAILED, error=str(error))})
+    finally:
+        _active_by_key.pop(job.key, None)
+        _active_by_id.pop(job.id, None)
+        job.done.set()
+
+
+def view(doc: dict) -> Dict[str, Any]:
+    """Documento de trabajo con la forma de JobResponse."""
+    return {
+        "id": str(doc["_id"]),
+        "kind": doc.get("kind"),
+        "status": doc.get("status"),
+        "params": doc.get("params") or {},
+        "progress": doc.get("progress") or {},
+        "save_report": bool(doc.get("save_report")),
+        "created_at": _iso(doc.get("created_at")),
+        "started_at": _iso(doc.get("started_at")),
+        "finished_at": _iso(doc.get("finished_at")),
+        "result": doc.get("result"),
+        "error": doc.get("error"),
+        "report_id": doc.get("report_id"),
+    }
+
+
+async def _load(job_id: str) -> Optional[dict]:
+    with metrics.mongo("analytics_jobs.find_one"):
+        return await get_db()[JOBS_COLLECTION].find_one({"_id": ObjectId(job_id)})
+
+
+async def get(job_id: str, wait: float = 0.0) -> Optional[dict]:
+    """
+    Estado del trabajo. Con wait > 0 (long-poll) espera hasta que termine o pase el tiempo:
+    si el trabajo corre en este proceso se espera su evento; si no, se consulta MongoDB.
+    """
+    doc = await _load(job_id)
+    if doc is None or doc.get("status") not in ACTIVE or wait <= 0:
+        return doc
+
+    wait = min(wait, JOB_MAX_WAIT_SECONDS)
+    job = _active_by_id.get(job_id)
+    if job is not None:
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+        return await _load(job_id)
+
+    deadline = asyncio.get_running_loop().time() + wait
+    while doc is not None and doc.get("status") in ACTIVE:
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(JOB_POLL_SECONDS, remaining))
+        doc = await _load(job_id)
+    return doc
+
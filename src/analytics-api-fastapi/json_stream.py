@@ -0,0 +1,128 @@
+# json_stream.py
+import json
+import re
+from typing import Any, List
+
+_WS = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+class JsonArrayStreamParser:
+    """
+    Parser JSON incremental para respuestas del tipo {"...": ..., "<key>": [ {...}, {...} ]}.
+
+    Recibe el cuerpo en trozos (feed) y devuelve los elementos del array `key`
+    en cuanto están completos, sin construir nunca el documento entero.
+    El resto de claves del objeto raíz se parsean y se descartan.
+    """
+
+    def __init__(self, key: str = "rows") -> None:
+        self.key = key
+        self._buf = ""
+        self._pos = 0
+        self._state = "object"
+        self._current_key = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def _skip_ws(self) -> bool:
+        """Avanza sobre espacios; devuelve False si hace falta más entrada."""
+        self._pos = _WS.match(self._buf, self._pos).end()
+        return self._pos < len(self._buf)
+
+    def _decode_value(self):
+        """
+        Decodifica un valor completo en la posición actual.
+        Devuelve (ok, valor): ok=False si el valor puede estar truncado.
+        """
+        try:
+            value, end = _DECODER.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            return False, None
+        # Un número al final del buffer puede continuar en el siguiente trozo
+        if end == len(self._buf) and not isinstance(value, (dict, list, str)):
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _expect(self, chars: str) -> str:
+        c = self._buf[self._pos]
+        if c not in chars:
+            raise ValueError(f"JSON inesperado en posición {self._pos}: {c!r}")
+        self._pos += 1
+        return c
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Añade un trozo del cuerpo y devuelve los elementos completados."""
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        out: List[Any] = []
+
+        while self._state != "done" and self._skip_ws():
+            state = self._state
+
+            if state == "object":
+                self._expect("{")
+                self._state = "first_key"
+
+            elif state in ("first_key", "key"):
+                if state == "first_key" and self._buf[self._pos] == "}":
+                    self._pos += 1
+                    self._state = "done"
+                    continue
+                ok, key = self._decode_value()
+                if not ok:
+                    break
+                if not isinstance(key, str):
+                    raise ValueError("Clave JSON no válida")
+                self._current_key = key
+                self._state = "colon"
+
+            elif state == "colon":
+                self._expect(":")
+                self._state = "array" if self._current_key == self.key else "skip_value"
+
+            elif state == "skip_value":
+                ok, _ = self._decode_value()
+                if not ok:
+                    break
+                self._state = "after_value"
+
+            elif state == "array":
+                if self._buf[self._pos] != "[":
+                    # p.ej. "rows": null -> sin filas
+                    self._state = "skip_value"
+                    continue
+                self._pos += 1
+                self._state = "first_item"
+
+            elif state in ("first_item", "item"):
+                if state == "first_item" and self._buf[self._pos] == "]":
+                    self._pos += 1
+                    self._state = "after_value"
+                    continue
+                ok, item = self._decode_value()
+                if not ok:
+                    break
+                out.append(item)
+                self._state = "after_item"
+
+            elif state == "after_item":
+                c = self._expect(",]")
+                self._state = "item" if c == "," else "after_value"
+
+            elif state == "after_value":
+                c = self._expect(",}")
+                self._state = "key" if c == "," else "done"
+
+        return out
+
+    def close(self) -> List[Any]:
+        """Marca el fin de la entrada; falla si el documento quedó incompleto."""
+        # El espacio final delimita un posible número pegado al final del cuerpo
+        out = self.feed(" ")
+        if not self.done:
+            raise ValueError("Respuesta JSON incompleta")
+        return out
@@ -1,15 +1,43 @@
 # main.py
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Header, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Any, Dict, List
+from fastapi.responses import PlainTextResponse, Response
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
 from pydantic import BaseModel, Field
 
-import requests
-from collections import defaultdict
+from contextlib import asynccontextmanager
 from datetime import date, datetime, timedelta
+import logging
 import os
 
-from reports_router import router as reports_router
+import httpx
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+import admission
+import aggregation_columnar as columnar
+import core_client
+import daily_store
+import http_cache
+import jobs
+import metrics
+import offload
+import report_retention
+import sharding
+import timeseries_index
+import wire_format
+from aggregation import (
+    DayPartial,
+    SummaryAccumulator,
+    fingerprint_partials,
+    summarize_distribution,
+    summarize_partials,
+)
+from fast_json import FastJSONResponse
+from json_stream import JsonArrayStreamParser
+from summary_cache import summary_cache
+from reports_router import ensure_indexes as ensure_report_indexes, insert_report, router as reports_router
+from schemas_reports import ReportCreateRequest
 
 
 # =========================================================
@@ -19,6 +47,7 @@ openapi_tags = [
     {"name": "health", "description": "Endpoints de comprobación de estado del servicio."},
     {"name": "analytics", "description": "Cálculo de KPIs y agregaciones a partir de entrenamientos del Core API."},
     {"name": "reports", "description": "Historial de informes generados (persistencia en MongoDB)."},
+    {"name": "admin", "description": "Mantenimiento del almacén de parciales diarios y de la caché de resúmenes."},
 ]
 
 
@@ -60,6 +89,231 @@ class AnalyticsRebuildLatestResponse(BaseModel):
     result: AnalyticsSummaryResponse
 
 
+class JobAcceptedResponse(BaseModel):
+    job_id: str
+    status: str
+    deduplicated: bool
+    location: str
+
+
+class JobProgressModel(BaseModel):
+    stage: Optional[str] = None
+    percent: Optional[int] = None
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    params: Dict[str, Any]
+    progress: JobProgressModel
+    save_report: bool
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[AnalyticsRebuildLatestResponse] = None
+    error: Optional[str] = None
+    report_id: Optional[str] = None
+
+
+class AnalyticsWindow(BaseModel):
+    days: Optional[int] = Field(default=None, ge=1, le=3650)
+    from_: Optional[str] = Field(default=None, alias="from")
+    to: Optional[str] = None
+    key: Optional[str] = None
+
+
+class AnalyticsBatchRequest(BaseModel):
+    windows: List[AnalyticsWindow] = Field(..., min_length=1, max_length=32)
+
+
+class AnalyticsBatchResponse(BaseModel):
+    range: Dict[str, Any]
+    results: Dict[str, AnalyticsSummaryResponse]
+
+
+class TrendBucketModel(BaseModel):
+    start: str
+    end: str
+    workouts: int
+    sets: int
+    reps: int
+    volume: float
+
+
+class TrendTotalModel(BaseModel):
+    workouts: int
+    sets: int
+    reps: int
+    volume: float
+
+
+class TrendVolumeResponse(BaseModel):
+    from_: str = Field(alias="from")
+    to: str
+    bucket: str
+    total: TrendTotalModel
+    buckets: List[TrendBucketModel]
+
+
+class ExerciseBucketModel(BaseModel):
+    start: str
+    end: str
+    sets: int
+    reps: int
+    volume: float
+    max_weight: float
+    best_set_volume: float
+
+
+class ExerciseTrendResponse(BaseModel):
+    from_: str = Field(alias="from")
+    to: str
+    exercise: str
+    bucket: str
+    buckets: List[ExerciseBucketModel]
+
+
+class RecordValueModel(BaseModel):
+    value: float
+    date: str
+
+
+class PersonalRecordModel(BaseModel):
+    date: str
+    max_weight: float
+    best_set_volume: float
+
+
+class ExerciseRecordsModel(BaseModel):
+    exercise: str
+    max_weight: RecordValueModel
+    best_set_volume: RecordValueModel
+    personal_records: List[PersonalRecordModel]
+
+
+class RecordsResponse(BaseModel):
+    from_: str = Field(alias="from")
+    to: str
+    records: List[ExerciseRecordsModel]
+
+
+class IntensityBucketModel(BaseModel):
+    bucket: str
+    sets: int
+
+
+class RepsZoneModel(BaseModel):
+    zone: str
+    sets: int
+
+
+class ExerciseDistributionModel(BaseModel):
+    exercise: str
+    max_weight: float
+    sets: int
+    weight_kg: Dict[str, Optional[float]]
+    reps: Dict[str, Optional[int]]
+    intensity: List[IntensityBucketModel]
+    reps_zones: List[RepsZoneModel]
+
+
+class DistributionResponse(BaseModel):
+    from_: str = Field(alias="from")
+    to: str
+    distinct_exercises: int
+    sets: int
+    weight_kg: Dict[str, Optional[float]]
+    reps: Dict[str, Optional[int]]
+    intensity: List[IntensityBucketModel]
+    reps_zones: List[RepsZoneModel]
+    by_exercise: List[ExerciseDistributionModel]
+
+
+class DailyStoreRequest(BaseModel):
+    dates: List[str] = []
+    from_: Optional[str] = Field(default=None, alias="from")
+    to: Optional[str] = None
+
+
+class DailyStoreResponse(BaseModel):
+    ok: bool
+    days: int
+    affected: int
+
+
+class CacheStatsResponse(BaseModel):
+    enabled: bool
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    coalesced: int
+    evictions: int
+    inflight: int
+
+
+class CachePurgeResponse(BaseModel):
+    ok: bool
+    purged: int
+
+
+class AdmissionEndpointStats(BaseModel):
+    endpoint: str
+    enabled: bool
+    limit: int
+    in_use: int
+    queued: int
+    queue_max: int
+    timeout_seconds: float
+    admitted: int
+    rejected_queue_full: int
+    rejected_timeout: int
+
+
+class AdmissionStatsResponse(BaseModel):
+    enabled: bool
+    long_range_days: int
+    long_range_weight: int
+    endpoints: List[AdmissionEndpointStats]
+
+
+# =========================================================
+# Lifespan (recursos compartidos ligados a la app)
+# =========================================================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cliente HTTP con pool keep-alive hacia el Core API
+    await core_client.start_client()
+    # Pool de procesos para agregaciones grandes
+    offload.start_pool()
+    # Índices de MongoDB: si no está disponible, la app arranca igual (las consultas irán sin índice)
+    try:
+        await ensure_report_indexes()
+        await jobs.ensure_indexes()
+        await daily_store.ensure_indexes()
+    except PyMongoError as e:
+        logger.warning("No se pudieron crear los índices de MongoDB: %s", e)
+    # Workers de trabajos en segundo plano (rebuild/latest con async=true)
+    try:
+        await jobs.start_workers()
+    except PyMongoError as e:
+        logger.warning("No se pudieron revisar los trabajos interrumpidos: %s", e)
+    # Compactación periódica del historial de informes (retención)
+    report_retention.start()
+    try:
+        yield
+    finally:
+        await report_retention.stop()
+        try:
+            await jobs.stop_workers()
+        except PyMongoError as e:
+            logger.warning("No se pudieron cerrar los trabajos pendientes: %s", e)
+        offload.shutdown_pool()
+        await core_client.close_client()
+
+
 # =========================================================
 # App (OpenAPI 3.0 + Swagger UI auto)
 # =========================================================
@@ -78,6 +332,7 @@ app = FastAPI(
         "url": "http://localhost:8080",
     },
     license_info={"name": "Academic project"},
+    lifespan=lifespan,
 )
 
 # IMPORTANTE: registra endpoints de reports (MongoDB)
@@ -97,10 +352,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# =========================================================
+# Métricas (latencias por endpoint/etapa + cabecera Server-Timing)
+# =========================================================
+app.add_middleware(metrics.MetricsMiddleware)
+
 # =========================================================
 # Config
 # =========================================================
-CORE_API_BASE = os.getenv("CORE_API_BASE", "http://core-api:3000")
+# Streaming: parsea el array "rows" del Core API de forma incremental y agrega por lotes
+# de hasta ANALYTICS_COLUMNAR_MIN_ROWS filas (memoria acotada por ese umbral, ver
+# _columnar_batches). Con 0 se usa la ruta clásica (lista completa).
+# Solo aplica al formato de filas (el de por defecto; con ANALYTICS_CORE_FORMAT=columnar
+# el payload se decodifica entero, ver wire_format.py).
+ANALYTICS_STREAMING = os.getenv("ANALYTICS_STREAMING", "1") == "1"
+
+logger = logging.getLogger("analytics")
 
 
 # =========================================================
@@ -117,6 +384,23 @@ def health() -> HealthResponse:
     return HealthResponse(status="ok")
 
 
+@app.get(
+    "/metrics",
+    tags=["health"],
+    summary="Métricas en formato Prometheus",
+    description=(
+        "Histogramas de latencia por endpoint y por etapa (core_api, decode, aggregate, summarize, "
+        "validate, serialize, mongo), tiempos de operaciones MongoDB, filas por petición y "
+        "contadores de respuestas/errores/reintentos del Core API."
+    ),
+    response_class=PlainTextResponse,
+)
+def prometheus_metrics() -> PlainTextResponse:
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas desactivadas (ANALYTICS_METRICS=0)")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # =========================================================
 # Helpers
 # =========================================================
@@ -129,103 +413,367 @@ def _validate_iso_date(s: str, field: str) -> str:
         raise HTTPException(status_code=400, detail=f"'{field}' debe tener formato YYYY-MM-DD")
 
 #Llama a core api 
-def _fetch_rows(from_date: str, to_date: str) -> List[Dict[str, Any]]:
-    """Obtiene filas desde el Core API para el rango [from_date, to_date]."""
-    try:
-        resp = requests.get(
-            f"{CORE_API_BASE}/analytics/workouts",
-            params={"from": from_date, "to": to_date},
-            timeout=10,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Core API no accesible: {e}")
-
+async def _open_workouts(from_date: str, to_date: str) -> httpx.Response:
+    """
+    Pide al Core API el rango [from_date, to_date] sin leer aún el cuerpo: columnar si se
+    negocia y el Core API lo soporta, filas en otro caso (ver wire_format.py).
+    El llamador debe consumir y cerrar la respuesta.
+    """
+    resp = await core_client.core_send(
+        "/analytics/workouts",
+        params=wire_format.request_params(from_date, to_date),
+        stream=True,
+    )
     if resp.status_code != 200:
+        try:
+            await resp.aread()
+        finally:
+            await resp.aclose()
         raise HTTPException(
             status_code=resp.status_code,
             detail=f"Error desde Core API: {resp.text}",
         )
+    return resp
+
+
+async def _read_body(resp: httpx.Response) -> bytes:
+    with metrics.stage("core_api"):
+        return await resp.aread()
+
+
+async def _iter_rows(resp: httpx.Response) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Versión streaming (formato de filas): produce lotes de filas según llegan del Core API,
+    sin materializar nunca el payload completo.
+    """
+    parser = JsonArrayStreamParser("rows")
+    chunks = resp.aiter_text()
+    while True:
+        # Espera del cuerpo (red) y decodificación por separado
+        with metrics.stage("core_api"):
+            chunk = await anext(chunks, None)
+        if chunk is None:
+            break
+        with metrics.stage("decode"):
+            batch = parser.feed(chunk)
+        if batch:
+            yield batch
+
+    with metrics.stage("decode"):
+        batch = parser.close()
+    if batch:
+        yield batch
+
+
+async def _columnar_batches(
+    batches: AsyncIterator[List[Dict[str, Any]]],
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Junta los lotes del parser (unos cientos de filas cada uno) hasta COLUMNAR_MIN_ROWS para
+    que add_rows pueda usar el motor columnar también en streaming. Sin numpy los lotes
+    pasan tal cual, sin retener filas.
+    """
+    if not columnar.enabled():
+        async for batch in batches:
+            yield batch
+        return
 
-    payload = resp.json()
-    return payload.get("rows", [])
+    buffer: List[Dict[str, Any]] = []
+    async for batch in batches:
+        buffer.extend(batch)
+        if len(buffer) >= columnar.COLUMNAR_MIN_ROWS:
+            yield buffer
+            buffer = []
+    if buffer:
+        yield buffer
 
 
 def _compute_summary(from_date: str, to_date: str, rows: list) -> Dict[str, Any]:
     """Calcula el resumen analítico (KPIs + agregaciones) a partir de filas del Core API."""
-    if not rows:
-        return {
-            "from": from_date,
-            "to": to_date,
-            "summary": {
-                "workouts": 0,
-                "exercises": 0,
-                "sets": 0,
-                "total_reps": 0,
-                "total_volume": 0.0,
-            },
-            "by_day": [],
-            "by_exercise": [],
-        }
-
-    workouts = set()
-    exercises = set()
-
-    sets_count = 0
-    total_reps = 0
-    total_volume = 0.0
-
-    volume_by_day = defaultdict(float)
-    volume_by_exercise = defaultdict(float)
-
-    for r in rows:
-        workout_id = r.get("workout_id")
-        exercise_id = r.get("exercise_id")
-
-        if workout_id is not None:
-            workouts.add(workout_id)
-        if exercise_id is not None:
-            exercises.add(exercise_id)
-
-        if r.get("set_id") is None:
-            continue
+    acc = SummaryAccumulator()
+    acc.add_rows(rows)
+    return acc.result(from_date, to_date)
+
+
+async def _fetch_partials(from_date: str, to_date: str) -> Dict[str, DayPartial]:
+    """
+    Parciales por día del rango pedidos al Core API.
+    Los rangos largos se piden en trozos concurrentes (ver sharding.py).
+    Los días posteriores a hoy y los anteriores a ANALYTICS_EARLIEST_DATE no se piden.
+    """
+    rng = sharding.clamp_range(from_date, to_date)
+    if rng is None:
+        return {}
+    return await sharding.fetch_sharded(*rng, _fetch_range_partials)
+
+
+async def _fetch_range_partials(from_date: str, to_date: str) -> Dict[str, DayPartial]:
+    """
+    Obtiene las filas del rango en una consulta y devuelve sus parciales por día.
+    Con las cabeceras, antes de leer el cuerpo, se decide cómo: las respuestas grandes van
+    al pool de procesos (ver offload.should_offload); el resto, en streaming (formato de
+    filas) o con el payload completo (columnar).
+    """
+    resp = await _open_workouts(from_date, to_date)
+    try:
+        if offload.enabled() and offload.should_offload(resp.headers):
+            return await _aggregate_offloaded(resp)
+
+        acc = SummaryAccumulator()
+        if ANALYTICS_STREAMING and not wire_format.columnar_requested():
+            async for batch in _columnar_batches(_iter_rows(resp)):
+                metrics.add_rows(len(batch))
+                with metrics.stage("aggregate"):
+                    acc.add_rows(batch)
+        else:
+            await _read_body(resp)
+            with metrics.stage("decode"):
+                payload = resp.json()
+            with metrics.stage("aggregate"):
+                rows = wire_format.add_payload(acc, payload)
+            metrics.add_rows(rows)
+        return acc.days
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Core API no accesible: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=f"Respuesta inválida del Core API: {e}")
+    finally:
+        await resp.aclose()
 
-        reps = r.get("reps") or 0
+
+async def _aggregate_offloaded(resp: httpx.Response) -> Dict[str, DayPartial]:
+    """
+    Respuesta grande: se lee el cuerpo como bytes y, si de verdad tiene muchas filas, se
+    decodifica y agrega en otro proceso (sin bloquear el event loop ni el GIL de este).
+    Las que resultan pequeñas se procesan en línea, sin coste de IPC.
+    """
+    body = await _read_body(resp)
+    rows = offload.count_rows(body, resp.headers.get("x-row-count"))
+    metrics.add_rows(rows)
+    if rows >= offload.OFFLOAD_MIN_ROWS:
+        with metrics.stage("offload"):
+            return await offload.aggregate(body)
+    with metrics.stage("aggregate"):
+        return offload.aggregate_payload(body)
+
+
+async def _range_partials(from_date: str, to_date: str) -> Dict[str, DayPartial]:
+    """
+    Parciales por día del rango. Con el almacén diario activo, solo se piden al Core API
+    los días que no están guardados (o están caducados); si MongoDB falla, se piden todos
+    (y durante DAILY_STORE_BREAKER_SECONDS no se vuelve a intentar, ver daily_store.available).
+    Solo se tienen en cuenta los días entre ANALYTICS_EARLIEST_DATE y hoy (sharding.clamp_range).
+    """
+    rng = sharding.clamp_range(from_date, to_date)
+    if rng is None:
+        return {}
+    from_date, to_date = rng
+    partials = None
+    if daily_store.available():
         try:
-            weight = float(r.get("weight_kg") or 0)
-        except Exception:
-            weight = 0.0
+            partials = await daily_store.get_range_partials(from_date, to_date, _fetch_partials)
+        except PyMongoError as e:
+            logger.warning("Almacén diario no disponible, cálculo directo: %s", e)
+    if partials is None:
+        partials = await _fetch_partials(from_date, to_date)
+    # Días que cambiaron desde que se indexaron: el índice de tendencias los recalcula
+    timeseries_index.observe(partials)
+    return partials
 
-        volume = reps * weight
 
-        sets_count += 1
-        total_reps += reps
-        total_volume += volume
+class RangeSummary(NamedTuple):
+    """Resumen de un rango y su ETag (huella de los parciales de los que sale)."""
+    summary: Dict[str, Any]
+    etag: str
 
-        day = str(r.get("workout_date", ""))[:10]
-        if day:
-            volume_by_day[day] += volume
 
-        ex_name = r.get("exercise_name") or (
-            f"exercise_{exercise_id}" if exercise_id is not None else "unknown_exercise"
+def _range_summary(from_date: str, to_date: str, partials: Dict[str, DayPartial]) -> RangeSummary:
+    with metrics.stage("summarize"):
+        return RangeSummary(
+            summarize_partials(from_date, to_date, partials),
+            http_cache.strong_etag(fingerprint_partials(from_date, to_date, partials)),
         )
-        volume_by_exercise[ex_name] += volume
-
-    return {
-        "from": from_date,
-        "to": to_date,
-        "summary": {
-            "workouts": len(workouts),
-            "exercises": len(exercises),
-            "sets": sets_count,
-            "total_reps": total_reps,
-            "total_volume": round(total_volume, 2),
-        },
-        "by_day": [{"date": d, "volume": round(v, 2)} for d, v in sorted(volume_by_day.items())],
-        "by_exercise": [
-            {"exercise": e, "volume": round(v, 2)}
-            for e, v in sorted(volume_by_exercise.items(), key=lambda x: -x[1])
-        ],
-    }
+
+
+async def _summarize_range(from_date: str, to_date: str) -> RangeSummary:
+    """Calcula el resumen del rango a partir de sus parciales diarios."""
+    partials = await _range_partials(from_date, to_date)
+    return _range_summary(from_date, to_date, partials)
+
+
+async def _cached_summary(from_date: str, to_date: str) -> RangeSummary:
+    """
+    Resumen del rango a través de la caché en proceso (clave: rango normalizado).
+    Peticiones idénticas concurrentes comparten un único cálculo. El ETag se guarda
+    junto al resumen, así una revalidación con la caché caliente no recalcula nada.
+    """
+    return await summary_cache.get_or_compute(
+        (from_date, to_date), lambda: _summarize_range(from_date, to_date)
+    )
+
+
+async def _admitted_summary(endpoint: str, from_date: str, to_date: str) -> RangeSummary:
+    """
+    _cached_summary con control de admisión: solo esperan turno del endpoint las peticiones
+    que van a generar trabajo (ni cacheadas ni ya en curso por otra petición).
+    """
+    if summary_cache.available((from_date, to_date)):
+        return await _cached_summary(from_date, to_date)
+    async with admission.admit(endpoint, admission.range_weight(from_date, to_date)):
+        return await _cached_summary(from_date, to_date)
+
+
+async def _summarize_windows(windows: Dict[str, Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Resúmenes de varias ventanas con una sola obtención de datos: se piden los parciales
+    del rango unión una vez y cada ventana es la mezcla de sus días.
+    Las ventanas ya cacheadas no participan, las que otra petición está calculando se
+    esperan y las calculadas quedan en la caché.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    pending: Dict[str, Tuple[str, str]] = {}
+    joined: Dict[str, Tuple[str, str]] = {}
+    for key, rng in windows.items():
+        if summary_cache.available(rng) and summary_cache.get(rng) is None:
+            joined[key] = rng
+            continue
+        cached = summary_cache.lookup(rng)
+        if cached is not None:
+            results[key] = cached.summary
+        else:
+            pending[key] = rng
+
+    if pending:
+        union_from = min(f for f, _ in pending.values())
+        union_to = max(t for _, t in pending.values())
+        partials = await _range_partials(union_from, union_to)
+
+        for key, (f, t) in pending.items():
+            window = {d: p for d, p in partials.items() if f <= d <= t}
+            computed = _range_summary(f, t, window)
+            results[key] = computed.summary
+            summary_cache.put((f, t), computed)
+
+    for key, (f, t) in joined.items():
+        results[key] = (await _cached_summary(f, t)).summary
+    return {key: results[key] for key in windows}
+
+
+def _latest_range(days: int) -> Tuple[str, str]:
+    """Rango [hoy - days, hoy] de rebuild/latest."""
+    to_d = date.today()
+    from_d = to_d - timedelta(days=days)
+    return from_d.strftime("%Y-%m-%d"), to_d.strftime("%Y-%m-%d")
+
+
+async def _rebuild_latest_job(params: Dict[str, Any], progress: jobs.Progress) -> Dict[str, Any]:
+    """
+    Trabajo 'rebuild_latest': el mismo cálculo que el endpoint síncrono, con el rango fijado al encolar.
+    El avance sigue a los trozos pedidos al Core API (del 10% al 90%); los días que ya están
+    en el almacén diario no se piden y no cuentan.
+    """
+    last = 10
+
+    async def on_shard(done: int, total: int) -> None:
+        nonlocal last
+        # Varios tramos pendientes del almacén son varias tandas de trozos: el avance no retrocede
+        percent = 10 + 80 * done // total
+        if percent > last:
+            last = percent
+            await progress("fetching", percent)
+
+    await progress("loading", 10)
+    token = sharding.shard_progress.set(on_shard)
+    try:
+        computed = await _cached_summary(params["from"], params["to"])
+    finally:
+        sharding.shard_progress.reset(token)
+    return {"range": params, "result": computed.summary}
+
+
+async def _save_job_report(job: Dict[str, Any], result: Dict[str, Any]) -> str:
+    """Guarda el resultado de un trabajo en el historial de informes."""
+    payload = ReportCreateRequest.model_validate({
+        "range": {"from": result["range"]["from"], "to": result["range"]["to"]},
+        "result": result["result"],
+        "meta": {"source": "analytics-job", "trigger": job["kind"]},
+    })
+    return await insert_report(payload)
+
+
+jobs.register("rebuild_latest", _rebuild_latest_job)
+jobs.set_report_saver(_save_job_report)
+
+
+def _resolve_window(w: AnalyticsWindow, today: date) -> Tuple[str, str, str]:
+    """(clave, from, to) de una ventana: últimos N días (como rebuild/latest) o rango explícito."""
+    if w.days is not None:
+        if w.from_ or w.to:
+            raise HTTPException(status_code=400, detail="Una ventana usa 'days' o 'from'/'to', no ambos")
+        from_date = (today - timedelta(days=w.days)).strftime("%Y-%m-%d")
+        to_date = today.strftime("%Y-%m-%d")
+        return w.key or f"{w.days}d", from_date, to_date
+
+    if not (w.from_ and w.to):
+        raise HTTPException(status_code=400, detail="Cada ventana necesita 'days' o 'from' y 'to'")
+    from_date = _validate_iso_date(w.from_, "from")
+    to_date = _validate_iso_date(w.to, "to")
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' no puede ser posterior a 'to'")
+    return w.key or f"{from_date}_{to_date}", from_date, to_date
+
+
+def _purge_cached_days(days: List[str]) -> int:
+    """Quita de la caché los rangos que se solapan con los días indicados (y los marca en el índice)."""
+    timeseries_index.mark_stale(days)
+    lo, hi = min(days), max(days)
+    return summary_cache.purge(lambda key: key[0] <= hi and key[1] >= lo)
+
+
+def _validate_range(from_date: str, to_date: str) -> Tuple[str, str]:
+    from_date = _validate_iso_date(from_date, "from")
+    to_date = _validate_iso_date(to_date, "to")
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' no puede ser posterior a 'to'")
+    return from_date, to_date
+
+
+async def _load_index(from_date: str) -> timeseries_index.TimeSeriesIndex:
+    with metrics.stage("index"):
+        return await timeseries_index.get_index(from_date, _range_partials)
+
+
+async def _index_range(from_date: str, to_date: str) -> Tuple[timeseries_index.TimeSeriesIndex, Optional[Tuple[int, int]]]:
+    """
+    Índice acumulado (actualizado) y posiciones del rango pedido dentro de él.
+    Solo pasa por el control de admisión si hay que pedir días para construirlo,
+    ampliarlo o refrescarlo.
+    """
+    span = timeseries_index.pending(from_date)
+    if span is None:
+        index = await _load_index(from_date)
+    else:
+        async with admission.admit("index", admission.range_weight(*span)):
+            index = await _load_index(from_date)
+    return index, index.clamp(from_date, to_date)
+
+
+def _resolve_store_days(payload: DailyStoreRequest) -> List[str]:
+    """Días afectados por una operación de mantenimiento (lista explícita y/o rango)."""
+    days = {_validate_iso_date(d, "dates") for d in payload.dates}
+
+    if payload.from_ or payload.to:
+        if not (payload.from_ and payload.to):
+            raise HTTPException(status_code=400, detail="'from' y 'to' deben indicarse juntos")
+        from_date = _validate_iso_date(payload.from_, "from")
+        to_date = _validate_iso_date(payload.to, "to")
+        if from_date > to_date:
+            raise HTTPException(status_code=400, detail="'from' no puede ser posterior a 'to'")
+        days.update(daily_store.days_between(from_date, to_date))
+
+    if not days:
+        raise HTTPException(status_code=400, detail="Indica 'dates' o un rango 'from'/'to'")
+    return sorted(days)
 
 
 # =========================================================
@@ -238,11 +786,17 @@ def _compute_summary(from_date: str, to_date: str, rows: list) -> Dict[str, Any]
     description=(
         "Calcula un resumen analítico para el rango indicado. "
         "Obtiene los entrenamientos del Core API y devuelve KPIs "
-        "(entrenos, series, reps, volumen) más agregaciones por día y por ejercicio."
+        "(entrenos, series, reps, volumen) más agregaciones por día y por ejercicio. "
+        "La respuesta lleva un ETag (huella de los datos del rango); con If-None-Match "
+        "coincidente se devuelve 304 sin cuerpo. Con el servicio saturado responde 503 con Retry-After."
     ),
     response_model=AnalyticsSummaryResponse,
+    responses={
+        304: {"description": "Sin cambios respecto al ETag indicado"},
+        503: {"description": "Servicio saturado (control de admisión); reintentar tras Retry-After"},
+    },
 )
-def analytics_summary(
+async def analytics_summary(
     from_date: str = Query(
         ...,
         alias="from",
@@ -255,15 +809,23 @@ def analytics_summary(
         description="Fecha fin del rango (YYYY-MM-DD).",
         examples=["2026-01-31"],
     ),
-) -> Dict[str, Any]:
+    if_none_match: Optional[str] = Header(None, include_in_schema=False),
+) -> Response:
     from_date = _validate_iso_date(from_date, "from")
     to_date = _validate_iso_date(to_date, "to")
 
     if from_date > to_date:
         raise HTTPException(status_code=400, detail="'from' no puede ser posterior a 'to'")
 
-    rows = _fetch_rows(from_date, to_date)
-    return _compute_summary(from_date, to_date, rows)
+    computed = await _admitted_summary("summary", from_date, to_date)
+    if http_cache.etag_matches(if_none_match, computed.etag):
+        return http_cache.not_modified(computed.etag, http_cache.SUMMARY_CACHE_CONTROL)
+
+    # El resumen ya tiene la forma de AnalyticsSummaryResponse: se serializa sin revalidar
+    return FastJSONResponse(
+        computed.summary,
+        headers=http_cache.validator_headers(computed.etag, http_cache.SUMMARY_CACHE_CONTROL),
+    )
 
 
 @app.post(
@@ -272,28 +834,286 @@ def analytics_summary(
     summary="Reconstrucción rápida de analíticas (últimos N días)",
     description=(
         "Calcula el rango automáticamente como [hoy - days, hoy] y devuelve el resumen analítico. "
-        "Este endpoint se utiliza normalmente antes de generar el informe PDF en el frontend."
+        "Este endpoint se utiliza normalmente antes de generar el informe PDF en el frontend. "
+        "Con async=true no espera al cálculo: devuelve 202 con el id de un trabajo en segundo plano "
+        "(consultar en /analytics/jobs/{id}); trabajos idénticos pendientes se reutilizan."
     ),
     response_model=AnalyticsRebuildLatestResponse,
+    responses={
+        202: {"model": JobAcceptedResponse, "description": "Trabajo encolado (async=true)"},
+        503: {"description": "Servicio saturado (control de admisión o cola de trabajos llena)"},
+    },
 )
-def analytics_rebuild_latest(
+async def analytics_rebuild_latest(
     days: int = Query(
         90,
         ge=1,
         le=3650,
         description="Número de días hacia atrás a incluir en el rango.",
         examples=[7, 30, 90],
-    )
-) -> Dict[str, Any]:
-    to_d = date.today()
-    from_d = to_d - timedelta(days=days)
-
-    from_date = from_d.strftime("%Y-%m-%d")
-    to_date = to_d.strftime("%Y-%m-%d")
+    ),
+    async_job: bool = Query(False, alias="async", description="Ejecutar como trabajo en segundo plano."),
+    save_report: bool = Query(
+        False, description="Con async=true, guardar el resultado en el historial de informes al terminar."
+    ),
+) -> FastJSONResponse:
+    from_date, to_date = _latest_range(days)
 
-    rows = _fetch_rows(from_date, to_date)
+    if async_job:
+        try:
+            job_id, deduplicated = await jobs.submit(
+                "rebuild_latest",
+                f"rebuild_latest:{from_date}:{to_date}",
+                {"from": from_date, "to": to_date, "days": days},
+                save_report=save_report,
+            )
+        except jobs.JobQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        location = f"/analytics/jobs/{job_id}"
+        return FastJSONResponse(
+            {"job_id": job_id, "status": jobs.QUEUED, "deduplicated": deduplicated, "location": location},
+            status_code=202,
+            headers={"Location": location},
+        )
 
-    return {
+    return FastJSONResponse({
         "range": {"from": from_date, "to": to_date, "days": days},
-        "result": _compute_summary(from_date, to_date, rows),
-    }
+        "result": (await _admitted_summary("rebuild", from_date, to_date)).summary,
+    })
+
+
+@app.post(
+    "/analytics/summary/batch",
+    tags=["analytics"],
+    summary="Resumen analítico de varias ventanas a la vez",
+    description=(
+        "Calcula en una sola llamada los resúmenes de varias ventanas (últimos N días y/o rangos explícitos). "
+        "Los datos del rango unión se obtienen una única vez y se agregan en una sola pasada; "
+        "la respuesta devuelve un resumen por ventana, indexado por su clave (p.ej. '7d', '30d')."
+    ),
+    response_model=AnalyticsBatchResponse,
+    responses={503: {"description": "Servicio saturado (control de admisión); reintentar tras Retry-After"}},
+)
+async def analytics_summary_batch(payload: AnalyticsBatchRequest) -> FastJSONResponse:
+    today = date.today()
+    windows: Dict[str, Tuple[str, str]] = {}
+    for w in payload.windows:
+        key, from_date, to_date = _resolve_window(w, today)
+        if key in windows and windows[key] != (from_date, to_date):
+            raise HTTPException(status_code=400, detail=f"Clave de ventana duplicada: '{key}'")
+        windows[key] = (from_date, to_date)
+
+    union_from = min(f for f, _ in windows.values())
+    union_to = max(t for _, t in windows.values())
+    # Como en _admitted_summary: solo cuentan para la admisión las ventanas que generan trabajo
+    work = [rng for rng in windows.values() if not summary_cache.available(rng)]
+    if not work:
+        results = await _summarize_windows(windows)
+    else:
+        weight = admission.range_weight(min(f for f, _ in work), max(t for _, t in work))
+        async with admission.admit("batch", weight):
+            results = await _summarize_windows(windows)
+    return FastJSONResponse({
+        "range": {"from": union_from, "to": union_to},
+        "results": results,
+    })
+
+
+@app.get(
+    "/analytics/trends/volume",
+    tags=["analytics"],
+    summary="Evolución del volumen por semana o mes",
+    description=(
+        "Totales (entrenos, series, reps, volumen) del rango agrupados por día, semana (lunes a domingo) o mes. "
+        "Se responden desde el índice acumulado del historial: cada cubo es una resta de sumas prefijas."
+    ),
+    response_model=TrendVolumeResponse,
+    responses={503: {"description": "Servicio saturado (control de admisión); reintentar tras Retry-After"}},
+)
+async def analytics_trends_volume(
+    from_date: str = Query(..., alias="from", description="Fecha inicio del rango (YYYY-MM-DD).", examples=["2026-01-01"]),
+    to_date: str = Query(..., alias="to", description="Fecha fin del rango (YYYY-MM-DD).", examples=["2026-06-30"]),
+    bucket: str = Query("week", pattern="^(day|week|month)$", description="Agrupación: day, week o month."),
+) -> FastJSONResponse:
+    from_date, to_date = _validate_range(from_date, to_date)
+    index, span = await _index_range(from_date, to_date)
+
+    total: Dict[str, Any] = {"workouts": 0, "sets": 0, "reps": 0, "volume": 0.0}
+    buckets: List[Dict[str, Any]] = []
+    if span is not None:
+        total = index.totals(*span)
+        buckets = index.buckets(*span, bucket)
+
+    return FastJSONResponse({"from": from_date, "to": to_date, "bucket": bucket, "total": total, "buckets": buckets})
+
+
+@app.get(
+    "/analytics/trends/exercise",
+    tags=["analytics"],
+    summary="Serie temporal de un ejercicio",
+    description=(
+        "Series, reps, volumen, peso máximo y mejor serie (peso x reps) de un ejercicio por día, semana o mes. "
+        "Los cubos sin series del ejercicio se omiten."
+    ),
+    response_model=ExerciseTrendResponse,
+    responses={503: {"description": "Servicio saturado (control de admisión); reintentar tras Retry-After"}},
+)
+async def analytics_trends_exercise(
+    name: str = Query(..., min_length=1, description="Nombre del ejercicio.", examples=["Press banca"]),
+    from_date: str = Query(..., alias="from", description="Fecha inicio del rango (YYYY-MM-DD).", examples=["2026-01-01"]),
+    to_date: str = Query(..., alias="to", description="Fecha fin del rango (YYYY-MM-DD).", examples=["2026-06-30"]),
+    bucket: str = Query("week", pattern="^(day|week|month)$", description="Agrupación: day, week o month."),
+) -> FastJSONResponse:
+    from_date, to_date = _validate_range(from_date, to_date)
+    index, span = await _index_range(from_date, to_date)
+    buckets = index.exercise_buckets(name, *span, bucket) if span is not None else []
+    return FastJSONResponse({"from": from_date, "to": to_date, "exercise": name, "bucket": bucket, "buckets": buckets})
+
+
+@app.get(
+    "/analytics/records",
+    tags=["analytics"],
+    summary="Marcas y récords personales",
+    description=(
+        "Por ejercicio: peso máximo y mejor serie dentro del rango (con su fecha) y los récords personales "
+        "(superan todo lo anterior del historial) conseguidos en el rango."
+    ),
+    response_model=RecordsResponse,
+    responses={503: {"description": "Servicio saturado (control de admisión); reintentar tras Retry-After"}},
+)
+async def analytics_records(
+    from_date: str = Query(..., alias="from", description="Fecha inicio del rango (YYYY-MM-DD).", examples=["2026-01-01"]),
+    to_date: str = Query(..., alias="to", description="Fecha fin del rango (YYYY-MM-DD).", examples=["2026-06-30"]),
+    name: Optional[str] = Query(None, description="Limitar a un ejercicio."),
+) -> FastJSONResponse:
+    from_date, to_date = _validate_range(from_date, to_date)
+    index, span = await _index_range(from_date, to_date)
+    records = index.records(*span, [name] if name else None) if span is not None else []
+    return FastJSONResponse({"from": from_date, "to": to_date, "records": records})
+
+
+@app.get(
+    "/analytics/distribution",
+    tags=["analytics"],
+    summary="Distribución de peso, repeticiones e intensidad",
+    description=(
+        "Percentiles (p50-p99) del peso y las reps por serie, series por tramo de intensidad "
+        "(% del peso máximo del ejercicio en el rango), zonas de repeticiones y ejercicios distintos "
+        "(estimación HyperLogLog), del rango y por ejercicio. Se calculan mezclando los sketches "
+        "guardados por día, sin volver a recorrer las filas; los percentiles tienen un error relativo "
+        "de como mucho un 1%."
+    ),
+    response_model=DistributionResponse,
+    responses={503: {"description": "Servicio saturado (control de admisión); reintentar tras Retry-After"}},
+)
+async def analytics_distribution(
+    from_date: str = Query(..., alias="from", description="Fecha inicio del rango (YYYY-MM-DD).", examples=["2026-01-01"]),
+    to_date: str = Query(..., alias="to", description="Fecha fin del rango (YYYY-MM-DD).", examples=["2026-06-30"]),
+    exercise: Optional[str] = Query(None, min_length=1, description="Limitar a un ejercicio."),
+    limit: int = Query(20, ge=1, le=200, description="Ejercicios como máximo en by_exercise (los de más series)."),
+) -> FastJSONResponse:
+    from_date, to_date = _validate_range(from_date, to_date)
+    async with admission.admit("distribution", admission.range_weight(from_date, to_date)):
+        partials = await _range_partials(from_date, to_date)
+    with metrics.stage("distribution"):
+        result = summarize_distribution(from_date, to_date, partials, exercise, limit)
+    return FastJSONResponse(result)
+
+
+@app.get(
+    "/analytics/jobs/{job_id}",
+    tags=["analytics"],
+    summary="Estado de un trabajo en segundo plano",
+    description=(
+        "Devuelve estado, progreso y, al terminar, el resultado (o el error) de un trabajo. "
+        "Con wait=N (long-poll) la respuesta espera hasta N segundos a que el trabajo termine."
+    ),
+    response_model=JobResponse,
+)
+async def analytics_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=jobs.JOB_MAX_WAIT_SECONDS, description="Segundos de espera máxima (long-poll)."),
+) -> FastJSONResponse:
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+    doc = await jobs.get(job_id, wait)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return FastJSONResponse(jobs.view(doc))
+
+
+@app.post(
+    "/analytics/admin/daily/invalidate",
+    tags=["admin"],
+    summary="Invalidar parciales diarios",
+    description=(
+        "Elimina del almacén los parciales de los días indicados (lista de fechas y/o rango). "
+        "La siguiente consulta que los incluya los volverá a pedir al Core API."
+    ),
+    response_model=DailyStoreResponse,
+)
+async def admin_daily_invalidate(payload: DailyStoreRequest) -> DailyStoreResponse:
+    days = _resolve_store_days(payload)
+    deleted = await daily_store.invalidate(days)
+    _purge_cached_days(days)
+    return DailyStoreResponse(ok=True, days=len(days), affected=deleted)
+
+
+@app.post(
+    "/analytics/admin/daily/rebuild",
+    tags=["admin"],
+    summary="Reconstruir parciales diarios",
+    description=(
+        "Vuelve a pedir al Core API los días indicados y guarda sus parciales. "
+        "Los días más recientes (no cerrados) se calculan pero no se guardan."
+    ),
+    response_model=DailyStoreResponse,
+)
+async def admin_daily_rebuild(payload: DailyStoreRequest) -> DailyStoreResponse:
+    days = _resolve_store_days(payload)
+    saved = await daily_store.rebuild(days, _fetch_partials)
+    _purge_cached_days(days)
+    return DailyStoreResponse(ok=True, days=len(days), affected=saved)
+
+
+@app.get(
+    "/analytics/admin/cache",
+    tags=["admin"],
+    summary="Estadísticas de la caché de resúmenes",
+    description="Devuelve ocupación y contadores de aciertos, fallos y peticiones agrupadas (single-flight).",
+    response_model=CacheStatsResponse,
+)
+async def admin_cache_stats() -> CacheStatsResponse:
+    return CacheStatsResponse(**summary_cache.stats())
+
+
+@app.get(
+    "/analytics/admin/admission",
+    tags=["admin"],
+    summary="Estado del control de admisión",
+    description=(
+        "Por endpoint: límite (en unidades de peso), ocupación, peticiones en cola y contadores de "
+        "admitidas y rechazadas (cola llena / espera agotada), para dimensionar la capacidad."
+    ),
+    response_model=AdmissionStatsResponse,
+)
+async def admin_admission_stats() -> AdmissionStatsResponse:
+    return AdmissionStatsResponse(**admission.stats())
+
+
+@app.delete(
+    "/analytics/admin/cache",
+    tags=["admin"],
+    summary="Vaciar la caché de resúmenes",
+    description="Elimina todos los resúmenes cacheados, o solo los que se solapan con el rango 'from'/'to' si se indica.",
+    response_model=CachePurgeResponse,
+)
+async def admin_cache_purge(
+    from_date: Optional[str] = Query(None, alias="from", description="Inicio del rango a purgar (YYYY-MM-DD)."),
+    to_date: Optional[str] = Query(None, alias="to", description="Fin del rango a purgar (YYYY-MM-DD)."),
+) -> CachePurgeResponse:
+    if from_date is None and to_date is None:
+        return CachePurgeResponse(ok=True, purged=summary_cache.purge())
+
+    payload = DailyStoreRequest.model_validate({"from": from_date, "to": to_date})
+    return CachePurgeResponse(ok=True, purged=_purge_cached_days(_resolve_store_days(payload)))
@@ -0,0 +1,318 @@
+# metrics.py
+import bisect
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# =========================================================
+# Config
+# =========================================================
+# Instrumentación en caliente (histogramas + Server-Timing). Con 0 todo es no-op
+METRICS_ENABLED = os.getenv("ANALYTICS_METRICS", "1") == "1"
+# Cabecera Server-Timing en cada respuesta (visible en las devtools del navegador)
+SERVER_TIMING_ENABLED = os.getenv("ANALYTICS_SERVER_TIMING", "1") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (0, 100, 1000, 10_000, 50_000, 100_000, 500_000, 1_000_000)
+
+LabelKey = Tuple[str, ...]
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        if not self.labels and not self.values:
+            lines.append(f"{self.name} 0")
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_num(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        self.values[label_values] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if not self.labels and not self.values:
+            lines.append(f"{self.name} 0")
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Por etiquetas: [cuentas por bucket (no acumuladas)..., +Inf], suma
+        self.series: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        entry = self.series.get(label_values)
+        if entry is None:
+            entry = self.series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _num(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_num(total[0])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def _labels(names: Tuple[str, ...], values: LabelKey) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+# =========================================================
+# Métricas del servicio
+# =========================================================
+REQUEST_SECONDS = Histogram(
+    "analytics_request_seconds", "Latencia de las peticiones HTTP por endpoint.", ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "analytics_stage_seconds", "Tiempo por etapa y petición, por endpoint.", ("endpoint", "stage")
+)
+MONGO_SECONDS = Histogram("analytics_mongo_seconds", "Tiempo de las operaciones de MongoDB.", ("op",))
+ROWS_PER_REQUEST = Histogram(
+    "analytics_rows_per_request", "Filas recibidas del Core API por petición.", (), ROWS_BUCKETS
+)
+UPSTREAM_RESPONSES = Counter(
+    "analytics_upstream_responses_total", "Respuestas del Core API por código de estado.", ("status",)
+)
+UPSTREAM_ERRORS = Counter(
+    "analytics_upstream_errors_total", "Errores de transporte hacia el Core API por tipo.", ("error",)
+)
+UPSTREAM_RETRIES = Counter("analytics_upstream_retries_total", "Reintentos de peticiones al Core API.")
+ADMISSION_IN_USE = Gauge(
+    "analytics_admission_in_use", "Unidades de peso ocupadas por peticiones admitidas.", ("endpoint",)
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "analytics_admission_queue_depth", "Peticiones esperando turno de admisión.", ("endpoint",)
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "analytics_admission_wait_seconds", "Espera en cola de las peticiones admitidas.", ("endpoint",)
+)
+ADMISSION_REJECTIONS = Counter(
+    "analytics_admission_rejections_total", "Peticiones rechazadas por saturación.", ("endpoint", "reason")
+)
+
+REGISTRY = (
+    REQUEST_SECONDS,
+    STAGE_SECONDS,
+    MONGO_SECONDS,
+    ROWS_PER_REQUEST,
+    UPSTREAM_RESPONSES,
+    UPSTREAM_ERRORS,
+    UPSTREAM_RETRIES,
+    ADMISSION_IN_USE,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_WAIT_SECONDS,
+    ADMISSION_REJECTIONS,
+)
+
+
+def render() -> str:
+    """Todas las métricas en formato de texto de Prometheus."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# =========================================================
+# Contexto por petición (tiempos para Server-Timing y filas)
+# =========================================================
+class RequestTimings:
+    __slots__ = ("stages", "rows")
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+        self.rows = 0
+
+
+# Endpoint de las etapas medidas fuera de una petición HTTP
+BACKGROUND_ENDPOINT = "background"
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("analytics_request_timings", default=None)
+
+
+class _Timer:
+    """
+    Cronometra un bloque y lo suma al acumulado de la petición en curso (que el middleware
+    vuelca en el histograma de etapas al terminar, con su endpoint). Fuera de una petición
+    (trabajos, tareas de fondo), se observa directamente con el endpoint 'background'.
+    """
+
+    __slots__ = ("histogram", "label", "timing_name", "t0")
+
+    def __init__(self, histogram: Optional[Histogram], label: str, timing_name: str) -> None:
+        self.histogram = histogram
+        self.label = label
+        self.timing_name = timing_name
+
+    def __enter__(self) -> "_Timer":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self.t0
+        if self.histogram is not None:
+            self.histogram.observe(elapsed, self.label)
+        timings = _current.get()
+        if timings is not None:
+            timings.stages[self.timing_name] = timings.stages.get(self.timing_name, 0.0) + elapsed
+        else:
+            STAGE_SECONDS.observe(elapsed, BACKGROUND_ENDPOINT, self.timing_name)
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopTimer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NOOP = _NoopTimer()
+
+
+def stage(name: str):
+    """
+    `with metrics.stage("decode"): ...` — tiempo de una etapa del camino caliente.
+    En etapas concurrentes (p.ej. trozos del Core API en paralelo) el acumulado suma todas.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Timer(None, name, name)
+
+
+def mongo(op: str):
+    """`with metrics.mongo("find"): await ...` — operación de MongoDB (Server-Timing: 'mongo')."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Timer(MONGO_SECONDS, op, "mongo")
+
+
+def add_rows(n: int) -> None:
+    if not METRICS_ENABLED:
+        return
+    timings = _current.get()
+    if timings is not None:
+        timings.rows += n
+
+
+def upstream_response(status: int) -> None:
+    if METRICS_ENABLED:
+        UPSTREAM_RESPONSES.inc(str(status))
+
+
+def upstream_error(error: BaseException) -> None:
+    if METRICS_ENABLED:
+        UPSTREAM_ERRORS.inc(type(error).__name__)
+
+
+def upstream_retry() -> None:
+    if METRICS_ENABLED:
+        UPSTREAM_RETRIES.inc()
+
+
+def admission_state(endpoint: str, in_use: int, queued: int) -> None:
+    if METRICS_ENABLED:
+        ADMISSION_IN_USE.set(in_use, endpoint)
+        ADMISSION_QUEUE_DEPTH.set(queued, endpoint)
+
+
+def admission_wait(endpoint: str, seconds: float) -> None:
+    if METRICS_ENABLED:
+        ADMISSION_WAIT_SECONDS.observe(seconds, endpoint)
+
+
+def admission_rejected(endpoint: str, reason: str) -> None:
+    if METRICS_ENABLED:
+        ADMISSION_REJECTIONS.inc(endpoint, reason)
+
+
+def _server_timing(timings: RequestTimings, total: float) -> bytes:
+    parts = [f"{name};dur={value * 1000:.2f}" for name, value in timings.stages.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro: mide cada petición HTTP, abre el contexto de tiempos por etapa
+    y añade la cabecera Server-Timing. Desactivado, delega directamente en la app.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if not METRICS_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(timings, time.perf_counter() - t0)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            # Plantilla de la ruta (no la URL) para no disparar la cardinalidad
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, scope["method"], route, str(status))
+            for name, elapsed in timings.stages.items():
+                STAGE_SECONDS.observe(elapsed, route, name)
+            if timings.rows:
+                ROWS_PER_REQUEST.observe(timings.rows)
@@ -0,0 +1,151 @@
+# migrate_report_results.py
+"""
+Migra los informes con el resultado embebido al almacenamiento direccionado por contenido
+(report_results + result_ref). Es idempotente: los informes ya migrados se ignoran.
+También pasa by_exercise de los resultados antiguos (en columnas, a veces dentro de series_z)
+a la forma [{exercise, volume}] sin comprimir que leen los pipelines de estadísticas del historial.
+
+Uso (desde src/analytics-api-fastapi, con MONGO_URL/MONGO_DB del entorno):
+    python migrate_report_results.py --dry-run
+    python migrate_report_results.py --batch-size 500
+"""
+import argparse
+import asyncio
+import json
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from bson import Binary
+from pymongo import UpdateOne
+
+import report_store
+from db_mongo import get_db
+from reports_router import COLLECTION
+
+PENDING = {"result_ref": {"$exists": False}, "result": {"$type": "object"}}
+# Resultados con by_exercise aún en columnas (dentro de series_z o sin comprimir)
+PENDING_LIFT = {"by_exercise": {"$not": {"$type": "array"}}}
+
+
+def _round_trips(result: Dict[str, Any]) -> bool:
+    """Comprueba que el formato compacto reproduce exactamente las series originales."""
+    h = report_store.result_hash(result)
+    rebuilt = report_store.expand_result(report_store._result_to_doc(h, result))
+    return (
+        rebuilt["by_day"] == (result.get("by_day") or [])
+        and rebuilt["by_exercise"] == (result.get("by_exercise") or [])
+    )
+
+
+async def _migrate_batch(docs: List[dict], dry_run: bool) -> Dict[str, int]:
+    stats = {"migrated": 0, "skipped": 0}
+    by_hash: Dict[str, List[dict]] = defaultdict(list)
+
+    for doc in docs:
+        res = doc.get("result")
+        if not report_store.is_compactable(res) or not _round_trips(res):
+            stats["skipped"] += 1
+            continue
+        by_hash[report_store.result_hash(res)].append(doc)
+
+    if dry_run:
+        stats["migrated"] = sum(len(v) for v in by_hash.values())
+        stats["results"] = len(by_hash)
+        return stats
+
+    coll = get_db()[COLLECTION]
+    results = get_db()[report_store.RESULTS_COLLECTION]
+    for h, group in by_hash.items():
+        # Primero el resultado compartido, para que ningún informe apunte a algo inexistente
+        await report_store.store_result(group[0]["result"], refs=len(group))
+        ops = [
+            UpdateOne(
+                {"_id": d["_id"], "result_ref": {"$exists": False}},
+                {"$set": {"result": report_store.inline_part(d["result"]), "result_ref": h}},
+            )
+            for d in group
+        ]
+        res = await coll.bulk_write(ops, ordered=False)
+        # Informes modificados entre la lectura y la escritura: no cuentan como referencia
+        if res.modified_count < len(group):
+            await results.update_one({"_id": h}, {"$inc": {"refs": res.modified_count - len(group)}})
+        stats["migrated"] += res.modified_count
+        stats["skipped"] += len(group) - res.modified_count
+
+    stats["results"] = len(by_hash)
+    return stats
+
+
+async def migrate(batch_size: int, dry_run: bool) -> Dict[str, int]:
+    totals = {"migrated": 0, "skipped": 0, "results": 0}
+    last_id = None
+    while True:
+        query = dict(PENDING)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await get_db()[COLLECTION].find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        stats = await _migrate_batch(docs, dry_run)
+        for k, v in stats.items():
+            totals[k] += v
+        print(f"... {totals['migrated']} migrados, {totals['skipped']} omitidos")
+
+    return totals
+
+
+async def lift_exercises(batch_size: int, dry_run: bool) -> int:
+    results = get_db()[report_store.RESULTS_COLLECTION]
+    lifted = 0
+    last_id = None
+    while True:
+        query = dict(PENDING_LIFT)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await results.find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        ops = []
+        for doc in docs:
+            update: Dict[str, Any] = {}
+            if doc.get("series_z") is not None:
+                series = json.loads(zlib.decompress(doc["series_z"]))
+                columns = series.pop("by_exercise", None) or {}
+                raw = json.dumps(series, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+                update["series_z"] = Binary(zlib.compress(raw, report_store.REPORT_RESULTS_COMPRESS_LEVEL))
+            else:
+                columns = doc.get("by_exercise") or {}
+            update["by_exercise"] = report_store._exercise_items(columns)
+            ops.append(UpdateOne({"_id": doc["_id"], **PENDING_LIFT}, {"$set": update}))
+        if dry_run:
+            lifted += len(ops)
+        else:
+            lifted += (await results.bulk_write(ops, ordered=False)).modified_count
+    return lifted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Migra informes a resultados direccionados por contenido")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Solo cuenta lo que se migraría")
+    args = parser.parse_args()
+
+    async def run():
+        return await migrate(args.batch_size, args.dry_run), await lift_exercises(args.batch_size, args.dry_run)
+
+    totals, lifted = asyncio.run(run())
+    print(
+        f"Informes migrados: {totals['migrated']} | omitidos: {totals['skipped']} | "
+        f"resultados distintos (por lote): {totals['results']} | "
+        f"resultados con by_exercise extraído: {lifted}"
+        + (" [dry-run]" if args.dry_run else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# offload.py
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Mapping, Optional
+
+import wire_format
+from aggregation import DayPartial, SummaryAccumulator
+
+# =========================================================
+# Config
+# =========================================================
+# Procesos para agregaciones grandes (0 = todo en el proceso de la API)
+OFFLOAD_WORKERS = int(os.getenv("ANALYTICS_OFFLOAD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Respuestas del Core API con al menos N filas se agregan en el pool; el resto, en línea
+OFFLOAD_MIN_ROWS = int(os.getenv("ANALYTICS_OFFLOAD_MIN_ROWS", "50000"))
+# Sin X-Row-Count, las respuestas de al menos N bytes (Content-Length) se leen enteras para
+# contar sus filas; por debajo se procesan en streaming (por defecto, ~64 bytes por fila)
+OFFLOAD_MIN_BYTES = int(os.getenv("ANALYTICS_OFFLOAD_MIN_BYTES", str(OFFLOAD_MIN_ROWS * 64)))
+# Trabajos enviados al pool a la vez como máximo (el resto espera su turno)
+OFFLOAD_MAX_PENDING = int(os.getenv("ANALYTICS_OFFLOAD_MAX_PENDING", str(max(OFFLOAD_WORKERS, 1) * 4)))
+
+# En el formato de filas, cada fila lleva exactamente una clave "workout_id" (dentro de un
+# string JSON las comillas van escapadas, así que no puede haber falsos positivos)
+ROW_MARKER = b'"workout_id"'
+
+logger = logging.getLogger("analytics")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def enabled() -> bool:
+    return _pool is not None
+
+
+def should_offload(headers: Mapping[str, str]) -> bool:
+    """
+    Decide con las cabeceras, antes de leer el cuerpo, si la respuesta puede ir al pool:
+    por las filas que declara el Core API (X-Row-Count) o, si no las declara, por su tamaño.
+    Sin ninguna de las dos no se lee entero un cuerpo que puede procesarse en streaming.
+    """
+    declared = headers.get("x-row-count")
+    if declared and declared.isdigit():
+        return int(declared) >= OFFLOAD_MIN_ROWS
+    length = headers.get("content-length")
+    if length and length.isdigit():
+        return int(length) >= OFFLOAD_MIN_BYTES
+    return False
+
+
+def count_rows(body: bytes, declared: Optional[str] = None) -> int:
+    """Filas del payload: la cabecera X-Row-Count del Core API si viene; si no, se cuentan en el cuerpo."""
+    if declared and declared.isdigit():
+        return int(declared)
+    return body.count(ROW_MARKER)
+
+
+def aggregate_payload(body: bytes) -> Dict[str, DayPartial]:
+    """
+    Decodifica y agrega un payload completo de /analytics/workouts (columnar o filas).
+    Es lo que ejecuta cada proceso del pool: recibe los bytes tal cual llegaron del
+    Core API (la forma más compacta de pasar las filas) y devuelve solo los parciales por día.
+    """
+    payload = json.loads(body)
+    acc = SummaryAccumulator()
+    wire_format.add_payload(acc, payload)
+    return acc.days
+
+
+def _build_pool() -> ProcessPoolExecutor:
+    # 'spawn': el proceso de la API tiene hilos (Motor), así que no es seguro hacer fork
+    return ProcessPoolExecutor(max_workers=OFFLOAD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def start_pool() -> None:
+    """Crea el pool (se llama desde el lifespan de la app)."""
+    global _pool, _slots
+    if OFFLOAD_WORKERS <= 0 or _pool is not None:
+        return
+    _pool = _build_pool()
+    _slots = asyncio.Semaphore(max(OFFLOAD_MAX_PENDING, 1))
+
+
+def shutdown_pool() -> None:
+    global _pool, _slots
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _slots = None
+
+
+async def aggregate(body: bytes) -> Dict[str, DayPartial]:
+    """
+    Agrega `body` en el pool. Si un proceso muere, el pool se recrea y este
+    trabajo se hace en línea para no perder la petición.
+    """
+    global _pool
+    pool, slots = _pool, _slots
+    if pool is None or slots is None:
+        return aggregate_payload(body)
+
+    async with slots:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, aggregate_payload, body)
+        except BrokenProcessPool:
+            logger.warning("Pool de agregación caído; se recrea y se agrega en línea")
+            if _pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                _pool = _build_pool()
+            return aggregate_payload(body)
@@ -0,0 +1,351 @@
+# report_retention.py
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+import metrics
+import report_store
+from db_mongo import get_db
+
+# Historial de informes (lo usa también reports_router), los informes compactados y sus
+# resúmenes mensuales
+REPORTS_COLLECTION = "report_generations"
+ARCHIVE_COLLECTION = "report_archive"
+ROLLUPS_COLLECTION = "report_rollups"
+
+# =========================================================
+# Config
+# =========================================================
+# Los informes generados hace más de N días se archivan y se resumen por mes (0 = nunca)
+REPORTS_RETENTION_DAYS = int(os.getenv("REPORTS_RETENTION_DAYS", "180"))
+# Cada cuánto se ejecuta la compactación en segundo plano (0 = solo bajo demanda)
+REPORTS_ROLLUP_INTERVAL_SECONDS = float(os.getenv("REPORTS_ROLLUP_INTERVAL_SECONDS", "3600"))
+# Horas que sigue el informe original tras compactarse, antes de que lo borre el índice TTL
+REPORTS_ROLLUP_GRACE_HOURS = float(os.getenv("REPORTS_ROLLUP_GRACE_HOURS", "24"))
+REPORTS_ROLLUP_BATCH_SIZE = int(os.getenv("REPORTS_ROLLUP_BATCH_SIZE", "500"))
+# Días que sigue un informe compactado en el archivo tras acabar su mes; después solo queda
+# en el resumen mensual (0 = siempre)
+REPORTS_ARCHIVE_RETENTION_DAYS = int(os.getenv("REPORTS_ARCHIVE_RETENTION_DAYS", "730"))
+
+# Informes aún no compactados (los compactados esperan a que los borre el TTL)
+RAW = {"rolled_up_at": {"$exists": False}}
+# Lo que se archiva de cada informe: lo del listado y el detalle sin las series por día
+# (la parte grande) ni el PDF; el resultado compartido (report_results) se suelta
+ARCHIVE_FIELDS = ("_id", "meta", "range", "version")
+ARCHIVE_RESULT_FIELDS = ("from", "to", "summary", "by_exercise")
+# El mismo orden (e índice) que el listado del historial
+ARCHIVE_SORT = [("meta.generated_at", DESCENDING), ("_id", DESCENDING)]
+# Un lote marcado hace más de N s sin terminar es de una compactación caída: se retoma
+ROLLUP_STALE_SECONDS = 600
+
+logger = logging.getLogger("analytics")
+
+_task: Optional[asyncio.Task] = None
+
+
+def enabled() -> bool:
+    return REPORTS_RETENTION_DAYS > 0
+
+
+def cutoff() -> str:
+    """Primer día (YYYY-MM-DD) que se conserva sin compactar."""
+    return (datetime.now(timezone.utc) - timedelta(days=REPORTS_RETENTION_DAYS)).strftime("%Y-%m-%d")
+
+
+async def ensure_indexes() -> None:
+    # Los informes compactados caducan solos (expires_at solo se fija al compactar)
+    await get_db()[REPORTS_COLLECTION].create_index("expires_at", name="rollup_expires_ttl", expireAfterSeconds=0)
+    await get_db()[ARCHIVE_COLLECTION].create_index(ARCHIVE_SORT, name="generated_at_desc")
+    # El archivo también caduca (por meses enteros, ver _archive_expiry); quedan los resúmenes
+    await get_db()[ARCHIVE_COLLECTION].create_index("expires_at", name="archive_expires_ttl", expireAfterSeconds=0)
+
+
+def _next_month(month: str) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+def _archive_expiry(month: str) -> Optional[datetime]:
+    """
+    Caducidad en el archivo de los informes de un mes: REPORTS_ARCHIVE_RETENTION_DAYS días
+    tras acabar el mes, igual para todo el mes (así el resumen del mes se puede recalcular
+    mientras quede alguno). None si el archivo no caduca.
+    """
+    if REPORTS_ARCHIVE_RETENTION_DAYS <= 0:
+        return None
+    month_end = datetime.strptime(_next_month(month), "%Y-%m").replace(tzinfo=timezone.utc)
+    return month_end + timedelta(days=REPORTS_ARCHIVE_RETENTION_DAYS)
+
+
+def _archived(month: str, now: datetime) -> bool:
+    """Los informes del mes siguen en el archivo (su resumen se recalcula desde él)."""
+    expiry = _archive_expiry(month)
+    return expiry is None or expiry > now
+
+
+def _summary_value(entry: dict, key: str) -> float:
+    return ((entry.get("result") or {}).get("summary") or {}).get(key) or 0
+
+
+def _entry(doc: dict, stored: Optional[Dict[str, Any]]) -> dict:
+    """Copia archivada de un informe: ARCHIVE_FIELDS y el resultado sin by_day."""
+    result = {**(stored or {}), **(doc.get("result") or {})}
+    entry = {k: doc[k] for k in ARCHIVE_FIELDS if k in doc}
+    entry["result"] = {k: result[k] for k in ARCHIVE_RESULT_FIELDS if result.get(k) is not None}
+    expiry = _archive_expiry(doc["meta"]["generated_at"][:7])
+    if expiry is not None:
+        entry["expires_at"] = expiry
+    return entry
+
+
+async def _archive(entries: List[dict]) -> None:
+    """Copia los informes al archivo; idempotente (un informe ya archivado no se toca)."""
+    if not entries:
+        return
+    ops = [UpdateOne({"_id": e["_id"]}, {"$setOnInsert": e}, upsert=True) for e in entries]
+    with metrics.mongo("report_archive.bulk_write"):
+        await get_db()[ARCHIVE_COLLECTION].bulk_write(ops, ordered=False)
+
+
+async def _add_to_rollups(entries: List[dict]) -> None:
+    """Suma informes a los resúmenes de sus meses (los de meses que ya no están en el archivo)."""
+    rollups = get_db()[ROLLUPS_COLLECTION]
+    now = datetime.now(timezone.utc)
+    for entry in entries:
+        generated_at = entry["meta"]["generated_at"]
+        with metrics.mongo("report_rollups.update_one"):
+            await rollups.update_one(
+                {"_id": generated_at[:7]},
+                {
+                    "$inc": {
+                        "reports": 1,
+                        "total_volume": _summary_value(entry, "total_volume"),
+                        "total_sets": _summary_value(entry, "sets"),
+                        "total_reps": _summary_value(entry, "total_reps"),
+                    },
+                    "$min": {"first_generated_at": generated_at},
+                    "$max": {"last_generated_at": generated_at},
+                    "$set": {"updated_at": now},
+                },
+                upsert=True,
+            )
+
+
+async def _refresh_months(months: Iterable[str]) -> None:
+    """
+    Recalcula los resúmenes de esos meses desde el archivo (por el índice de generated_at).
+    Recalcular en lugar de incrementar hace que repetir una compactación a medias, o dos a
+    la vez, no descuadre los totales. Los meses que ya caducaron del archivo no se tocan:
+    su resumen es lo único que queda de ellos.
+    """
+    archive = get_db()[ARCHIVE_COLLECTION]
+    rollups = get_db()[ROLLUPS_COLLECTION]
+    now = datetime.now(timezone.utc)
+    for month in sorted(m for m in set(months) if _archived(m, now)):
+        pipeline = [
+            {"$match": {"meta.generated_at": {"$gte": month, "$lt": _next_month(month)}}},
+            {"$group": {
+                "_id": None,
+                "reports": {"$sum": 1},
+                "total_volume": {"$sum": "$result.summary.total_volume"},
+                "total_sets": {"$sum": "$result.summary.sets"},
+                "total_reps": {"$sum": "$result.summary.total_reps"},
+                "first_generated_at": {"$min": "$meta.generated_at"},
+                "last_generated_at": {"$max": "$meta.generated_at"},
+            }},
+        ]
+        with metrics.mongo("report_archive.aggregate"):
+            rows = await archive.aggregate(pipeline).to_list(length=1)
+        if not rows or not rows[0]["reports"]:
+            with metrics.mongo("report_rollups.delete_one"):
+                await rollups.delete_one({"_id": month})
+            continue
+        totals = {k: v for k, v in rows[0].items() if k != "_id"}
+        with metrics.mongo("report_rollups.update_one"):
+            await rollups.update_one({"_id": month}, {"$set": {**totals, "updated_at": now}}, upsert=True)
+
+
+async def _claim(query: dict, token: ObjectId, now: datetime) -> List[dict]:
+    """
+    Marca como compactados los informes de `query` (un lote) y devuelve los que marcó esta
+    llamada. Marcar es lo primero: un informe borrado antes ya no se marca, y uno borrado
+    después se descarta al archivar (ver _compact_batch). La referencia a report_results
+    pasa a rollup_ref: desde aquí la suelta la compactación, no el borrado.
+    """
+    reports = get_db()[REPORTS_COLLECTION]
+    with metrics.mongo("report_generations.find"):
+        ids = [d["_id"] for d in await reports.find(query, {"_id": 1}).sort("_id", 1)
+               .limit(REPORTS_ROLLUP_BATCH_SIZE).to_list(length=REPORTS_ROLLUP_BATCH_SIZE)]
+    if not ids:
+        return []
+    with metrics.mongo("report_generations.update_many"):
+        await reports.update_many(
+            {"_id": {"$in": ids}, **query},
+            {"$set": {"rolled_up_at": now, "rollup_token": token}, "$rename": {"result_ref": "rollup_ref"}},
+        )
+    with metrics.mongo("report_generations.find"):
+        return await reports.find({"_id": {"$in": ids}, "rollup_token": token}).to_list(length=None)
+
+
+async def _compact_batch(docs: List[dict], token: ObjectId) -> None:
+    """Archiva (o suma a su resumen) un lote ya marcado y lo deja caducar."""
+    reports = get_db()[REPORTS_COLLECTION]
+    now = datetime.now(timezone.utc)
+    stored = await report_store.load_results(d["rollup_ref"] for d in docs if d.get("rollup_ref"))
+    entries = [_entry(d, stored.get(d.get("rollup_ref"))) for d in docs]
+    live = [e for e in entries if _archived(e["meta"]["generated_at"][:7], now)]
+    await _archive(live)
+
+    # Informes borrados mientras tanto: fuera del archivo y sin sumarse
+    ids = [e["_id"] for e in entries]
+    with metrics.mongo("report_generations.find"):
+        kept = {d["_id"] for d in await reports.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(length=None)}
+    gone = [i for i in ids if i not in kept]
+    if gone:
+        with metrics.mongo("report_archive.delete_many"):
+            await get_db()[ARCHIVE_COLLECTION].delete_many({"_id": {"$in": gone}})
+    await _refresh_months(e["meta"]["generated_at"][:7] for e in live)
+    live_ids = {e["_id"] for e in live}
+    await _add_to_rollups([e for e in entries if e["_id"] in kept and e["_id"] not in live_ids])
+
+    # Primero se quita la referencia y después se suelta: un fallo entre medias deja un
+    # resultado sin liberar, nunca uno liberado dos veces
+    with metrics.mongo("report_generations.update_many"):
+        await reports.update_many(
+            {"_id": {"$in": ids}, "rollup_token": token},
+            {
+                "$set": {"expires_at": now + timedelta(hours=REPORTS_ROLLUP_GRACE_HOURS)},
+                "$unset": {"rollup_ref": "", "rollup_token": ""},
+            },
+        )
+    for d in docs:
+        if d.get("rollup_ref"):
+            await report_store.release_result(d["rollup_ref"])
+
+
+async def compact() -> Dict[str, Any]:
+    """
+    Pasa los informes anteriores a cutoff() al archivo (sin series por día ni PDF, ver
+    ARCHIVE_FIELDS), recalcula los resúmenes de sus meses y los deja caducar. Si el mes ya
+    caducó del archivo, el informe solo se suma a su resumen. Los lotes marcados por una
+    compactación que se cayó a medias se retoman pasados ROLLUP_STALE_SECONDS.
+    """
+    if not enabled():
+        return {"enabled": False, "compacted": 0, "months": 0, "cutoff": None}
+
+    limit = cutoff()
+    now = datetime.now(timezone.utc)
+    stale = {
+        "meta.generated_at": {"$lt": limit},
+        "rollup_token": {"$exists": True},
+        "rolled_up_at": {"$lt": now - timedelta(seconds=ROLLUP_STALE_SECONDS)},
+    }
+    compacted = 0
+    months = set()
+    for query in (stale, {**RAW, "meta.generated_at": {"$lt": limit}}):
+        while True:
+            token = ObjectId()
+            docs = await _claim(query, token, datetime.now(timezone.utc))
+            if not docs:
+                break
+            await _compact_batch(docs, token)
+            compacted += len(docs)
+            months.update(d["meta"]["generated_at"][:7] for d in docs)
+
+    return {"enabled": True, "compacted": compacted, "months": len(months), "cutoff": limit}
+
+
+async def has_archived() -> bool:
+    with metrics.mongo("report_archive.find_one"):
+        return await get_db()[ARCHIVE_COLLECTION].find_one({}, {"_id": 1}) is not None
+
+
+async def find_entry(oid: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+    """Informe compactado (con la forma del documento original), o None."""
+    with metrics.mongo("report_archive.find_one"):
+        return await get_db()[ARCHIVE_COLLECTION].find_one({"_id": oid}, projection)
+
+
+async def list_entries(query: dict, limit: int, projection: Optional[dict] = None) -> List[dict]:
+    """Los primeros `limit` informes compactados que cumplen `query`, en el orden del listado (por índice)."""
+    cursor = get_db()[ARCHIVE_COLLECTION].find(query, projection).sort(ARCHIVE_SORT).limit(limit)
+    with metrics.mongo("report_archive.find"):
+        return await cursor.to_list(length=limit)
+
+
+async def iter_entries(query: dict, batch_size: int) -> AsyncIterator[dict]:
+    """Todos los informes compactados que cumplen `query` (exportación), sin cargarlos de golpe."""
+    cursor = get_db()[ARCHIVE_COLLECTION].find(query).sort(ARCHIVE_SORT).batch_size(batch_size)
+    async for doc in cursor:
+        yield doc
+
+
+async def total_offset() -> int:
+    """
+    Corrección del total estimado del historial: informes archivados menos los originales
+    ya compactados (esperan al TTL), que el recuento estimado sigue contando.
+    """
+    with metrics.mongo("report_archive.estimated_count"):
+        archived = await get_db()[ARCHIVE_COLLECTION].estimated_document_count()
+    with metrics.mongo("report_generations.count_documents"):
+        pending = await get_db()[REPORTS_COLLECTION].count_documents({"rolled_up_at": {"$exists": True}})
+    return archived - pending
+
+
+async def remove_entry(oid: ObjectId) -> Optional[dict]:
+    """Borra el informe del archivo y lo descuenta del resumen de su mes; devuelve el informe borrado."""
+    with metrics.mongo("report_archive.find_one_and_delete"):
+        entry = await get_db()[ARCHIVE_COLLECTION].find_one_and_delete({"_id": oid})
+    if entry is None:
+        return None
+    month = entry["meta"]["generated_at"][:7]
+    if _archived(month, datetime.now(timezone.utc)):
+        await _refresh_months([month])
+    else:
+        # Mes ya caducado (el TTL aún no lo había borrado): su resumen no se recalcula
+        with metrics.mongo("report_rollups.update_one"):
+            await get_db()[ROLLUPS_COLLECTION].update_one(
+                {"_id": month},
+                {"$inc": {
+                    "reports": -1,
+                    "total_volume": -_summary_value(entry, "total_volume"),
+                    "total_sets": -_summary_value(entry, "sets"),
+                    "total_reps": -_summary_value(entry, "total_reps"),
+                }},
+            )
+    return entry
+
+
+async def _loop() -> None:
+    while True:
+        try:
+            stats = await compact()
+            if stats["compacted"]:
+                logger.info(
+                    "%d informes anteriores a %s compactados en %d meses",
+                    stats["compacted"], stats["cutoff"], stats["months"],
+                )
+        except PyMongoError as e:
+            logger.warning("Compactación del historial fallida: %s", e)
+        await asyncio.sleep(REPORTS_ROLLUP_INTERVAL_SECONDS)
+
+
+def start() -> None:
+    """Arranca la compactación periódica (desde el lifespan)."""
+    global _task
+    if enabled() and REPORTS_ROLLUP_INTERVAL_SECONDS > 0 and _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,175 @@
+# report_store.py
+import hashlib
+import json
+import os
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+import metrics
+from db_mongo import get_db
+
+# Resultados de informes direccionados por contenido: los informes guardan solo
+# summary + una referencia (hash) y las series viven una vez en esta colección
+RESULTS_COLLECTION = "report_results"
+
+# =========================================================
+# Config
+# =========================================================
+# Comprime las series (zlib) cuando su JSON supera N bytes (0 = nunca)
+REPORT_RESULTS_COMPRESS_MIN_BYTES = int(os.getenv("REPORT_RESULTS_COMPRESS_MIN_BYTES", "2048"))
+REPORT_RESULTS_COMPRESS_LEVEL = int(os.getenv("REPORT_RESULTS_COMPRESS_LEVEL", "6"))
+
+
+def _series(result: Dict[str, Any]) -> Dict[str, Dict[str, List[Any]]]:
+    """by_day/by_exercise como arrays paralelos (columnas) en lugar de listas de objetos."""
+    by_day = result.get("by_day") or []
+    by_exercise = result.get("by_exercise") or []
+    return {
+        "by_day": {
+            "date": [d["date"] for d in by_day],
+            "volume": [float(d["volume"]) for d in by_day],
+        },
+        "by_exercise": {
+            "exercise": [e["exercise"] for e in by_exercise],
+            "volume": [float(e["volume"]) for e in by_exercise],
+        },
+    }
+
+
+def is_compactable(result: Any) -> bool:
+    """True si by_day/by_exercise tienen la forma del modelo (lista de objetos con sus claves)."""
+    if not isinstance(result, dict):
+        return False
+    for field, keys in (("by_day", {"date", "volume"}), ("by_exercise", {"exercise", "volume"})):
+        items = result.get(field) or []
+        if not isinstance(items, list):
+            return False
+        for item in items:
+            if not isinstance(item, dict) or set(item) != keys:
+                return False
+    return True
+
+
+def result_hash(result: Dict[str, Any]) -> str:
+    """Hash estable del resultado normalizado (rango + summary + series)."""
+    canonical = {
+        "from": result.get("from"),
+        "to": result.get("to"),
+        "summary": result.get("summary"),
+        **_series(result),
+    }
+    raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _exercise_items(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"exercise": e, "volume": v}
+        for e, v in zip(columns.get("exercise") or [], columns.get("volume") or [])
+    ]
+
+
+def _result_to_doc(h: str, result: Dict[str, Any]) -> dict:
+    series = _series(result)
+    doc: Dict[str, Any] = {
+        "_id": h,
+        "from": result.get("from"),
+        "to": result.get("to"),
+        "summary": result.get("summary"),
+        # by_exercise es pequeño y va siempre sin comprimir y con la forma del informe
+        # ([{exercise, volume}]): así lo leen directamente los pipelines de estadísticas
+        "by_exercise": _exercise_items(series.pop("by_exercise")),
+    }
+    raw = json.dumps(series, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if 0 < REPORT_RESULTS_COMPRESS_MIN_BYTES <= len(raw):
+        doc["series_z"] = Binary(zlib.compress(raw, REPORT_RESULTS_COMPRESS_LEVEL))
+    else:
+        doc.update(series)
+    return doc
+
+
+def expand_result(doc: dict) -> Dict[str, Any]:
+    """Reconstruye el AnalyticsResult (forma original) a partir de un documento de report_results."""
+    if doc.get("series_z") is not None:
+        series = json.loads(zlib.decompress(doc["series_z"]))
+    else:
+        series = doc
+    by_day = series.get("by_day") or {}
+    # Documentos antiguos: by_exercise en columnas (dentro de series_z o sin comprimir)
+    by_exercise = doc.get("by_exercise")
+    if not isinstance(by_exercise, list):
+        by_exercise = _exercise_items(series.get("by_exercise") or {})
+    return {
+        "from": doc.get("from"),
+        "to": doc.get("to"),
+        "summary": doc.get("summary"),
+        "by_day": [
+            {"date": d, "volume": v}
+            for d, v in zip(by_day.get("date") or [], by_day.get("volume") or [])
+        ],
+        "by_exercise": [{"exercise": e["exercise"], "volume": e["volume"]} for e in by_exercise],
+    }
+
+
+def inline_part(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Lo que queda embebido en el informe: rango y summary (baratos de listar y agregar)."""
+    return {k: result[k] for k in ("from", "to", "summary") if result.get(k) is not None}
+
+
+async def store_result(result: Dict[str, Any], refs: int = 1) -> str:
+    """Guarda (o reutiliza) el resultado y suma `refs` referencias. Devuelve su hash."""
+    h = result_hash(result)
+    coll = get_db()[RESULTS_COLLECTION]
+    doc = _result_to_doc(h, result)
+    doc.pop("_id")
+    with metrics.mongo("report_results.update_one"):
+        try:
+            await coll.update_one({"_id": h}, {"$setOnInsert": doc, "$inc": {"refs": refs}}, upsert=True)
+        except DuplicateKeyError:
+            # Dos inserciones concurrentes del mismo hash: la otra ganó, basta con contar la referencia
+            await coll.update_one({"_id": h}, {"$inc": {"refs": refs}})
+    return h
+
+
+async def release_result(h: str) -> None:
+    """Resta una referencia y borra el resultado cuando ya no lo usa ningún informe."""
+    coll = get_db()[RESULTS_COLLECTION]
+    with metrics.mongo("report_results.release"):
+        await coll.update_one({"_id": h}, {"$inc": {"refs": -1}})
+        await coll.delete_one({"_id": h, "refs": {"$lte": 0}})
+
+
+async def load_results(hashes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    wanted = list(set(hashes))
+    if not wanted:
+        return {}
+    out: Dict[str, Dict[str, Any]] = {}
+    with metrics.mongo("report_results.find"):
+        docs = await get_db()[RESULTS_COLLECTION].find({"_id": {"$in": wanted}}).to_list(length=None)
+    for doc in docs:
+        out[doc["_id"]] = expand_result(doc)
+    return out
+
+
+def _merge(doc: dict, stored: Optional[Dict[str, Any]]) -> None:
+    # Lo embebido en el informe manda; las series salen del resultado compartido
+    inline = doc.get("result") or {}
+    if stored is not None:
+        doc["result"] = {**stored, **inline}
+
+
+async def resolve_results(docs: List[dict]) -> List[dict]:
+    """
+    Sustituye en cada informe la referencia `result_ref` por el resultado completo
+    (una sola consulta para todos). Los informes antiguos con el resultado embebido no cambian.
+    """
+    refs = [d["result_ref"] for d in docs if d.get("result_ref")]
+    stored = await load_results(refs)
+    for doc in docs:
+        ref = doc.get("result_ref")
+        if ref:
+            _merge(doc, stored.get(ref))
+    return docs
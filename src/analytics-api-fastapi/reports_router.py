@@ -1,19 +1,59 @@
 # reports_router.py
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from bson import ObjectId
-from datetime import datetime, timezone
-
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import base64
+import binascii
+import json
+import os
+
+from pydantic import ValidationError
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError
+
+import http_cache
+import metrics
+import report_retention
+import report_store
 from db_mongo import get_db
+from fast_json import model_response
 from schemas_reports import (
+    ReportCompactResponse,
     ReportCreateRequest,
     ReportCreateResponse,
+    ReportImportResponse,
     ReportListResponse,
+    ReportMonthlyStatsResponse,
     ReportResponse,
+    ReportStatsSummaryResponse,
+    ReportTopExercisesResponse,
     DeleteResponse,
 )
 
 router = APIRouter(prefix="/analytics", tags=["reports"])
-COLLECTION = "report_generations"
+COLLECTION = report_retention.REPORTS_COLLECTION
+
+# Orden del historial: más recientes primero; _id desempata y hace estable la paginación
+LIST_SORT = [("meta.generated_at", DESCENDING), ("_id", DESCENDING)]
+# Modo ligero del listado: sin los arrays pesados del resultado
+LIGHT_PROJECTION = {"result.by_day": 0, "result.by_exercise": 0}
+
+# Exportación / importación NDJSON
+EXPORT_BATCH_SIZE = int(os.getenv("REPORTS_EXPORT_BATCH_SIZE", "500"))
+IMPORT_BATCH_SIZE = int(os.getenv("REPORTS_IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = int(os.getenv("REPORTS_IMPORT_MAX_ERRORS", "1000"))
+
+# Versión de la representación del detalle (ReportResponse). Los informes no se modifican
+# tras crearse, así que el ETag es id + versión: cambiar la forma de la respuesta obliga a subirla
+REPORT_REPRESENTATION_VERSION = 1
+
+
+async def ensure_indexes() -> None:
+    """Índice que sirve el orden del listado (y la paginación por cursor) sin ordenar en memoria."""
+    await get_db()[COLLECTION].create_index(LIST_SORT, name="generated_at_desc")
+    await report_retention.ensure_indexes()
 
 
 def _iso_now() -> str:
@@ -41,6 +81,7 @@ def _normalize_doc(doc: dict) -> dict:
     - range: {from,to} si se puede
     - pdf: filename calculado si falta y hay rango
     - result: summary/by_day/by_exercise
+      (si el informe usa result_ref, llamar antes a report_store.resolve_results)
     """
     oid = doc.get("_id")
     if not isinstance(oid, ObjectId):
@@ -82,17 +123,84 @@ def _normalize_doc(doc: dict) -> dict:
     }
 
 
-@router.post(
-    "/reports",
-    response_model=ReportCreateResponse,
-    summary="Crear informe en historial",
-    description="Inserta un registro de generación de informe en MongoDB para mantener el historial.",
-)
-async def create_report(payload: ReportCreateRequest) -> ReportCreateResponse:
-    db = get_db()
+def _report_etag(report_id: str, doc: Optional[dict] = None) -> str:
+    version = (doc or {}).get("version", REPORT_REPRESENTATION_VERSION)
+    return http_cache.strong_etag(f"r-{report_id}-v{version}")
 
-    data = payload.model_dump(by_alias=True, exclude_none=True)
 
+def _encode_after(doc: dict) -> str:
+    """Token opaco con la clave de orden del último elemento devuelto."""
+    key = {"g": (doc.get("meta") or {}).get("generated_at"), "id": str(doc["_id"])}
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_after(token: str) -> Tuple[Optional[str], ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        key = json.loads(raw)
+        generated_at, oid = key["g"], key["id"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Parámetro 'after' inválido")
+
+    if (generated_at is not None and not isinstance(generated_at, str)) or not ObjectId.is_valid(oid):
+        raise HTTPException(status_code=400, detail="Parámetro 'after' inválido")
+    return generated_at, ObjectId(oid)
+
+
+def _after_filter(generated_at: Optional[str], oid: ObjectId) -> dict:
+    """
+    Documentos posteriores a (generated_at, _id) en el orden del listado (desc, desc).
+    Los informes sin meta.generated_at (null) van al final.
+    """
+    if generated_at is None:
+        return {"meta.generated_at": None, "_id": {"$lt": oid}}
+    return {
+        "$or": [
+            {"meta.generated_at": {"$lt": generated_at}},
+            {"meta.generated_at": generated_at, "_id": {"$lt": oid}},
+            {"meta.generated_at": None},
+        ]
+    }
+
+
+def _list_key(doc: dict) -> tuple:
+    """Clave del orden del listado en Python (desc con reverse=True; sin generated_at, al final)."""
+    generated_at = (doc.get("meta") or {}).get("generated_at")
+    return (generated_at is not None, generated_at or "", doc["_id"])
+
+
+async def _list_docs(query: dict, projection: Optional[dict], skip: int, limit: int) -> List[dict]:
+    """
+    Página del historial. Si hay informes compactados, se mezclan los sueltos con los
+    archivados (ambos ya ordenados por índice) antes de aplicar skip/limit.
+    """
+    coll = get_db()[COLLECTION]
+    if not await report_retention.has_archived():
+        cursor = coll.find(query, projection).sort(LIST_SORT).skip(skip).limit(limit)
+        with metrics.mongo("report_generations.find"):
+            return await cursor.to_list(length=limit)
+
+    window = skip + limit
+    cursor = coll.find({**query, **report_retention.RAW}, projection).sort(LIST_SORT).limit(window)
+    with metrics.mongo("report_generations.find"):
+        docs = await cursor.to_list(length=window)
+    docs += await report_retention.list_entries(query, window, projection)
+    docs.sort(key=_list_key, reverse=True)
+    return docs[skip:window]
+
+
+async def _find_report(oid: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+    """Informe suelto o, si ya se compactó, su copia archivada."""
+    with metrics.mongo("report_generations.find_one"):
+        doc = await get_db()[COLLECTION].find_one({"_id": oid, **report_retention.RAW}, projection)
+    if doc is None:
+        doc = await report_retention.find_entry(oid, projection)
+    return doc
+
+
+def _prepare_report(data: dict) -> dict:
+    """Valores por defecto de un informe nuevo (creación individual e importación)."""
     # Garantías mínimas
     data.setdefault("meta", {})
     data["meta"].setdefault("generated_at", _iso_now())
@@ -110,53 +218,498 @@ async def create_report(payload: ReportCreateRequest) -> ReportCreateResponse:
     if not data["pdf"].get("filename") and rng.get("from") and rng.get("to"):
         data["pdf"]["filename"] = _ymd_to_dmy_filename(rng["from"], rng["to"])
 
-    ins = await db[COLLECTION].insert_one(data)
-    return ReportCreateResponse(ok=True, id=str(ins.inserted_id))
+    return data
+
+
+@router.post(
+    "/reports",
+    response_model=ReportCreateResponse,
+    summary="Crear informe en historial",
+    description="Inserta un registro de generación de informe en MongoDB para mantener el historial.",
+)
+async def create_report(payload: ReportCreateRequest) -> ReportCreateResponse:
+    return ReportCreateResponse(ok=True, id=await insert_report(payload))
+
+
+async def insert_report(payload: ReportCreateRequest) -> str:
+    """Guarda un informe nuevo (endpoint de creación y trabajos con save_report). Devuelve su id."""
+    db = get_db()
+
+    data = _prepare_report(payload.model_dump(by_alias=True, exclude_none=True))
+
+    # Resultado direccionado por contenido: las series se guardan una sola vez
+    res = data.get("result")
+    if res and report_store.is_compactable(res):
+        data["result_ref"] = await report_store.store_result(res)
+        data["result"] = report_store.inline_part(res)
+
+    try:
+        with metrics.mongo("report_generations.insert_one"):
+            ins = await db[COLLECTION].insert_one(data)
+    except BaseException:
+        # Sin informe no hay referencia: se descuenta para que el resultado pueda borrarse
+        if data.get("result_ref"):
+            await report_store.release_result(data["result_ref"])
+        raise
+    return str(ins.inserted_id)
 
 
 @router.get(
     "/reports",
     response_model=ReportListResponse,
     summary="Listar informes del historial",
-    description="Devuelve informes ordenados por meta.generated_at desc (si falta, se infiere por ObjectId).",
+    description=(
+        "Devuelve informes ordenados por meta.generated_at desc (si falta, se infiere por ObjectId). "
+        "Para páginas profundas, usar el token 'after' (next_after de la página anterior) en lugar de 'skip'. "
+        "Con light=true se omiten result.by_day y result.by_exercise. "
+        "Con with_total=true se incluye el total (estimado) de informes. "
+        "Los informes antiguos compactados (archivados) aparecen igual que los demás, sin by_day."
+    ),
 )
 async def list_reports(
     limit: int = Query(50, ge=1, le=200),
     skip: int = Query(0, ge=0),
-) -> ReportListResponse:
+    after: Optional[str] = Query(None, description="Cursor opaco devuelto como next_after"),
+    light: bool = Query(False, description="Omitir los arrays by_day/by_exercise"),
+    with_total: bool = Query(False, description="Incluir el total estimado de informes"),
+) -> Response:
     db = get_db()
 
-    cursor = (
-        db[COLLECTION]
-        .find({})
-        .sort("meta.generated_at", -1)
-        .skip(skip)
-        .limit(limit)
+    query = _after_filter(*_decode_after(after)) if after else {}
+    projection = LIGHT_PROJECTION if light else None
+
+    docs = await _list_docs(query, projection, skip, limit)
+    if not light:
+        await report_store.resolve_results(docs)
+
+    items = [_normalize_doc(doc) for doc in docs]
+    last = docs[-1] if docs else None
+
+    next_after = _encode_after(last) if last is not None and len(items) == limit else None
+    total = None
+    if with_total:
+        with metrics.mongo("report_generations.estimated_count"):
+            total = await db[COLLECTION].estimated_document_count()
+        if await report_retention.has_archived():
+            total += await report_retention.total_offset()
+
+    # Una sola validación (al construir el modelo) y serialización directa
+    with metrics.stage("validate"):
+        body = ReportListResponse(items=items, limit=limit, skip=skip, next_after=next_after, total=total)
+    return model_response(body)
+
+
+def _validate_ymd(value: str, name: str) -> str:
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{name}' debe tener formato YYYY-MM-DD")
+    return value
+
+
+def _generated_filter(from_date: Optional[str], to_date: Optional[str]) -> dict:
+    """Filtro por fecha de generación (meta.generated_at, ISO): [from, to] en días completos."""
+    cond = {}
+    if from_date:
+        cond["$gte"] = _validate_ymd(from_date, "from")
+    if to_date:
+        to_d = datetime.strptime(_validate_ymd(to_date, "to"), "%Y-%m-%d").date()
+        cond["$lt"] = (to_d + timedelta(days=1)).strftime("%Y-%m-%d")
+    return {"meta.generated_at": cond} if cond else {}
+
+
+def _export_line(doc: dict) -> bytes:
+    item = _normalize_doc(doc)
+    item["meta"] = doc.get("meta") or {}
+    return (json.dumps(item, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def _export_ndjson(query: dict) -> AsyncIterator[bytes]:
+    """
+    Una línea por informe, resolviendo result_ref por lotes: memoria constante.
+    Primero los informes sueltos y después los compactados (cada parte en el orden del listado).
+    """
+    cursor = get_db()[COLLECTION].find({**query, **report_retention.RAW}).sort(LIST_SORT).batch_size(EXPORT_BATCH_SIZE)
+    batch: List[dict] = []
+    for source in (cursor, report_retention.iter_entries(query, EXPORT_BATCH_SIZE)):
+        async for doc in source:
+            batch.append(doc)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                await report_store.resolve_results(batch)
+                yield b"".join(_export_line(d) for d in batch)
+                batch = []
+    if batch:
+        await report_store.resolve_results(batch)
+        yield b"".join(_export_line(d) for d in batch)
+
+
+@router.get(
+    "/reports/export",
+    summary="Exportar el historial en NDJSON",
+    description=(
+        "Devuelve los informes (mismo formato que el detalle, más 'meta') como NDJSON, una línea por informe, "
+        "en streaming. 'from'/'to' (YYYY-MM-DD) filtran por fecha de generación. "
+        "El fichero resultante se puede volver a cargar con POST /analytics/reports/import."
+    ),
+    response_class=StreamingResponse,
+)
+async def export_reports(
+    from_date: Optional[str] = Query(None, alias="from", description="Generados desde (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, alias="to", description="Generados hasta (YYYY-MM-DD, incluido)"),
+) -> StreamingResponse:
+    query = _generated_filter(from_date, to_date)
+    return StreamingResponse(
+        _export_ndjson(query),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="report_generations.ndjson"'},
+    )
+
+
+async def _ndjson_lines(request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+    """Líneas (número, contenido) del cuerpo NDJSON según llegan."""
+    buf = b""
+    line_no = 0
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line
+    if buf:
+        yield line_no + 1, buf
+
+
+def _parse_import_line(line: bytes) -> dict:
+    """Acepta el formato de creación y el de exportación (id, generated_at y meta)."""
+    raw = json.loads(line)
+    if not isinstance(raw, dict):
+        raise ValueError("cada línea debe ser un objeto JSON")
+
+    payload = ReportCreateRequest.model_validate(raw)
+    data = payload.model_dump(by_alias=True, exclude_none=True)
+    if raw.get("generated_at") and not (raw.get("meta") or {}).get("generated_at"):
+        data.setdefault("meta", {})["generated_at"] = raw["generated_at"]
+
+    oid = raw.get("id")
+    if oid is not None:
+        if not ObjectId.is_valid(oid):
+            raise ValueError("'id' no es un ObjectId válido")
+        data["_id"] = ObjectId(oid)
+    return _prepare_report(data)
+
+
+async def _insert_batch(docs: List[Tuple[int, dict]]) -> Tuple[int, List[dict]]:
+    """insert_many no ordenado; los fallos (p.ej. id duplicado) se devuelven por línea."""
+    # Resultados compartidos primero; las referencias de los informes que fallen se descuentan
+    groups: Dict[str, List[dict]] = {}
+    for _, data in docs:
+        res = data.get("result")
+        if res and report_store.is_compactable(res):
+            groups.setdefault(report_store.result_hash(res), []).append(data)
+    for h, group in groups.items():
+        await report_store.store_result(group[0]["result"], refs=len(group))
+        for data in group:
+            data["result_ref"] = h
+            data["result"] = report_store.inline_part(data["result"])
+
+    errors: List[dict] = []
+    try:
+        with metrics.mongo("report_generations.insert_many"):
+            await get_db()[COLLECTION].insert_many([d for _, d in docs], ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            line_no, data = docs[err["index"]]
+            errors.append({"line": line_no, "error": err.get("errmsg", "error de escritura")})
+            if data.get("result_ref"):
+                await report_store.release_result(data["result_ref"])
+    return len(docs) - len(errors), errors
+
+
+@router.post(
+    "/reports/import",
+    response_model=ReportImportResponse,
+    summary="Importar informes desde NDJSON",
+    description=(
+        "Carga informes en bloque desde un cuerpo NDJSON (una línea = un informe, formato de creación "
+        "o de exportación). Se aplican los mismos valores por defecto que al crear un informe y se "
+        "escriben en lotes no ordenados. Los errores se devuelven por número de línea; si la línea trae "
+        "'id', se conserva (útil para restaurar copias)."
+    ),
+)
+async def import_reports(request: Request) -> ReportImportResponse:
+    inserted = 0
+    failed = 0
+    errors: List[dict] = []
+    batch: List[Tuple[int, dict]] = []
+
+    def note(batch_errors: List[dict]) -> None:
+        nonlocal failed
+        failed += len(batch_errors)
+        errors.extend(batch_errors[: max(IMPORT_MAX_ERRORS - len(errors), 0)])
+
+    async for line_no, line in _ndjson_lines(request):
+        if line.strip():
+            try:
+                batch.append((line_no, _parse_import_line(line)))
+            except ValidationError as e:
+                detail = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                note([{"line": line_no, "error": detail}])
+            except ValueError as e:
+                note([{"line": line_no, "error": str(e)}])
+
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            n, batch_errors = await _insert_batch(batch)
+            inserted += n
+            note(batch_errors)
+            batch = []
+
+    if batch:
+        n, batch_errors = await _insert_batch(batch)
+        inserted += n
+        note(batch_errors)
+
+    return ReportImportResponse(ok=failed == 0, inserted=inserted, failed=failed, errors=errors)
+
+
+# =========================================================
+# Estadísticas del historial (pipelines de agregación en MongoDB)
+# =========================================================
+VOLUME = "$result.summary.total_volume"
+
+
+async def _aggregate(pipeline: List[dict]) -> List[dict]:
+    with metrics.mongo("report_generations.aggregate"):
+        cursor = get_db()[COLLECTION].aggregate(pipeline, allowDiskUse=True)
+        return await cursor.to_list(length=None)
+
+
+async def _history(match: dict) -> List[dict]:
+    """
+    Primeras etapas de los pipelines de estadísticas: informes que cumplen `match`,
+    incluidos los archivados si hay informes compactados.
+    """
+    if not await report_retention.has_archived():
+        return [{"$match": match}]
+    return [
+        {"$match": {**match, **report_retention.RAW}},
+        {"$unionWith": {"coll": report_retention.ARCHIVE_COLLECTION, "pipeline": [{"$match": match}]}},
+    ]
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if isinstance(value, (int, float)) else None
+
+
+def _month_starts(months: int) -> List[str]:
+    """Inicios de mes (YYYY-MM-01) de los últimos `months` meses más el del mes siguiente (límite)."""
+    today = datetime.now(timezone.utc).date()
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return [f"{i // 12:04d}-{i % 12 + 1:02d}-01" for i in range(index, index + months + 1)]
+
+
+# Por informe, by_exercise ([{exercise, volume}]): desde report_results si el informe usa
+# result_ref, o desde el resultado embebido si es antiguo. Los resultados guardados antes
+# de este formato (en columnas) no aportan nada hasta adaptarlos con migrate_report_results.py
+_EXERCISE_ITEMS = {
+    "$ifNull": [
+        {"$arrayElemAt": ["$_stored.by_exercise", 0]},
+        {"$ifNull": ["$result.by_exercise", []]},
+    ]
+}
+
+
+@router.get(
+    "/reports/stats/summary",
+    response_model=ReportStatsSummaryResponse,
+    summary="Estadísticas globales del historial",
+    description=(
+        "Totales sobre los informes guardados (volumen total, medio, mínimo y máximo, series, reps) "
+        "y la evolución entre el primer y el último informe, en una sola agregación en MongoDB. "
+        "from/to filtran por fecha de generación (YYYY-MM-DD)."
+    ),
+)
+async def report_stats_summary(
+    from_date: Optional[str] = Query(None, alias="from", description="Generados desde (YYYY-MM-DD)."),
+    to_date: Optional[str] = Query(None, alias="to", description="Generados hasta (YYYY-MM-DD, inclusive)."),
+) -> Response:
+    pipeline = [
+        *await _history(_generated_filter(from_date, to_date)),
+        # Orden por el índice generated_at_desc (recorrido inverso) para $first/$last
+        {"$sort": {"meta.generated_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": None,
+            "reports": {"$sum": 1},
+            "total_volume": {"$sum": VOLUME},
+            "avg_volume": {"$avg": VOLUME},
+            "min_volume": {"$min": VOLUME},
+            "max_volume": {"$max": VOLUME},
+            "total_sets": {"$sum": "$result.summary.sets"},
+            "total_reps": {"$sum": "$result.summary.total_reps"},
+            "first_generated_at": {"$first": "$meta.generated_at"},
+            "last_generated_at": {"$last": "$meta.generated_at"},
+            "first_volume": {"$first": VOLUME},
+            "last_volume": {"$last": VOLUME},
+        }},
+    ]
+    rows = await _aggregate(pipeline)
+    row = rows[0] if rows else {}
+    body = ReportStatsSummaryResponse(
+        reports=row.get("reports", 0),
+        total_volume=_round(row.get("total_volume")) or 0.0,
+        avg_volume=_round(row.get("avg_volume")),
+        min_volume=_round(row.get("min_volume")),
+        max_volume=_round(row.get("max_volume")),
+        total_sets=row.get("total_sets", 0),
+        total_reps=row.get("total_reps", 0),
+        first_generated_at=row.get("first_generated_at"),
+        last_generated_at=row.get("last_generated_at"),
+        first_volume=_round(row.get("first_volume")),
+        last_volume=_round(row.get("last_volume")),
     )
+    return model_response(body)
+
 
+@router.get(
+    "/reports/stats/monthly",
+    response_model=ReportMonthlyStatsResponse,
+    summary="Informes y volumen por mes de generación",
+    description=(
+        "Número de informes y volumen total/medio por mes de generación ($bucket sobre meta.generated_at) "
+        "para los últimos N meses, incluidos los meses sin informes."
+    ),
+)
+async def report_stats_monthly(
+    months: int = Query(12, ge=1, le=120, description="Meses hacia atrás (incluido el actual)."),
+) -> Response:
+    boundaries = _month_starts(months)
+    pipeline = [
+        *await _history({"meta.generated_at": {"$gte": boundaries[0], "$lt": boundaries[-1]}}),
+        {"$bucket": {
+            "groupBy": "$meta.generated_at",
+            "boundaries": boundaries,
+            "default": "other",
+            "output": {
+                "reports": {"$sum": 1},
+                "total_volume": {"$sum": VOLUME},
+                "avg_volume": {"$avg": VOLUME},
+            },
+        }},
+    ]
+    by_month = {row["_id"]: row for row in await _aggregate(pipeline) if row["_id"] != "other"}
     items = []
-    async for doc in cursor:
-        items.append(_normalize_doc(doc))
+    for start in boundaries[:-1]:
+        row = by_month.get(start, {})
+        items.append({
+            "month": start[:7],
+            "reports": row.get("reports", 0),
+            "total_volume": _round(row.get("total_volume")) or 0.0,
+            "avg_volume": _round(row.get("avg_volume")),
+        })
+    return model_response(ReportMonthlyStatsResponse(months=items))
+
+
+@router.get(
+    "/reports/stats/exercises",
+    response_model=ReportTopExercisesResponse,
+    summary="Ejercicios con más volumen en el historial",
+    description=(
+        "Suma el volumen por ejercicio de todos los informes ($unwind de by_exercise, también para los "
+        "que guardan el resultado en report_results) y devuelve los primeros por volumen total."
+    ),
+)
+async def report_stats_exercises(
+    limit: int = Query(10, ge=1, le=100),
+    from_date: Optional[str] = Query(None, alias="from", description="Generados desde (YYYY-MM-DD)."),
+    to_date: Optional[str] = Query(None, alias="to", description="Generados hasta (YYYY-MM-DD, inclusive)."),
+) -> Response:
+    pipeline = [
+        *await _history(_generated_filter(from_date, to_date)),
+        {"$lookup": {
+            "from": report_store.RESULTS_COLLECTION,
+            "localField": "result_ref",
+            "foreignField": "_id",
+            # Solo by_exercise: by_day (la parte grande) no sale de report_results
+            "pipeline": [{"$project": {"by_exercise": 1}}],
+            "as": "_stored",
+        }},
+        {"$project": {"items": _EXERCISE_ITEMS}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": "$items.exercise",
+            "total_volume": {"$sum": "$items.volume"},
+            "reports": {"$sum": 1},
+            "max_volume": {"$max": "$items.volume"},
+        }},
+        {"$sort": {"total_volume": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+    items = [
+        {
+            "exercise": row["_id"],
+            "total_volume": _round(row["total_volume"]) or 0.0,
+            "reports": row["reports"],
+            "max_volume": _round(row["max_volume"]) or 0.0,
+        }
+        for row in await _aggregate(pipeline)
+        if isinstance(row["_id"], str)
+    ]
+    return model_response(ReportTopExercisesResponse(items=items, limit=limit))
+
 
-    return ReportListResponse(items=items, limit=limit, skip=skip)
+@router.post(
+    "/reports/compact",
+    response_model=ReportCompactResponse,
+    summary="Compactar informes antiguos",
+    description=(
+        "Ejecuta ya la compactación que corre en segundo plano: los informes generados hace más de "
+        "REPORTS_RETENTION_DAYS días pasan al archivo (report_archive, sin by_day ni PDF), se resumen por mes "
+        "(report_rollups) y el original caduca por TTL tras REPORTS_ROLLUP_GRACE_HOURS horas. Siguen "
+        "apareciendo en el listado y el detalle hasta REPORTS_ARCHIVE_RETENTION_DAYS días después de acabar "
+        "su mes; después solo cuentan en el resumen mensual."
+    ),
+)
+async def compact_reports() -> ReportCompactResponse:
+    return ReportCompactResponse(**await report_retention.compact())
 
 
 @router.get(
     "/reports/{report_id}",
     response_model=ReportResponse,
     summary="Obtener detalle de un informe",
+    description=(
+        "Devuelve el informe con un ETag (id + versión). Con If-None-Match coincidente "
+        "se responde 304 tras comprobar que el informe sigue existiendo, sin cargar su resultado."
+    ),
+    responses={304: {"description": "Sin cambios respecto al ETag indicado"}},
 )
-async def get_report(report_id: str) -> ReportResponse:
+async def get_report(
+    report_id: str,
+    if_none_match: Optional[str] = Header(None, include_in_schema=False),
+) -> Response:
     if not ObjectId.is_valid(report_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    db = get_db()
-    doc = await db[COLLECTION].find_one({"_id": ObjectId(report_id)})
+    oid = ObjectId(report_id)
+    if if_none_match:
+        # Revalidación: basta con saber que existe (y su versión), sin el resultado ni las series
+        head = await _find_report(oid, {"version": 1})
+        if not head:
+            raise HTTPException(status_code=404, detail="Informe no encontrado")
+        etag = _report_etag(report_id, head)
+        if http_cache.etag_matches(if_none_match, etag):
+            return http_cache.not_modified(etag, http_cache.REPORT_CACHE_CONTROL)
+
+    doc = await _find_report(oid)
     if not doc:
         raise HTTPException(status_code=404, detail="Informe no encontrado")
+    await report_store.resolve_results([doc])
 
-    # Validación final contra response_model
-    return ReportResponse.model_validate(_normalize_doc(doc))
+    # Validación final contra response_model (una sola vez) y serialización directa
+    with metrics.stage("validate"):
+        body = ReportResponse.model_validate(_normalize_doc(doc))
+    return model_response(
+        body, headers=http_cache.validator_headers(_report_etag(report_id, doc), http_cache.REPORT_CACHE_CONTROL)
+    )
 
 
 @router.delete(
@@ -169,9 +722,17 @@ async def delete_report(report_id: str) -> DeleteResponse:
         raise HTTPException(status_code=400, detail="ID inválido")
 
     db = get_db()
-    res = await db[COLLECTION].delete_one({"_id": ObjectId(report_id)})
-
-    if res.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Informe no encontrado")
+    oid = ObjectId(report_id)
+    with metrics.mongo("report_generations.find_one_and_delete"):
+        doc = await db[COLLECTION].find_one_and_delete({"_id": oid}, {"result_ref": 1, "rolled_up_at": 1})
+
+    # Compactado (o en compactación): se borra también del archivo. Su resultado compartido
+    # ya no es del informe, lo suelta la compactación
+    if doc is None or doc.get("rolled_up_at"):
+        entry = await report_retention.remove_entry(oid)
+        if doc is None and entry is None:
+            raise HTTPException(status_code=404, detail="Informe no encontrado")
+    elif doc.get("result_ref"):
+        await report_store.release_result(doc["result_ref"])
 
     return DeleteResponse(ok=True, deleted=True, id=report_id)
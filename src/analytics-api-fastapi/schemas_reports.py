@@ -71,6 +71,69 @@ class ReportListResponse(BaseModel):
     items: List[ReportResponse]
     limit: int
     skip: int
+    # Cursor para la página siguiente (None si no hay más)
+    next_after: Optional[str] = None
+    # Total de informes (estimado); solo con with_total=true
+    total: Optional[int] = None
+
+
+class ReportImportError(BaseModel):
+    line: int
+    error: str
+
+
+class ReportImportResponse(BaseModel):
+    ok: bool
+    inserted: int
+    failed: int
+    # Primeros errores (por número de línea del NDJSON)
+    errors: List[ReportImportError] = []
+
+
+class ReportStatsSummaryResponse(BaseModel):
+    reports: int
+    total_volume: float
+    avg_volume: Optional[float] = None
+    min_volume: Optional[float] = None
+    max_volume: Optional[float] = None
+    total_sets: int
+    total_reps: int
+    first_generated_at: Optional[str] = None
+    last_generated_at: Optional[str] = None
+    # Volumen del primer y último informe del rango (evolución entre informes)
+    first_volume: Optional[float] = None
+    last_volume: Optional[float] = None
+
+
+class ReportMonthStats(BaseModel):
+    month: str
+    reports: int
+    total_volume: float
+    avg_volume: Optional[float] = None
+
+
+class ReportMonthlyStatsResponse(BaseModel):
+    months: List[ReportMonthStats]
+
+
+class ReportExerciseStats(BaseModel):
+    exercise: str
+    total_volume: float
+    reports: int
+    max_volume: float
+
+
+class ReportTopExercisesResponse(BaseModel):
+    items: List[ReportExerciseStats]
+    limit: int
+
+
+class ReportCompactResponse(BaseModel):
+    enabled: bool
+    compacted: int
+    months: int
+    # Los informes generados antes de este día (YYYY-MM-DD) se compactan
+    cutoff: Optional[str] = None
 
 
 class DeleteResponse(BaseModel):
@@ -0,0 +1,155 @@
+# sharding.py
+import asyncio
+import os
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+import core_client
+from aggregation import DayPartial
+
+# =========================================================
+# Config
+# =========================================================
+# Rangos de más de N días se trocean en varias consultas al Core API (0 = nunca)
+SHARD_MIN_DAYS = int(os.getenv("ANALYTICS_SHARD_MIN_DAYS", "92"))
+# Tamaño de cada trozo, en meses naturales
+SHARD_MONTHS = int(os.getenv("ANALYTICS_SHARD_MONTHS", "1"))
+# Trozos pedidos a la vez como máximo
+SHARD_CONCURRENCY = int(os.getenv("ANALYTICS_SHARD_CONCURRENCY", "4"))
+# Reintentos de un trozo completo (p.ej. si la conexión cae a mitad del cuerpo)
+SHARD_RETRIES = int(os.getenv("ANALYTICS_SHARD_RETRIES", "1"))
+# Trozos por rango como máximo: los rangos muy largos se parten en trozos de más meses
+SHARD_MAX = int(os.getenv("ANALYTICS_SHARD_MAX", "24"))
+# Los días anteriores no se piden al Core API (cuentan como vacíos): un 'from' muy antiguo
+# no multiplica las consultas
+EARLIEST_DATE = os.getenv("ANALYTICS_EARLIEST_DATE", "2000-01-01")
+
+FetchPartials = Callable[[str, str], Awaitable[Dict[str, DayPartial]]]
+# (trozos terminados, total): avance de las consultas al Core API de la tarea en curso
+ShardProgress = Callable[[int, int], Awaitable[None]]
+
+# Quien quiera seguir el avance (p.ej. un trabajo en segundo plano) fija aquí su callback;
+# las tareas de los trozos heredan el contexto
+shard_progress: ContextVar[Optional[ShardProgress]] = ContextVar("analytics_shard_progress", default=None)
+
+
+def _parse(d: str) -> date:
+    return datetime.strptime(d, "%Y-%m-%d").date()
+
+
+def _ymd(d: date) -> str:
+    return d.strftime("%Y-%m-%d")
+
+
+def needs_sharding(from_date: str, to_date: str) -> bool:
+    if SHARD_MIN_DAYS <= 0:
+        return False
+    return (_parse(to_date) - _parse(from_date)).days + 1 > SHARD_MIN_DAYS
+
+
+def clamp_range(from_date: str, to_date: str) -> Optional[Tuple[str, str]]:
+    """Parte de [from_date, to_date] que puede tener entrenos (de EARLIEST_DATE a hoy), o None."""
+    from_date = max(from_date, EARLIEST_DATE)
+    to_date = min(to_date, _ymd(date.today()))
+    return (from_date, to_date) if from_date <= to_date else None
+
+
+def month_shards(from_date: str, to_date: str, months: int = 1) -> List[Tuple[str, str]]:
+    """
+    Parte [from_date, to_date] en tramos disjuntos alineados a meses naturales
+    (el primero y el último pueden ser parciales).
+    """
+    months = max(months, 1)
+    start, end = _parse(from_date), _parse(to_date)
+    shards: List[Tuple[str, str]] = []
+    while start <= end:
+        m = start.month - 1 + months
+        next_start = date(start.year + m // 12, m % 12 + 1, 1)
+        shard_end = min(next_start - timedelta(days=1), end)
+        shards.append((_ymd(start), _ymd(shard_end)))
+        start = next_start
+    return shards
+
+
+def plan(from_date: str, to_date: str) -> List[Tuple[str, str]]:
+    """
+    Consultas en que se pide el rango: una si es corto; si no, trozos de SHARD_MONTHS meses
+    (o más anchos, para no pasar de SHARD_MAX trozos).
+    """
+    if not needs_sharding(from_date, to_date):
+        return [(from_date, to_date)]
+    start, end = _parse(from_date), _parse(to_date)
+    span = (end.year - start.year) * 12 + end.month - start.month + 1
+    months = max(SHARD_MONTHS, 1)
+    if SHARD_MAX > 0:
+        months = max(months, -(-span // SHARD_MAX))
+    return month_shards(from_date, to_date, months)
+
+
+def shard_count(from_date: str, to_date: str) -> int:
+    """Consultas al Core API que cuesta el rango (0 si no puede tener entrenos)."""
+    rng = clamp_range(from_date, to_date)
+    return len(plan(*rng)) if rng is not None else 0
+
+
+async def _fetch_shard(
+    shard: Tuple[str, str], fetch: FetchPartials, sem: asyncio.Semaphore
+) -> Dict[str, DayPartial]:
+    async with sem:
+        for attempt in range(SHARD_RETRIES + 1):
+            try:
+                # Cada intento agrega desde cero: reintentar no duplica filas
+                return await fetch(*shard)
+            except HTTPException as e:
+                if e.status_code not in core_client.RETRY_STATUS or attempt == SHARD_RETRIES:
+                    raise
+            await asyncio.sleep(core_client._backoff_delay(attempt))
+    raise HTTPException(status_code=502, detail="Core API no accesible")
+
+
+async def fetch_sharded(from_date: str, to_date: str, fetch: FetchPartials) -> Dict[str, DayPartial]:
+    """
+    Pide el rango al Core API: si es largo (needs_sharding), en trozos concurrentes (ver plan;
+    como mucho SHARD_CONCURRENCY a la vez) y mezcla sus parciales. Como los trozos no
+    comparten días, el resultado es el mismo que el de una única consulta. Si un trozo
+    falla, se cancelan los demás. Cada trozo terminado se notifica a shard_progress.
+    """
+    report = shard_progress.get()
+    shards = plan(from_date, to_date)
+    if len(shards) == 1:
+        partials = await fetch(from_date, to_date)
+        if report is not None:
+            await report(1, 1)
+        return partials
+
+    sem = asyncio.Semaphore(max(SHARD_CONCURRENCY, 1))
+    done = 0
+
+    async def run(shard: Tuple[str, str]) -> Dict[str, DayPartial]:
+        nonlocal done
+        part = await _fetch_shard(shard, fetch, sem)
+        done += 1
+        if report is not None:
+            await report(done, len(shards))
+        return part
+
+    tasks = [asyncio.ensure_future(run(s)) for s in shards]
+    try:
+        parts = await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    partials: Dict[str, DayPartial] = {}
+    for part in parts:
+        for day, p in part.items():
+            if day in partials:
+                partials[day].merge(p)
+            else:
+                partials[day] = p
+    return partials
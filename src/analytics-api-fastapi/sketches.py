@@ -0,0 +1,221 @@
+# sketches.py
+import hashlib
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# =========================================================
+# Config (fijos: cambiarlos invalida los sketches guardados, ver daily_store.DOC_VERSION)
+# =========================================================
+# Error relativo máximo de los percentiles (1%)
+QUANTILE_ALPHA = 0.01
+# Cubos como máximo por sketch de percentiles: al superarlo se funden los más bajos
+QUANTILE_MAX_BINS = 512
+# Precisión del HyperLogLog: 2^12 registros (error típico ~1,6%, 4 KB como mucho)
+HLL_PRECISION = 12
+
+_GAMMA = (1 + QUANTILE_ALPHA) / (1 - QUANTILE_ALPHA)
+_LOG_GAMMA = math.log(_GAMMA)
+# Memo valor -> cubo (pesos y reps se repiten mucho); se vacía si crece demasiado
+_KEY_MEMO: Dict[float, int] = {}
+_KEY_MEMO_MAX = 65536
+
+
+def quantile_key(value: float) -> int:
+    """Cubo logarítmico de un valor > 0: (gamma^(k-1), gamma^k]."""
+    k = _KEY_MEMO.get(value)
+    if k is None:
+        if len(_KEY_MEMO) >= _KEY_MEMO_MAX:
+            _KEY_MEMO.clear()
+        k = _KEY_MEMO[value] = math.ceil(math.log(value) / _LOG_GAMMA)
+    return k
+
+
+def bin_value(key: int) -> float:
+    """Valor representativo de un cubo (a menos de QUANTILE_ALPHA de cualquier valor del cubo)."""
+    return 2 * _GAMMA ** key / (_GAMMA + 1)
+
+
+class QuantileSketch:
+    """
+    Sketch de percentiles con error relativo acotado (estilo DDSketch): cuenta los valores
+    en cubos logarítmicos. Mezclar dos sketches es sumar cuentas, así que un rango da lo mismo
+    se calcule de una vez o mezclando días. Los valores <= 0 van a un cubo aparte (cero).
+    """
+
+    __slots__ = ("bins", "zero", "count")
+
+    def __init__(self) -> None:
+        self.bins: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+
+    def add(self, value: float, n: int = 1) -> None:
+        if 0 < value < math.inf:
+            self.add_key(quantile_key(value), n)
+        else:
+            self.zero += n
+            self.count += n
+
+    def add_key(self, key: int, n: int = 1) -> None:
+        bins = self.bins
+        current = bins.get(key)
+        if current is None:
+            bins[key] = n
+            if len(bins) > QUANTILE_MAX_BINS:
+                self._collapse()
+        else:
+            bins[key] = current + n
+        self.count += n
+
+    def merge(self, other: "QuantileSketch") -> None:
+        bins = self.bins
+        for key, n in other.bins.items():
+            bins[key] = bins.get(key, 0) + n
+        self.zero += other.zero
+        self.count += other.count
+        if len(bins) > QUANTILE_MAX_BINS:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Memoria acotada: los cubos más bajos se funden en el menor de los que se conservan."""
+        keys = sorted(self.bins)
+        excess = keys[: len(keys) - QUANTILE_MAX_BINS + 1]
+        target = keys[len(excess)]
+        self.bins[target] += sum(self.bins.pop(k) for k in excess)
+
+    def items(self) -> Iterator[Tuple[float, int]]:
+        """(valor representativo, cuenta) en orden creciente, con el cubo cero primero."""
+        if self.zero:
+            yield 0.0, self.zero
+        for key in sorted(self.bins):
+            yield bin_value(key), self.bins[key]
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        """Percentiles (q en [0, 1]) en una sola pasada; None si el sketch está vacío."""
+        qs = list(qs)
+        if not self.count:
+            return [None] * len(qs)
+        order = sorted(range(len(qs)), key=lambda i: qs[i])
+        out: List[Optional[float]] = [None] * len(qs)
+        seen = 0
+        pos = 0
+        for value, n in self.items():
+            seen += n
+            while pos < len(order) and qs[order[pos]] * (self.count - 1) < seen:
+                out[order[pos]] = value
+                pos += 1
+            if pos == len(order):
+                break
+        return out
+
+    def to_doc(self) -> Dict[str, Any]:
+        keys = sorted(self.bins)
+        return {"z": self.zero, "k": keys, "c": [self.bins[k] for k in keys]}
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "QuantileSketch":
+        s = cls()
+        s.zero = doc.get("z", 0)
+        s.bins = dict(zip(doc.get("k") or [], doc.get("c") or []))
+        s.count = s.zero + sum(s.bins.values())
+        return s
+
+
+_HLL_M = 1 << HLL_PRECISION
+_HLL_VALUE_BITS = 64 - HLL_PRECISION
+# Con pocos registros ocupados se guardan como dict (un día tiene unos pocos ejercicios)
+_HLL_SPARSE_MAX = _HLL_M // 16
+_HASH_MEMO: Dict[str, Tuple[int, int]] = {}
+
+
+def _hll_slot(item: str) -> Tuple[int, int]:
+    """(registro, rango) de un elemento; hash estable entre procesos (blake2b, no hash())."""
+    slot = _HASH_MEMO.get(item)
+    if slot is None:
+        h = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+        rest = h & ((1 << _HLL_VALUE_BITS) - 1)
+        slot = (h >> _HLL_VALUE_BITS, _HLL_VALUE_BITS - rest.bit_length() + 1)
+        if len(_HASH_MEMO) >= _KEY_MEMO_MAX:
+            _HASH_MEMO.clear()
+        _HASH_MEMO[item] = slot
+    return slot
+
+
+class CardinalitySketch:
+    """
+    HyperLogLog para contar elementos distintos (ejercicios) de forma mezclable:
+    mezclar es quedarse con el máximo de cada registro. Empieza disperso (dict) y pasa
+    a denso (bytearray de 2^HLL_PRECISION) cuando se llena, así que nunca ocupa más de eso.
+    """
+
+    __slots__ = ("sparse", "dense")
+
+    def __init__(self) -> None:
+        self.sparse: Optional[Dict[int, int]] = {}
+        self.dense: Optional[bytearray] = None
+
+    def add(self, item: str) -> None:
+        self._set(*_hll_slot(item))
+
+    def _set(self, idx: int, rank: int) -> None:
+        if self.dense is not None:
+            if rank > self.dense[idx]:
+                self.dense[idx] = rank
+            return
+        if rank > self.sparse.get(idx, 0):
+            self.sparse[idx] = rank
+            if len(self.sparse) > _HLL_SPARSE_MAX:
+                self._densify()
+
+    def _densify(self) -> None:
+        dense = bytearray(_HLL_M)
+        for idx, rank in self.sparse.items():
+            dense[idx] = rank
+        self.dense = dense
+        self.sparse = None
+
+    def registers(self) -> Iterator[Tuple[int, int]]:
+        if self.dense is not None:
+            return ((i, r) for i, r in enumerate(self.dense) if r)
+        return iter(self.sparse.items())
+
+    def merge(self, other: "CardinalitySketch") -> None:
+        if other.dense is not None and self.dense is None:
+            self._densify()
+        if self.dense is not None and other.dense is not None:
+            self.dense = bytearray(map(max, self.dense, other.dense))
+            return
+        for idx, rank in other.registers():
+            self._set(idx, rank)
+
+    def estimate(self) -> int:
+        if self.dense is None and not self.sparse:
+            return 0
+        if self.dense is not None:
+            ranks: Iterable[int] = self.dense
+            empty = self.dense.count(0)
+        else:
+            ranks = self.sparse.values()
+            empty = _HLL_M - len(self.sparse)
+        total = empty + sum(2.0 ** -r for r in ranks if r)
+        raw = 0.7213 / (1 + 1.079 / _HLL_M) * _HLL_M * _HLL_M / total
+        # Pocos elementos: conteo lineal (casi exacto)
+        if raw <= 2.5 * _HLL_M and empty:
+            raw = _HLL_M * math.log(_HLL_M / empty)
+        return int(round(raw))
+
+    def to_doc(self) -> Dict[str, Any]:
+        if self.dense is not None:
+            return {"d": bytes(self.dense)}
+        items = sorted(self.sparse.items())
+        return {"i": [i for i, _ in items], "r": [r for _, r in items]}
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "CardinalitySketch":
+        s = cls()
+        if doc.get("d") is not None:
+            s.dense = bytearray(doc["d"])
+            s.sparse = None
+        else:
+            s.sparse = dict(zip(doc.get("i") or [], doc.get("r") or []))
+        return s
@@ -0,0 +1,127 @@
+# summary_cache.py
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# =========================================================
+# Config
+# =========================================================
+# Caché en proceso de resúmenes calculados (TTL + LRU). Con TTL 0 queda desactivada
+SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "256"))
+
+
+class SummaryCache:
+    """
+    Caché TTL + LRU con 'single-flight': peticiones concurrentes con la misma clave
+    comparten un único cálculo en curso en lugar de lanzar uno cada una.
+    Los valores devueltos se comparten entre peticiones y no deben modificarse.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def available(self, key: Hashable) -> bool:
+        """True si la clave está cacheada o calculándose: pedirla no generará trabajo nuevo."""
+        return self.enabled and (key in self._inflight or self.get(key) is not None)
+
+    def lookup(self, key: Hashable) -> Optional[Any]:
+        """Como get(), pero contabiliza el acierto o fallo (para quien calcula por su cuenta)."""
+        if not self.enabled:
+            return None
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await compute()
+
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # El cálculo va en su propia tarea: si el primer cliente se desconecta,
+            # los demás que esperan la misma clave siguen recibiendo el resultado
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._settle(key, t))
+
+        return await asyncio.shield(task)
+
+    def _settle(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Solo se cachean los éxitos; los errores se propagan a todos los que esperaban
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def purge(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Elimina todas las entradas (o las que cumplan `predicate`)."""
+        if predicate is None:
+            n = len(self._entries)
+            self._entries.clear()
+            return n
+        keys = [k for k in self._entries if predicate(k)]
+        for k in keys:
+            del self._entries[k]
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+        }
+
+
+summary_cache = SummaryCache(SUMMARY_CACHE_TTL_SECONDS, SUMMARY_CACHE_MAX_ENTRIES)
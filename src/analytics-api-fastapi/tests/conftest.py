@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# Los módulos del servicio se importan como en la imagen (desde su carpeta, sin paquete)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
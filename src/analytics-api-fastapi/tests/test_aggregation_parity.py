@@ -0,0 +1,336 @@
+# test_aggregation_parity.py
+"""
+Paridad de los motores de agregación con el cálculo original de /analytics/summary:
+el motor por filas, el columnar (numpy) y el formato columnar del Core API deben
+devolver exactamente el mismo resumen que _compute_summary antes de los parciales diarios.
+"""
+import asyncio
+import json
+import random
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+import aggregation_columnar as columnar
+import core_client
+import wire_format
+from aggregation import SummaryAccumulator
+
+pytestmark = pytest.mark.skipif(not columnar.enabled(), reason="motor columnar no disponible (numpy)")
+
+FROM, TO = "2026-01-01", "2026-03-31"
+
+
+def baseline_summary(from_date: str, to_date: str, rows: list) -> Dict[str, Any]:
+    """Copia literal de main._compute_summary tal como era antes del motor incremental."""
+    if not rows:
+        return {
+            "from": from_date,
+            "to": to_date,
+            "summary": {
+                "workouts": 0,
+                "exercises": 0,
+                "sets": 0,
+                "total_reps": 0,
+                "total_volume": 0.0,
+            },
+            "by_day": [],
+            "by_exercise": [],
+        }
+
+    workouts = set()
+    exercises = set()
+
+    sets_count = 0
+    total_reps = 0
+    total_volume = 0.0
+
+    volume_by_day = defaultdict(float)
+    volume_by_exercise = defaultdict(float)
+
+    for r in rows:
+        workout_id = r.get("workout_id")
+        exercise_id = r.get("exercise_id")
+
+        if workout_id is not None:
+            workouts.add(workout_id)
+        if exercise_id is not None:
+            exercises.add(exercise_id)
+
+        if r.get("set_id") is None:
+            continue
+
+        reps = r.get("reps") or 0
+        try:
+            weight = float(r.get("weight_kg") or 0)
+        except Exception:
+            weight = 0.0
+
+        volume = reps * weight
+
+        sets_count += 1
+        total_reps += reps
+        total_volume += volume
+
+        day = str(r.get("workout_date", ""))[:10]
+        if day:
+            volume_by_day[day] += volume
+
+        ex_name = r.get("exercise_name") or (
+            f"exercise_{exercise_id}" if exercise_id is not None else "unknown_exercise"
+        )
+        volume_by_exercise[ex_name] += volume
+
+    return {
+        "from": from_date,
+        "to": to_date,
+        "summary": {
+            "workouts": len(workouts),
+            "exercises": len(exercises),
+            "sets": sets_count,
+            "total_reps": total_reps,
+            "total_volume": round(total_volume, 2),
+        },
+        "by_day": [{"date": d, "volume": round(v, 2)} for d, v in sorted(volume_by_day.items())],
+        "by_exercise": [
+            {"exercise": e, "volume": round(v, 2)}
+            for e, v in sorted(volume_by_exercise.items(), key=lambda x: -x[1])
+        ],
+    }
+
+
+# ---------- motores ----------
+def row_engine(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    acc = SummaryAccumulator()
+    acc.add_python(rows)
+    return acc.result(FROM, TO)
+
+
+def columnar_engine(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    cols = columnar.RowColumns.from_rows(rows)
+    assert cols is not None
+    acc = SummaryAccumulator()
+    columnar.accumulate_columns(cols, acc.days)
+    return acc.result(FROM, TO)
+
+
+def wire_engine(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Filas codificadas como las manda el Core API con format=columnar."""
+    cols = columnar.RowColumns.from_wire(wire_format.encode_columnar(FROM, TO, rows))
+    assert cols is not None
+    acc = SummaryAccumulator()
+    columnar.accumulate_columns(cols, acc.days)
+    return acc.result(FROM, TO)
+
+
+ENGINES = [row_engine, columnar_engine, wire_engine]
+
+
+# ---------- datos ----------
+def _row(workout_id, day, exercise_id, name, set_id, reps, weight) -> Dict[str, Any]:
+    return {
+        "workout_id": workout_id,
+        "workout_date": f"{day}T00:00:00.000Z",
+        "workout_item_id": 1,
+        "exercise_id": exercise_id,
+        "exercise_name": name,
+        "set_id": set_id,
+        "set_index": 0,
+        "reps": reps,
+        "weight_kg": weight,
+    }
+
+
+def _weighted_rows(weights: List[Any]) -> List[Dict[str, Any]]:
+    return [
+        _row(i // 6, f"2026-01-{1 + i // 12:02d}", 1 + i % 3, f"Ejercicio {i % 3}", i, 1 + i % 7, weights[i % len(weights)])
+        for i in range(120)
+    ]
+
+
+def rounding_rows() -> List[Dict[str, Any]]:
+    """Pesos sin representación exacta en binario (0.1 + 0.2...): el redondeo a 2 decimales no cambia."""
+    return _weighted_rows([0.1, 0.2, 0.3, "62.55", "7.35", 12.05, 1.15, "0.45"])
+
+
+def half_cent_rows() -> List[Dict[str, Any]]:
+    """Volúmenes con 3 decimales terminados en 5: los totales caen justo en medio céntimo."""
+    return _weighted_rows([2.675, 1.005, 33.335, "62.505", "7.125"])
+
+
+def weight_rows() -> List[Dict[str, Any]]:
+    """weight_kg nulo, vacío, no numérico, DECIMAL como string, entero y float; reps nulas o 0."""
+    weights = [None, "", "bad", "80.00", "62.50", 40, 12.5, "abc1", 0, "0.0"]
+    reps = [None, 0, 5, 8, 10, 12]
+    return [
+        _row(1 + i // 10, f"2026-02-{1 + i % 5:02d}", 1 + i % 4, "Press banca" if i % 4 else "Sentadilla", 100 + i,
+             reps[i % len(reps)], weights[i % len(weights)])
+        for i in range(60)
+    ]
+
+
+def missing_set_rows() -> List[Dict[str, Any]]:
+    """Entrenos y ejercicios sin series (set_id nulo): cuentan en workouts/exercises, no en series ni by_day."""
+    rows = [
+        _row(1, "2026-01-05", 1, "Press banca", None, None, None),
+        _row(1, "2026-01-05", 2, "Sentadilla", 10, 5, "100.00"),
+        _row(2, "2026-01-06", 3, "Remo", None, 8, "50.00"),
+        _row(3, "2026-01-07", 4, None, None, None, None),
+        _row(4, "2026-01-08", None, None, 11, 6, 20),
+        _row(5, "2026-01-09", 5, None, 12, 3, "15.5"),
+        _row(None, "2026-01-09", 6, "Dominadas", 13, 10, None),
+    ]
+    return rows
+
+
+def undated_rows() -> List[Dict[str, Any]]:
+    """Filas sin fecha: cuentan en los totales pero no en by_day (el formato columnar siempre trae fecha)."""
+    rows = missing_set_rows()
+    for r in rows[-2:]:
+        del r["workout_date"]
+    return rows
+
+
+def generated_rows(n: int, seed: int) -> List[Dict[str, Any]]:
+    """Filas sintéticas ordenadas por fecha (como las devuelve el Core API)."""
+    rnd = random.Random(seed)
+    names = ["Press banca", "Sentadilla", "Peso muerto", None, "Remo", "Dominadas"]
+    rows: List[Dict[str, Any]] = []
+    day = workout = 0
+    while len(rows) < n:
+        day += rnd.randint(0, 2)
+        workout += 1
+        date = f"2026-{1 + (day // 28) % 12:02d}-{1 + day % 28:02d}"
+        for _ in range(rnd.randint(1, 4)):
+            ex = rnd.randint(1, 6)
+            sets = rnd.choice([0, 1, 3, 4, 5])
+            if not sets:
+                rows.append(_row(workout, date, ex, names[ex - 1], None, None, None))
+            for _ in range(sets):
+                rows.append(_row(
+                    workout, date, ex if rnd.random() > 0.02 else None, names[ex - 1], rnd.randint(1, 10**6),
+                    rnd.choice([None, 0, 5, 8, 10, 12]),
+                    rnd.choice([None, "", "bad", "80.00", "62.50", "7.25", 40, "33.33", 12.5]),
+                ))
+    return sorted(rows[:n], key=lambda r: r["workout_date"])
+
+
+CASES = {
+    "empty": [],
+    "rounding": rounding_rows(),
+    "weights": weight_rows(),
+    "missing_set_id": missing_set_rows(),
+    "generated": generated_rows(5000, 1),
+}
+
+
+def _volumes(summary: Dict[str, Any]) -> Dict[str, float]:
+    out = {"total": summary["summary"]["total_volume"]}
+    out.update({f"day:{d['date']}": d["volume"] for d in summary["by_day"]})
+    out.update({f"exercise:{e['exercise']}": e["volume"] for e in summary["by_exercise"]})
+    return out
+
+
+# ---------- tests ----------
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda e: e.__name__)
+@pytest.mark.parametrize("case", list(CASES))
+def test_engines_match_baseline(case: str, engine) -> None:
+    rows = CASES[case]
+    assert engine(rows) == baseline_summary(FROM, TO, rows)
+
+
+@pytest.mark.parametrize("engine", [row_engine, columnar_engine], ids=lambda e: e.__name__)
+def test_undated_rows_match_baseline(engine) -> None:
+    rows = undated_rows()
+    assert engine(rows) == baseline_summary(FROM, TO, rows)
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda e: e.__name__)
+def test_half_cent_ties_within_one_cent(engine) -> None:
+    """
+    En un empate exacto de medio céntimo el redondeo lo decide el error de coma flotante, que
+    depende del orden de la suma: el cálculo original suma fila a fila y los motores, día a día.
+    Todo lo demás coincide y ningún volumen se separa más de un céntimo.
+    """
+    rows = half_cent_rows()
+    actual, expected = engine(rows), baseline_summary(FROM, TO, rows)
+    assert actual["summary"] == {**expected["summary"], "total_volume": actual["summary"]["total_volume"]}
+    assert [d["date"] for d in actual["by_day"]] == [d["date"] for d in expected["by_day"]]
+    assert {e["exercise"] for e in actual["by_exercise"]} == {e["exercise"] for e in expected["by_exercise"]}
+    got, want = _volumes(actual), _volumes(expected)
+    assert all(abs(got[k] - want[k]) <= 0.010001 for k in want)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batches_match_single_pass(seed: int) -> None:
+    """Agregar por lotes (como en streaming) da lo mismo que de una vez, con ambos motores."""
+    rows = generated_rows(3000, seed)
+    rnd = random.Random(seed)
+    acc_rows, acc_cols = SummaryAccumulator(), SummaryAccumulator()
+    i = 0
+    while i < len(rows):
+        batch = rows[i:i + rnd.randint(1, 800)]
+        i += len(batch)
+        acc_rows.add_python(batch)
+        columnar.accumulate_columns(columnar.RowColumns.from_rows(batch), acc_cols.days)
+    expected = baseline_summary(FROM, TO, rows)
+    assert acc_rows.result(FROM, TO) == expected
+    assert acc_cols.result(FROM, TO) == expected
+
+
+def test_auto_engine_above_threshold(monkeypatch) -> None:
+    """add_rows elige el motor columnar en lotes grandes; el resultado no cambia."""
+    monkeypatch.setattr(columnar, "COLUMNAR_MIN_ROWS", 100)
+    rows = generated_rows(2000, 7)
+    acc = SummaryAccumulator()
+    acc.add_rows(rows)
+    assert acc.result(FROM, TO) == baseline_summary(FROM, TO, rows)
+
+
+def test_non_integer_ids_fall_back_to_rows(monkeypatch) -> None:
+    """Ids que no son enteros no caben en columnas: add_rows usa el motor por filas."""
+    monkeypatch.setattr(columnar, "COLUMNAR_MIN_ROWS", 1)
+    rows = [dict(r, workout_id=f"w{r['workout_id']}") for r in weight_rows()]
+    assert columnar.RowColumns.from_rows(rows) is None
+    acc = SummaryAccumulator()
+    acc.add_rows(rows)
+    assert acc.result(FROM, TO) == baseline_summary(FROM, TO, rows)
+
+
+def test_streaming_path_uses_columnar_engine(monkeypatch) -> None:
+    """
+    Por el camino de streaming los lotes del parser son pequeños: se juntan hasta el umbral
+    antes de agregarse, así que el motor columnar actúa y el resumen no cambia.
+    """
+    import main
+
+    rows = generated_rows(5000, 3)
+    body = json.dumps({"from": FROM, "to": TO, "count": len(rows), "rows": rows}).encode()
+
+    async def chunks():
+        for i in range(0, len(body), 4096):
+            yield body[i:i + 4096]
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=chunks()))
+    monkeypatch.setattr(core_client, "_client", httpx.AsyncClient(base_url="http://core", transport=transport))
+    monkeypatch.setattr(main, "ANALYTICS_STREAMING", True)
+    monkeypatch.setattr(wire_format, "CORE_FORMAT", "rows")
+    monkeypatch.setattr(columnar, "COLUMNAR_MIN_ROWS", 1000)
+
+    columnar_rows: List[int] = []
+    accumulate = columnar.accumulate_columns
+
+    def spy(cols, days) -> None:
+        columnar_rows.append(len(cols))
+        accumulate(cols, days)
+
+    monkeypatch.setattr(columnar, "accumulate_columns", spy)
+
+    days = asyncio.run(main._fetch_range_partials(FROM, TO))
+    acc = SummaryAccumulator()
+    acc.days = days
+    assert acc.result(FROM, TO) == baseline_summary(FROM, TO, rows)
+    assert columnar_rows and all(n >= 1000 for n in columnar_rows)
+    assert sum(columnar_rows) > len(rows) - 1000
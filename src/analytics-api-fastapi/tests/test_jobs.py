@@ -0,0 +1,50 @@
+# test_jobs.py
+"""
+Cola de trabajos en segundo plano: al parar el servicio, los trabajos que quedaban en
+este proceso (en curso o en cola) no pueden quedarse como activos en Mongo.
+"""
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import jobs
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock_motor.AsyncMongoMockClient()["analytics_test"]
+    monkeypatch.setattr(jobs, "get_db", lambda: database)
+    monkeypatch.setattr(jobs, "JOB_WORKERS", 1)
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0)
+    monkeypatch.setattr(jobs, "_queue", None)
+    monkeypatch.setattr(jobs, "_workers", [])
+    monkeypatch.setattr(jobs, "_active_by_key", {})
+    monkeypatch.setattr(jobs, "_active_by_id", {})
+    return database
+
+
+def test_stop_workers_fails_running_and_queued_jobs(db, monkeypatch):
+    started = asyncio.Event()
+
+    async def slow(params, progress):
+        started.set()
+        await asyncio.sleep(3600)
+
+    monkeypatch.setitem(jobs._handlers, "slow", slow)
+
+    async def scenario():
+        await jobs.start_workers()
+        running, _ = await jobs.submit("slow", "slow:1", {})
+        queued, _ = await jobs.submit("slow", "slow:2", {})
+        await started.wait()
+        await jobs.stop_workers()
+        coll = db[jobs.JOBS_COLLECTION]
+        return [await coll.find_one({"_id": ObjectId(i)}) for i in (running, queued)]
+
+    docs = asyncio.run(scenario())
+    assert [d["status"] for d in docs] == [jobs.FAILED, jobs.FAILED]
+    assert all(d["finished_at"] is not None for d in docs)
+    assert jobs._active_by_id == {} and jobs._active_by_key == {}
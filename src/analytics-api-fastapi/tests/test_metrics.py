@@ -0,0 +1,43 @@
+# test_metrics.py
+"""
+Histograma de etapas: cada etapa se etiqueta con la plantilla de la ruta que la midió
+(no la URL), y las medidas fuera de una petición van al endpoint 'background'.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+
+pytestmark = pytest.mark.skipif(not metrics.METRICS_ENABLED, reason="métricas desactivadas")
+
+
+@pytest.fixture
+def stage_series(monkeypatch):
+    histogram = metrics.Histogram("analytics_stage_seconds", "test", ("endpoint", "stage"))
+    monkeypatch.setattr(metrics, "STAGE_SECONDS", histogram)
+    return histogram.series
+
+
+def test_stages_are_labelled_with_route_template(stage_series):
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        with metrics.stage("decode"):
+            return {"id": item_id}
+
+    with TestClient(app) as client:
+        assert client.get("/items/1").status_code == 200
+        assert client.get("/items/2").status_code == 200
+
+    (counts, _), = stage_series.values()
+    assert list(stage_series) == [("/items/{item_id}", "decode")]
+    assert sum(counts) == 2
+
+
+def test_stages_outside_a_request_are_background(stage_series):
+    with metrics.stage("merge"):
+        pass
+    assert list(stage_series) == [(metrics.BACKGROUND_ENDPOINT, "merge")]
@@ -0,0 +1,113 @@
+# test_timeseries_index.py
+"""
+Índice acumulado de tendencias y récords: las respuestas no pueden depender de qué
+rangos se pidieron antes (origen del índice) ni quedarse por detrás de los días
+corregidos después de indexarse.
+"""
+import asyncio
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+import pytest
+
+import timeseries_index
+from aggregation import SummaryAccumulator
+
+
+def _day(offset: int) -> str:
+    return (date.today() - timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+def _row(workout_id: int, day: str, weight: float, reps: int = 5) -> Dict[str, Any]:
+    return {
+        "workout_id": workout_id,
+        "workout_date": f"{day}T00:00:00.000Z",
+        "workout_item_id": 1,
+        "exercise_id": 1,
+        "exercise_name": "Press banca",
+        "set_id": workout_id * 10,
+        "set_index": 0,
+        "reps": reps,
+        "weight_kg": weight,
+    }
+
+
+class FakeCore:
+    """Sustituto de _range_partials: parciales por día de unas filas, y registro de peticiones."""
+
+    def __init__(self, rows: List[Dict[str, Any]]) -> None:
+        self.rows = rows
+        self.calls: List[tuple] = []
+
+    async def fetch(self, from_date: str, to_date: str):
+        self.calls.append((from_date, to_date))
+        acc = SummaryAccumulator()
+        acc.add_rows([r for r in self.rows if from_date <= r["workout_date"][:10] <= to_date])
+        return acc.days
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(timeseries_index, "_index", timeseries_index.TimeSeriesIndex())
+    monkeypatch.setattr(timeseries_index, "_refreshed_at", 0.0)
+    monkeypatch.setattr(timeseries_index, "_built_at", 0.0)
+    monkeypatch.setattr(timeseries_index, "_stale_days", set())
+
+
+def records(core: FakeCore, from_offset: int) -> List[Dict[str, Any]]:
+    from_date, to_date = _day(from_offset), _day(0)
+    index = asyncio.run(timeseries_index.get_index(from_date, core.fetch))
+    span = index.clamp(from_date, to_date)
+    return index.records(*span) if span is not None else []
+
+
+def _prs(items: List[Dict[str, Any]]) -> List[tuple]:
+    return [(pr["date"], pr["max_weight"]) for item in items for pr in item["personal_records"]]
+
+
+RECORD_ROWS = [_row(1, _day(60), 100.0), _row(2, _day(15), 80.0), _row(3, _day(10), 90.0)]
+
+
+@pytest.mark.parametrize("order", [(20, 90), (90, 20)])
+def test_records_do_not_depend_on_index_origin(order):
+    core = FakeCore(RECORD_ROWS)
+    results = {offset: records(core, offset) for offset in order}
+
+    # 80 y 90 no superan los 100 kg de hace 60 días, pida quien pida primero
+    assert _prs(results[20]) == []
+    assert results[20][0]["max_weight"] == {"value": 90.0, "date": _day(10)}
+    assert _prs(results[90]) == [(_day(60), 100.0)]
+
+
+def test_widening_back_keeps_records_without_refetching_history():
+    core = FakeCore(RECORD_ROWS)
+    records(core, 20)
+    calls = len(core.calls)
+    assert _prs(records(core, 90)) == [(_day(60), 100.0)]
+    # Solo se pide el hueco nuevo
+    assert core.calls[calls:] == [(_day(90), _day(21))]
+
+
+def test_late_workout_is_picked_up_after_rebuild_interval(monkeypatch):
+    core = FakeCore([_row(1, _day(5), 80.0)])
+    index = asyncio.run(timeseries_index.get_index(_day(30), core.fetch))
+    assert index.totals(*index.clamp(_day(30), _day(0)))["workouts"] == 1
+
+    core.rows.append(_row(2, _day(5), 90.0))
+    monkeypatch.setattr(timeseries_index, "INDEX_REBUILD_SECONDS", 0.0)
+    index = asyncio.run(timeseries_index.get_index(_day(30), core.fetch))
+    assert index.totals(*index.clamp(_day(30), _day(0)))["workouts"] == 2
+
+
+def test_observed_changes_refresh_indexed_days():
+    core = FakeCore([_row(1, _day(5), 80.0)])
+    asyncio.run(timeseries_index.get_index(_day(30), core.fetch))
+
+    core.rows.append(_row(2, _day(5), 90.0))
+    # Un resumen obtiene los parciales nuevos del día corregido
+    timeseries_index.observe(asyncio.run(core.fetch(_day(7), _day(3))))
+    assert timeseries_index.pending(_day(30)) == (_day(5), _day(0))
+
+    index = asyncio.run(timeseries_index.get_index(_day(30), core.fetch))
+    assert index.totals(*index.clamp(_day(30), _day(0)))["workouts"] == 2
+    assert timeseries_index.pending(_day(30)) is None
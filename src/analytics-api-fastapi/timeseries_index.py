@@ -0,0 +1,469 @@
+# timeseries_index.py
+import asyncio
+import bisect
+import os
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+import daily_store
+import sharding
+from aggregation import DayPartial
+
+# =========================================================
+# Config
+# =========================================================
+# Cada cuánto se refresca la cola del índice (días 'vivos') como mucho
+INDEX_REFRESH_SECONDS = float(os.getenv("ANALYTICS_INDEX_REFRESH_SECONDS", "60"))
+# Cada cuánto se vuelve a derivar el índice entero (por defecto, lo que dura un parcial
+# guardado): así recoge los días corregidos después de cerrarse, como los resúmenes
+INDEX_REBUILD_SECONDS = float(
+    os.getenv("ANALYTICS_INDEX_REBUILD_SECONDS", str(daily_store.DAILY_STORE_TTL_SECONDS))
+)
+
+BUCKETS = ("day", "week", "month")
+
+FetchPartials = Callable[[str, str], Awaitable[Dict[str, DayPartial]]]
+
+
+def _parse(d: str) -> date:
+    return datetime.strptime(d, "%Y-%m-%d").date()
+
+
+def _ymd(d: date) -> str:
+    return d.strftime("%Y-%m-%d")
+
+
+def _bucket_start(d: date, unit: str) -> date:
+    if unit == "week":
+        return d - timedelta(days=d.weekday())
+    if unit == "month":
+        return d.replace(day=1)
+    return d
+
+
+def _next_bucket(start: date, unit: str) -> date:
+    if unit == "week":
+        return start + timedelta(days=7)
+    if unit == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+
+# Por ejercicio, (día, peso máximo, mejor serie) cada vez que el máximo acumulado sube
+Progression = Dict[str, List[Tuple[str, float, float]]]
+
+
+def _progression(partials: Mapping[str, DayPartial]) -> Progression:
+    out: Progression = {}
+    for day in sorted(d for d in partials if d):
+        for name, (_, _, weight, best) in partials[day].ex_stats.items():
+            steps = out.setdefault(name, [])
+            top_weight, top_best = (steps[-1][1], steps[-1][2]) if steps else (0.0, 0.0)
+            if weight > top_weight or best > top_best:
+                steps.append((day, max(weight, top_weight), max(best, top_best)))
+    return out
+
+
+def _same(a: DayPartial, b: DayPartial) -> bool:
+    """Mismos datos en lo que usa el índice (totales y estadísticas por ejercicio)."""
+    return (
+        a.sets == b.sets
+        and a.reps == b.reps
+        and a.workouts == b.workouts
+        and abs(a.volume - b.volume) < 1e-6
+        and a.ex_stats == b.ex_stats
+        and a.by_exercise.keys() == b.by_exercise.keys()
+        and all(abs(v - b.by_exercise[k]) < 1e-6 for k, v in a.by_exercise.items())
+    )
+
+
+class _SparseMax:
+    """Tabla dispersa (argmax) sobre un array fijo: máximo de cualquier intervalo en O(1)."""
+
+    __slots__ = ("values", "levels")
+
+    def __init__(self, values: array) -> None:
+        self.values = values
+        n = len(values)
+        level = array("l", range(n))
+        self.levels = [level]
+        width = 1
+        while width * 2 <= n:
+            prev = level
+            level = array("l", (
+                prev[i] if values[prev[i]] >= values[prev[i + width]] else prev[i + width]
+                for i in range(n - width * 2 + 1)
+            ))
+            self.levels.append(level)
+            width *= 2
+
+    def argmax(self, lo: int, hi: int) -> int:
+        """Índice del máximo en [lo, hi] (el primero si hay empate)."""
+        k = (hi - lo + 1).bit_length() - 1
+        a = self.levels[k][lo]
+        b = self.levels[k][hi - (1 << k) + 1]
+        return a if self.values[a] >= self.values[b] else b
+
+
+class _ExerciseSeries:
+    """
+    Serie densa de un ejercicio desde su primer día con datos:
+    sumas prefijas (series, reps, volumen), máximos diarios y récords (máximo acumulado).
+    `base` es lo mejor del historial anterior al origen del índice: un récord tiene que superarlo.
+    """
+
+    __slots__ = ("start", "base", "cum_sets", "cum_reps", "cum_volume", "max_weight", "best_set", "prs", "_sparse")
+
+    def __init__(self, start: int, base: Tuple[float, float] = (0.0, 0.0)) -> None:
+        self.start = start
+        self.base = base
+        self.cum_sets = array("q", [0])
+        self.cum_reps = array("q", [0])
+        self.cum_volume = array("d", [0.0])
+        self.max_weight = array("d")
+        self.best_set = array("d")
+        # Récords: (índice de día, peso máximo, mejor serie) cuando alguno supera lo anterior
+        self.prs: List[Tuple[int, float, float]] = []
+        self._sparse: Dict[str, _SparseMax] = {}
+
+    def append(self, day_index: int, stats: Optional[List[float]], volume: float) -> None:
+        sets, reps, weight, best = stats if stats is not None else (0, 0, 0.0, 0.0)
+        self.cum_sets.append(self.cum_sets[-1] + int(sets))
+        self.cum_reps.append(self.cum_reps[-1] + int(reps))
+        self.cum_volume.append(self.cum_volume[-1] + volume)
+        self.max_weight.append(weight)
+        self.best_set.append(best)
+        if stats is not None:
+            top_weight, top_best = (self.prs[-1][1], self.prs[-1][2]) if self.prs else self.base
+            if weight > top_weight or best > top_best:
+                self.prs.append((day_index, max(weight, top_weight), max(best, top_best)))
+        self._sparse.clear()
+
+    def truncate(self, day_index: int) -> None:
+        k = max(day_index - self.start, 0)
+        del self.cum_sets[k + 1:]
+        del self.cum_reps[k + 1:]
+        del self.cum_volume[k + 1:]
+        del self.max_weight[k:]
+        del self.best_set[k:]
+        del self.prs[bisect.bisect_left(self.prs, (day_index,)):]
+        self._sparse.clear()
+
+    def totals(self, lo: int, hi: int) -> Tuple[int, int, float]:
+        a, b = lo - self.start, hi - self.start + 1
+        return (
+            self.cum_sets[b] - self.cum_sets[a],
+            self.cum_reps[b] - self.cum_reps[a],
+            self.cum_volume[b] - self.cum_volume[a],
+        )
+
+    def range_max(self, field: str, lo: int, hi: int) -> Tuple[float, int]:
+        """(valor máximo, índice de día) de max_weight / best_set en [lo, hi]."""
+        sparse = self._sparse.get(field)
+        if sparse is None:
+            sparse = self._sparse[field] = _SparseMax(getattr(self, field))
+        i = sparse.argmax(lo - self.start, hi - self.start)
+        return sparse.values[i], i + self.start
+
+
+class TimeSeriesIndex:
+    """
+    Índice acumulado del historial, un día por posición desde `origin`:
+    sumas prefijas globales (entrenos, series, reps, volumen) y por ejercicio.
+    Cualquier total de un rango es una resta de dos prefijos (O(1)) y los máximos de un
+    rango salen de tablas dispersas (O(1)). Se actualiza de forma incremental: al cambiar
+    un día se recalcula solo desde ese día hasta el final.
+    Del historial anterior al origen solo se guarda la progresión de máximos por ejercicio,
+    para que los récords no dependan de dónde empieza el índice.
+    """
+
+    def __init__(self) -> None:
+        self.origin: Optional[date] = None
+        self.before: Progression = {}
+        self.cum_workouts = array("q", [0])
+        self.cum_sets = array("q", [0])
+        self.cum_reps = array("q", [0])
+        self.cum_volume = array("d", [0.0])
+        self.exercises: Dict[str, _ExerciseSeries] = {}
+        self._daily: Dict[int, DayPartial] = {}
+
+    def __len__(self) -> int:
+        return len(self.cum_sets) - 1
+
+    @property
+    def end(self) -> Optional[date]:
+        if self.origin is None or not len(self):
+            return None
+        return self.origin + timedelta(days=len(self) - 1)
+
+    def day_index(self, day: str) -> int:
+        return (_parse(day) - self.origin).days
+
+    def day_at(self, index: int) -> str:
+        return _ymd(self.origin + timedelta(days=index))
+
+    def same_day(self, day: str, p: DayPartial) -> bool:
+        """El día indexado tiene los mismos datos que `p`."""
+        return _same(self._daily.get(self.day_index(day)) or DayPartial(), p)
+
+    # ---------- construcción / actualización ----------
+    def build(
+        self, origin: str, end: str, partials: Mapping[str, DayPartial],
+        history: Optional[Mapping[str, DayPartial]] = None,
+    ) -> None:
+        """Indexa [origin, end]; `history` son los parciales anteriores a origin (si no, se conservan los de antes)."""
+        before = self.before if history is None else _progression(history)
+        self.__init__()
+        self.before = before
+        self.origin = _parse(origin)
+        self.update(origin, end, partials)
+
+    def _base(self, name: str) -> Tuple[float, float]:
+        """Lo mejor del ejercicio antes del origen (peso máximo, mejor serie)."""
+        steps = self.before.get(name)
+        if not steps:
+            return 0.0, 0.0
+        i = bisect.bisect_left(steps, (_ymd(self.origin),))
+        return (steps[i - 1][1], steps[i - 1][2]) if i else (0.0, 0.0)
+
+    def extend_back(self, origin: str, partials: Mapping[str, DayPartial]) -> None:
+        """
+        Adelanta el origen a `origin` con los parciales de los días nuevos (anteriores al
+        origen actual); los días ya indexados se conservan sin volver a pedirlos.
+        """
+        kept = {self.day_at(i): p for i, p in self._daily.items()}
+        end = _ymd(self.end)
+        self.build(origin, end, {**partials, **kept})
+
+    def update(self, from_day: str, to_day: str, partials: Mapping[str, DayPartial]) -> None:
+        """
+        Sustituye los días [from_day, to_day] por `partials` (los que falten quedan vacíos)
+        y recalcula los prefijos desde from_day. Los días posteriores a to_day se conservan.
+        """
+        lo = max(self.day_index(from_day), 0)
+        hi = self.day_index(to_day)
+        for i in range(lo, hi + 1):
+            self._daily.pop(i, None)
+        for day, p in partials.items():
+            if day and from_day <= day <= to_day:
+                self._daily[self.day_index(day)] = p
+
+        last = max(hi, len(self) - 1)
+        self._truncate(lo)
+        for i in range(lo, last + 1):
+            self._append(i, self._daily.get(i))
+
+    def _truncate(self, index: int) -> None:
+        index = min(index, len(self))
+        for arr in (self.cum_workouts, self.cum_sets, self.cum_reps, self.cum_volume):
+            del arr[index + 1:]
+        for name in [n for n, s in self.exercises.items() if s.start >= index]:
+            del self.exercises[name]
+        for series in self.exercises.values():
+            series.truncate(index)
+
+    def _append(self, index: int, p: Optional[DayPartial]) -> None:
+        if p is None:
+            p = DayPartial()
+        self.cum_workouts.append(self.cum_workouts[-1] + len(p.workouts))
+        self.cum_sets.append(self.cum_sets[-1] + p.sets)
+        self.cum_reps.append(self.cum_reps[-1] + p.reps)
+        self.cum_volume.append(self.cum_volume[-1] + p.volume)
+
+        for name in p.ex_stats:
+            if name not in self.exercises:
+                self.exercises[name] = _ExerciseSeries(index, self._base(name))
+        for name, series in self.exercises.items():
+            series.append(index, p.ex_stats.get(name), p.by_exercise.get(name, 0.0))
+
+    # ---------- consultas ----------
+    def clamp(self, from_day: str, to_day: str) -> Optional[Tuple[int, int]]:
+        """Rango de índices cubierto por el índice, o None si no hay intersección."""
+        lo = max(self.day_index(from_day), 0)
+        hi = min(self.day_index(to_day), len(self) - 1)
+        return (lo, hi) if lo <= hi else None
+
+    def totals(self, lo: int, hi: int) -> Dict[str, Any]:
+        b = hi + 1
+        return {
+            "workouts": self.cum_workouts[b] - self.cum_workouts[lo],
+            "sets": self.cum_sets[b] - self.cum_sets[lo],
+            "reps": self.cum_reps[b] - self.cum_reps[lo],
+            "volume": round(self.cum_volume[b] - self.cum_volume[lo], 2),
+        }
+
+    def _bucket_bounds(self, lo: int, hi: int, unit: str) -> Iterable[Tuple[int, int, str, str]]:
+        start = _bucket_start(self.origin + timedelta(days=lo), unit)
+        while True:
+            nxt = _next_bucket(start, unit)
+            a = max((start - self.origin).days, lo)
+            b = min((nxt - self.origin).days - 1, hi)
+            if a > hi:
+                return
+            yield a, b, _ymd(start), _ymd(nxt - timedelta(days=1))
+            start = nxt
+
+    def buckets(self, lo: int, hi: int, unit: str) -> List[Dict[str, Any]]:
+        return [
+            {"start": s, "end": e, **self.totals(a, b)}
+            for a, b, s, e in self._bucket_bounds(lo, hi, unit)
+        ]
+
+    def exercise_buckets(self, name: str, lo: int, hi: int, unit: str) -> List[Dict[str, Any]]:
+        series = self.exercises.get(name)
+        if series is None or hi < series.start:
+            return []
+        lo = max(lo, series.start)
+        items = []
+        for a, b, s, e in self._bucket_bounds(lo, hi, unit):
+            sets, reps, volume = series.totals(a, b)
+            if not sets:
+                continue
+            max_weight, _ = series.range_max("max_weight", a, b)
+            best_set, _ = series.range_max("best_set", a, b)
+            items.append({
+                "start": s,
+                "end": e,
+                "sets": sets,
+                "reps": reps,
+                "volume": round(volume, 2),
+                "max_weight": round(max_weight, 2),
+                "best_set_volume": round(best_set, 2),
+            })
+        return items
+
+    def records(self, lo: int, hi: int, names: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Mejores marcas de cada ejercicio dentro del rango y récords personales logrados en él."""
+        out = []
+        for name in sorted(names if names is not None else self.exercises):
+            series = self.exercises.get(name)
+            if series is None or hi < series.start:
+                continue
+            a = max(lo, series.start)
+            if not series.totals(a, hi)[0]:
+                continue
+            max_weight, w_day = series.range_max("max_weight", a, hi)
+            best_set, b_day = series.range_max("best_set", a, hi)
+            first = bisect.bisect_left(series.prs, (a,))
+            last = bisect.bisect_right(series.prs, (hi, float("inf"), float("inf")))
+            out.append({
+                "exercise": name,
+                "max_weight": {"value": round(max_weight, 2), "date": self.day_at(w_day)},
+                "best_set_volume": {"value": round(best_set, 2), "date": self.day_at(b_day)},
+                "personal_records": [
+                    {"date": self.day_at(i), "max_weight": round(w, 2), "best_set_volume": round(b, 2)}
+                    for i, w, b in series.prs[first:last]
+                ],
+            })
+        return out
+
+
+# =========================================================
+# Índice compartido del proceso
+# =========================================================
+_index = TimeSeriesIndex()
+_lock = asyncio.Lock()
+_refreshed_at = 0.0
+_built_at = 0.0
+_stale_days: Set[str] = set()
+
+
+def mark_stale(days: Iterable[str]) -> None:
+    """Días modificados (p.ej. invalidados en el almacén diario): se recalculan en el próximo uso."""
+    _stale_days.update(days)
+
+
+def observe(partials: Mapping[str, DayPartial]) -> None:
+    """
+    Parciales recién obtenidos por otra consulta (p.ej. un resumen): los días indexados
+    que ya no coinciden se marcan para recalcularlos, así el índice no se queda por
+    detrás del almacén diario.
+    """
+    if _index.origin is None:
+        return
+    origin, end = _ymd(_index.origin), _ymd(_index.end)
+    _stale_days.update(
+        day for day, p in partials.items() if day and origin <= day <= end and not _index.same_day(day, p)
+    )
+
+
+def _wanted_origin(from_date: str) -> date:
+    # El índice nunca empieza después de hoy (ni llega más allá: los días futuros no tienen
+    # datos) ni antes de la primera fecha que se pide al Core API
+    return max(min(_parse(from_date), date.today()), _parse(sharding.EARLIEST_DATE))
+
+
+def _rebuild_due() -> bool:
+    """Hay que derivar el índice entero: no existe, lleva INDEX_REBUILD_SECONDS o cambió el historial anterior."""
+    if _index.origin is None or time.monotonic() - _built_at >= INDEX_REBUILD_SECONDS:
+        return True
+    origin = _ymd(_index.origin)
+    return any(d < origin for d in _stale_days)
+
+
+def _tail_from() -> Optional[str]:
+    """Primer día de la cola a refrescar (días 'vivos', nuevos o modificados), o None si está al día."""
+    today = _ymd(date.today())
+    stale = [d for d in _stale_days if _ymd(_index.origin) <= d <= today]
+    expired = time.monotonic() - _refreshed_at >= INDEX_REFRESH_SECONDS or _ymd(_index.end) < today
+    if not (stale or expired):
+        return None
+    return max(min([daily_store._fresh_cutoff(), _ymd(_index.end), *stale]), _ymd(_index.origin))
+
+
+def pending(from_date: str) -> Optional[Tuple[str, str]]:
+    """
+    Tramo de días que get_index tendría que pedir para cubrir desde from_date (derivarlo
+    entero, ampliarlo hacia atrás o refrescar la cola), o None si el índice ya sirve tal cual.
+    Sirve para pasar por el control de admisión solo cuando hay trabajo.
+    """
+    today = _ymd(date.today())
+    origin = _wanted_origin(from_date)
+    if _rebuild_due():
+        return sharding.EARLIEST_DATE, today
+    if _index.origin > origin:
+        return _ymd(origin), today
+    tail = _tail_from()
+    return (tail, today) if tail is not None else None
+
+
+async def get_index(from_date: str, fetch: FetchPartials) -> TimeSeriesIndex:
+    """
+    Devuelve el índice cubriendo [from_date, hoy]. Se deriva entero la primera vez y cada
+    INDEX_REBUILD_SECONDS (o si cambia un día anterior al origen): los días desde el origen
+    se indexan y los anteriores, desde ANALYTICS_EARLIEST_DATE, solo dejan su progresión de
+    máximos (récords). Un rango anterior al origen lo amplía pidiendo solo los días que
+    faltan, y el resto del tiempo se refresca la cola. Nunca incluye días posteriores a hoy.
+    """
+    global _refreshed_at, _built_at
+    async with _lock:
+        today = _ymd(date.today())
+        origin = _wanted_origin(from_date)
+
+        if _rebuild_due():
+            if _index.origin is not None:
+                origin = min(origin, _index.origin)
+            start = _ymd(origin)
+            # Una sola consulta (troceada) para historial e índice
+            partials = await fetch(sharding.EARLIEST_DATE, today)
+            history = {d: p for d, p in partials.items() if d < start}
+            _index.build(start, today, partials, history)
+            _stale_days.clear()
+            _refreshed_at = _built_at = time.monotonic()
+            return _index
+
+        if _index.origin > origin:
+            gap_to = _ymd(_index.origin - timedelta(days=1))
+            _index.extend_back(_ymd(origin), await fetch(_ymd(origin), gap_to))
+
+        refresh_from = _tail_from()
+        if refresh_from is not None:
+            partials = await fetch(refresh_from, today)
+            _index.update(refresh_from, today, partials)
+            # Las marcas de días anteriores (llegadas mientras se pedía la cola) se conservan
+            _stale_days.difference_update([d for d in _stale_days if d >= refresh_from])
+            _refreshed_at = time.monotonic()
+
+        return _index
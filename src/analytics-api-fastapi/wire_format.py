@@ -0,0 +1,170 @@
+# wire_format.py
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import aggregation_columnar as columnar
+from aggregation import SummaryAccumulator
+
+# =========================================================
+# Config
+# =========================================================
+# Formato pedido a GET /analytics/workouts: "rows" (array de objetos) o "columnar"
+# (columnas + diccionarios, gzip). Un Core API que no conoce 'format' responde filas y
+# se procesan igual, así que el formato clásico queda siempre como respaldo.
+# Por defecto filas: se agregan en streaming con memoria ~constante, mientras que el
+# columnar se decodifica entero (menos bytes en la red, pero el payload completo en memoria)
+CORE_FORMAT = os.getenv("ANALYTICS_CORE_FORMAT", "rows")
+
+COLUMNAR = "columnar"
+
+# Columnas del formato columnar (mismas claves que una fila). 'date' y 'name' son
+# índices sobre las tablas 'dates' y 'names' (-1 = nombre nulo)
+COLUMNS = (
+    "workout_id",
+    "date",
+    "workout_item_id",
+    "exercise_id",
+    "name",
+    "set_id",
+    "set_index",
+    "reps",
+    "weight_kg",
+)
+
+
+def columnar_requested() -> bool:
+    return CORE_FORMAT == COLUMNAR
+
+
+def request_params(from_date: str, to_date: str) -> Dict[str, str]:
+    params = {"from": from_date, "to": to_date}
+    if columnar_requested():
+        params["format"] = COLUMNAR
+    return params
+
+
+def is_columnar(payload: Dict[str, Any]) -> bool:
+    return payload.get("format") == COLUMNAR
+
+
+def _columns(payload: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """Columnas del payload, comprobando que todas existen y tienen la misma longitud."""
+    cols = payload.get("columns")
+    if not isinstance(cols, dict):
+        raise ValueError("payload columnar sin 'columns'")
+    n = len(cols.get("date") or [])
+    for name in COLUMNS:
+        values = cols.get(name)
+        if not isinstance(values, list) or len(values) != n:
+            raise ValueError(f"columna '{name}' ausente o con longitud distinta")
+    return cols
+
+
+def row_count(payload: Dict[str, Any]) -> int:
+    if is_columnar(payload):
+        return len(_columns(payload)["date"])
+    return len(payload.get("rows") or [])
+
+
+def to_rows(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Filas (dicts) equivalentes a las del formato clásico, para el motor por filas."""
+    if not is_columnar(payload):
+        return payload.get("rows", [])
+
+    cols = _columns(payload)
+    dates = payload.get("dates") or []
+    names = payload.get("names") or []
+    return [
+        {
+            "workout_id": w,
+            "workout_date": dates[d],
+            "workout_item_id": wi,
+            "exercise_id": e,
+            "exercise_name": names[nc] if nc >= 0 else None,
+            "set_id": s,
+            "set_index": si,
+            "reps": r,
+            "weight_kg": kg,
+        }
+        for w, d, wi, e, nc, s, si, r, kg in zip(*(cols[c] for c in COLUMNS))
+    ]
+
+
+def add_payload(acc: SummaryAccumulator, payload: Dict[str, Any]) -> int:
+    """
+    Agrega un payload de /analytics/workouts (columnar o filas) en `acc`; devuelve las filas.
+    Un payload columnar grande pasa directamente a las columnas de numpy, sin crear ningún dict.
+    """
+    if not is_columnar(payload):
+        rows = payload.get("rows", [])
+        acc.add_rows(rows)
+        return len(rows)
+
+    n = row_count(payload)
+    if columnar.enabled() and n >= columnar.COLUMNAR_MIN_ROWS:
+        cols = columnar.RowColumns.from_wire(payload)
+        if cols is not None:
+            columnar.accumulate_columns(cols, acc.days)
+            return n
+
+    acc.add_python(to_rows(payload))
+    return n
+
+
+def _number(value: Any) -> Optional[float]:
+    """Peso como número (el Core API convierte así los DECIMAL); None si no lo es."""
+    if value is None:
+        return None
+    try:
+        n = float(value)
+    except (TypeError, ValueError):
+        return None
+    return n if math.isfinite(n) else None
+
+
+def encode_columnar(from_date: str, to_date: str, rows: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Codifica filas en formato columnar (lo mismo que hace el Core API con format=columnar).
+    Lo usa el stub del Core API de bench/ para medir el formato sin el Core API real.
+    """
+    dates: List[Any] = []
+    date_index: Dict[Any, int] = {}
+    names: List[str] = []
+    name_index: Dict[str, int] = {}
+    cols: Dict[str, List[Any]] = {c: [] for c in COLUMNS}
+
+    for r in rows:
+        d = r.get("workout_date")
+        dc = date_index.get(d)
+        if dc is None:
+            dc = date_index[d] = len(dates)
+            dates.append(d)
+
+        name: Optional[str] = r.get("exercise_name")
+        nc = -1
+        if name is not None:
+            nc = name_index.get(name, -1)
+            if nc < 0:
+                nc = name_index[name] = len(names)
+                names.append(name)
+
+        cols["workout_id"].append(r.get("workout_id"))
+        cols["date"].append(dc)
+        cols["workout_item_id"].append(r.get("workout_item_id"))
+        cols["exercise_id"].append(r.get("exercise_id"))
+        cols["name"].append(nc)
+        cols["set_id"].append(r.get("set_id"))
+        cols["set_index"].append(r.get("set_index"))
+        cols["reps"].append(r.get("reps"))
+        cols["weight_kg"].append(_number(r.get("weight_kg")))
+
+    return {
+        "from": from_date,
+        "to": to_date,
+        "count": len(rows),
+        "format": COLUMNAR,
+        "dates": dates,
+        "names": names,
+        "columns": cols,
+    }
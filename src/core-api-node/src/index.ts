@@ -4,6 +4,8 @@ import mysql, { RowDataPacket, ResultSetHeader } from "mysql2/promise";
 import bcrypt from "bcryptjs";
 import jwt from "jsonwebtoken";
 import axios from "axios";
+import { gzip } from "zlib";
+import { promisify } from "util";
 
 const app = express();
 const PORT = 3000;
@@ -1451,11 +1453,88 @@ app.delete("/workouts/:id", async (req, res) => {
 // ===============================
 // ANALYTICS (solo lectura)
 // ===============================
-// GET /analytics/workouts?from=YYYY-MM-DD&to=YYYY-MM-DD
-// Devuelve filas "planas" de workouts + items + sets para agregación en el microservicio
+const gzipAsync = promisify(gzip);
+
+// Columnas del formato columnar de /analytics/workouts (mismas claves que una fila).
+// "date" y "name" son índices sobre las tablas "dates" y "names" (-1 = nombre nulo).
+type AnalyticsColumns = {
+  workout_id: Array<number | null>;
+  date: number[];
+  workout_item_id: Array<number | null>;
+  exercise_id: Array<number | null>;
+  name: number[];
+  set_id: Array<number | null>;
+  set_index: Array<number | null>;
+  reps: Array<number | null>;
+  weight_kg: Array<number | null>;
+};
+
+/**
+ * Convierte las filas planas a columnas: un array por campo y tablas de diccionario
+ * para fechas y nombres de ejercicio (que se repiten en casi todas las filas).
+ * Las fechas se serializan igual que en el formato de filas (toJSON) y los pesos
+ * DECIMAL pasan de string a número.
+ */
+function toAnalyticsColumns(rows: RowDataPacket[]) {
+  const dates: Array<string | null> = [];
+  const dateIndex = new Map<string | null, number>();
+  const names: string[] = [];
+  const nameIndex = new Map<string, number>();
+  const columns: AnalyticsColumns = {
+    workout_id: [],
+    date: [],
+    workout_item_id: [],
+    exercise_id: [],
+    name: [],
+    set_id: [],
+    set_index: [],
+    reps: [],
+    weight_kg: [],
+  };
+
+  for (const r of rows) {
+    const d = r.workout_date instanceof Date ? r.workout_date.toJSON() : r.workout_date ?? null;
+    let dc = dateIndex.get(d);
+    if (dc === undefined) {
+      dc = dates.length;
+      dates.push(d);
+      dateIndex.set(d, dc);
+    }
+
+    let nc = -1;
+    if (r.exercise_name != null) {
+      const found = nameIndex.get(r.exercise_name);
+      if (found === undefined) {
+        nc = names.length;
+        names.push(r.exercise_name);
+        nameIndex.set(r.exercise_name, nc);
+      } else {
+        nc = found;
+      }
+    }
+
+    columns.workout_id.push(r.workout_id ?? null);
+    columns.date.push(dc);
+    columns.workout_item_id.push(r.workout_item_id ?? null);
+    columns.exercise_id.push(r.exercise_id ?? null);
+    columns.name.push(nc);
+    columns.set_id.push(r.set_id ?? null);
+    columns.set_index.push(r.set_index ?? null);
+    columns.reps.push(r.reps ?? null);
+    columns.weight_kg.push(r.weight_kg == null ? null : Number(r.weight_kg));
+  }
+
+  return { dates, names, columns };
+}
+
+// GET /analytics/workouts?from=YYYY-MM-DD&to=YYYY-MM-DD[&format=columnar]
+// Devuelve filas "planas" de workouts + items + sets para agregación en el microservicio.
+// Con format=columnar devuelve columnas con diccionarios (mucho más compacto) y, si el
+// cliente acepta gzip, la respuesta va comprimida. Sin format, el formato clásico de filas.
 app.get("/analytics/workouts", async (req, res) => {
   const from = String(req.query.from ?? "").trim();
   const to = String(req.query.to ?? "").trim();
+  const format = String(req.query.format ?? "rows").trim();
 
   // validación básica
   if (!/^\d{4}-\d{2}-\d{2}$/.test(from) || !/^\d{4}-\d{2}-\d{2}$/.test(to)) {
@@ -1464,6 +1543,9 @@ app.get("/analytics/workouts", async (req, res) => {
       example: "/analytics/workouts?from=2026-01-01&to=2026-01-31",
     });
   }
+  if (format !== "rows" && format !== "columnar") {
+    return res.status(400).json({ message: "format debe ser rows o columnar" });
+  }
 
   try {
     const [rows] = await pool.query<RowDataPacket[]>(
@@ -1492,6 +1574,21 @@ app.get("/analytics/workouts", async (req, res) => {
       [from, to]
     );
 
+    res.set("X-Row-Count", String(rows.length));
+
+    if (format === "columnar") {
+      const body = Buffer.from(
+        JSON.stringify({ from, to, count: rows.length, format, ...toAnalyticsColumns(rows) })
+      );
+      res.set("Content-Type", "application/json; charset=utf-8");
+      res.vary("Accept-Encoding");
+      if (/\bgzip\b/.test(String(req.headers["accept-encoding"] ?? ""))) {
+        res.set("Content-Encoding", "gzip");
+        return res.send(await gzipAsync(body));
+      }
+      return res.send(body);
+    }
+
     return res.json({
       from,
       to,